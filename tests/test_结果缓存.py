@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from 结果缓存 import ResultCache  # noqa: E402
+
+
+class ResultCacheThreadTest(unittest.TestCase):
+    """界面把同一个 ResultCache 交给每个扫描线程，不同线程交替使用时不能报错"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = ResultCache(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def run_in_thread(self, function):
+        errors = []
+
+        def run():
+            try:
+                function()
+            except Exception as e:
+                errors.append(e)
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        self.assertEqual(errors, [])
+
+    def test_main_thread_after_worker(self):
+        self.run_in_thread(lambda: self.cache.put('key', [['123', 'CODE128']]))
+        self.assertEqual(self.cache.get('key'), [['123', 'CODE128']])
+
+    def test_overlapping_threads(self):
+        barrier = threading.Barrier(2)
+        errors = []
+
+        def scan(index):
+            try:
+                barrier.wait()
+                for round_index in range(20):
+                    key = f"key-{index}-{round_index}"
+                    self.cache.put(key, [index, round_index])
+                    self.assertEqual(self.cache.get(key), [index, round_index])
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=scan, args=(index,)) for index in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.cache.stats()['entries'], 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,68 +1,75 @@
-from PIL import Image, ImageEnhance
-from pyzbar.pyzbar import decode
+from PIL import Image
+from 扫描引擎 import (make_tile_source, split_tiles, scan_tiles, scan_tiles_escalating, localize_tiles,
+                  ResultAggregator, to_original_position)
+from 阶段计时 import stage, timed_scan  # 各阶段计时（BARCODE_TIMING=1 开启）
 
-def preprocess_image(image, scale_factor):
-    """对图像进行预处理以提高识别率"""
-    grayscale_image = image.convert('L')
-    enhancer = ImageEnhance.Contrast(grayscale_image)
-    enhanced_image = enhancer.enhance(2.0)
-    new_size = (int(enhanced_image.width * scale_factor), int(enhanced_image.height * scale_factor))
-    enlarged_image = enhanced_image.resize(new_size, Image.LANCZOS)
-    return enlarged_image
+def print_result(count, barcode_type, barcode_data, position, scale_factor):
+    # 输出单个条码的信息
+    print(f"Barcode/Qrcode #{count}:")
+    print(f"Type: {barcode_type}")
+    print(f"Data: {barcode_data}")
+    print(f"Position: Left={position['left']}, Top={position['top']}, Width={position['width']}, Height={position['height']}")
+    print(f"Scale: {scale_factor}")
+    print('-' * 30)
 
-def crop_image(image, left, top, right, bottom):
-    """裁剪图像并返回裁剪后的图像块"""
-    box = (left, top, right, bottom)
-    return image.crop(box)
-
-def extract_barcodes_and_qrcodes(image_path, horizontal_chunks=8, vertical_steps=8, scale_factors=(2.0, 4.0)):
+@timed_scan('extract_barcodes_and_qrcodes')
+def extract_barcodes_and_qrcodes(image_path, horizontal_chunks=8, vertical_steps=8, scale_factors=(2.0, 4.0), roi_margin=None, workers=1, localize=False, escalate=False, cache=None):
+    # roi_margin 为整数时只预处理区块及其保护边距，否则整图构建金字塔
+    # workers 大于1时用多进程并行解码区块，结果顺序与串行一致
+    # localize 为True时先定位候选区域，跳过不含条码的区块
+    # escalate 为True时按缩放因子从小到大逐级尝试，区块内的候选区域都解出后不再放大；会同时开启 localize
+    # cache 为 ResultCache 时，同一图像内容和扫描参数再次处理直接输出上次的结果
+    # 返回去重后的结果列表
+    localize = localize or escalate  # 自适应缩放依据候选区域判断区块是否已解决
+    if cache is not None:
+        cache_key = cache.make_key('切割成块滑动识别', image_path, {
+            'horizontal_chunks': horizontal_chunks, 'vertical_steps': vertical_steps,
+            'scale_factors': [float(s) for s in scale_factors], 'roi_margin': roi_margin,
+            'localize': localize, 'escalate': escalate})
+        with stage('cache'):
+            cached_results = cache.get(cache_key)
+        if cached_results is not None:
+            print(f"Cache hit: {len(cached_results)} code(s)")
+            for count, r in enumerate(cached_results, start=1):
+                print_result(count, r['type'], r['data'], r['position'], r['scale_factor'])
+            return cached_results
     # 打开原始图像
-    original_image = Image.open(image_path)
+    with stage('load'):
+        original_image = Image.open(image_path)
+        original_image.load()
+    tile_source = make_tile_source(original_image, roi_margin)  # 金字塔或区块级预处理
     width, height = original_image.size
     count = 0
-    detected_results = []
+    aggregator = ResultAggregator()  # 网格空间索引去重
     chunk_width = width // horizontal_chunks
     step_height = height // vertical_steps
     print(f"Chunk width: {chunk_width}, Step height: {step_height}")
 
-    # 逐行提取条形码
-    for top in range(0, height, step_height):
-        for i in range(horizontal_chunks):
-            left = i * chunk_width
-            right = left + chunk_width if (i < horizontal_chunks - 1) else width
-            bottom = top + step_height if (top + step_height < height) else height
-
-            # 在每个垂直位置，测试不同的放大倍数
-            for scale_factor in scale_factors:
-                # 每个缩放比例重新预处理
-                preprocessed_image = preprocess_image(original_image, scale_factor)
-                pre_left = int(left * scale_factor)
-                pre_top = int(top * scale_factor)
-                pre_right = int(right * scale_factor)
-                pre_bottom = int(bottom * scale_factor)
-
-                chunk = crop_image(preprocessed_image, pre_left, pre_top, pre_right, pre_bottom)
-                decoded_objects = decode(chunk)
-
-                for obj in decoded_objects:
-                    barcode_data = obj.data.decode("utf-8")
-                    unique_barcode = (barcode_data, (pre_left + obj.rect.left, pre_top + obj.rect.top))
-                    if unique_barcode not in detected_results:
-                        count += 1
-                        barcode_type = obj.type
-                        rect = obj.rect
-                        position = {
-                            'left': pre_left + rect.left,
-                            'top': pre_top + rect.top,
-                            'width': rect.width,
-                            'height': rect.height
-                        }
-                        detected_results.append(unique_barcode)
-                        print(f"Barcode/Qrcode #{count}:")
-                        print(f"Type: {barcode_type}")
-                        print(f"Data: {barcode_data}")
-                        print(f"Position: Left={position['left']}, Top={position['top']}, Width={position['width']}, Height={position['height']}")
-                        print('-' * 30)
+    # 逐行逐块提取条形码，在每个区块测试不同的放大倍数
+    tiles = split_tiles(width, height, horizontal_chunks, vertical_steps)
+    candidates = None
+    if localize:
+        tiles, candidates = localize_tiles(original_image, tiles)
+    if escalate:
+        tile_results = scan_tiles_escalating(tile_source, tiles, scale_factors, candidates, workers)
+    else:
+        tile_results = scan_tiles(tile_source, tiles, scale_factors, workers)
+    for box, scale_factor, pre_left, pre_top, decoded_objects in tile_results:
+        for obj in decoded_objects:
+            barcode_data = obj.data.decode("utf-8")
+            position = to_original_position(obj.rect, pre_left, pre_top, scale_factor)  # 映射回原图坐标
+            # 按数据和原图坐标下的重叠度去重，跨区块、跨缩放因子的重复结果只保留一次
+            with stage('dedup'):
+                _, is_new = aggregator.add(obj.type, barcode_data, position, scale_factor)
+            if is_new:
+                count += 1
+                print_result(count, obj.type, barcode_data, position, scale_factor)
+    tile_source.release()
+    if cache is not None:
+        with stage('cache'):
+            cache.put(cache_key, aggregator.results)
+    return aggregator.results
 
 # 使用示例
-extract_barcodes_and_qrcodes('l.jpg', horizontal_chunks=5, vertical_steps=8, scale_factors=(2.0, 4.0))
+if __name__ == '__main__':
+    extract_barcodes_and_qrcodes('l.jpg', horizontal_chunks=5, vertical_steps=8, scale_factors=(2.0, 4.0))
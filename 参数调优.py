@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+扫描参数自动调优：在一组已知结果的样例图像上用逐次减半（successive halving）搜索参数，
+输出延迟与召回率的帕累托前沿，并把选中的参数保存为界面和脚本都能加载的配置文件。
+
+示例：
+    python 参数调优.py samples/ --target scanner --budget 1.5
+    python 参数调优.py bench_corpus/ --target slice --samples 36 --report tune_report.json
+"""
+import argparse
+import contextlib
+import importlib
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+DEFAULT_PROFILE_PATH = os.path.join(os.path.expanduser('~'), '.config', 'barcode_extraction', 'scan_profile.json')
+
+# 每个调优目标的搜索空间和界面默认值
+SEARCH_SPACES = {
+    # 通用条形码提取工具.py 的 BarcodeScannerUI
+    'scanner': {
+        'horizontal_chunks': [2, 4, 6, 8, 10, 12, 16],
+        'vertical_steps': [2, 3, 5, 8, 12],
+        'scale_factor_1': [1.0, 1.5, 2.0, 2.5, 3.0],
+        'scale_factor_2': [2.0, 3.0, 4.0, 5.0],
+        'localize': [False, True],
+        'escalate': [False, True],
+    },
+    # 纯横向移动识别(GUI).py 的切片参数
+    'slice': {
+        'alpha': [1.0, 1.5, 2.0, 2.5, 3.0],
+        'beta': [0, 25, 50, 75],
+        'scale_factor': [1.0, 1.5, 2.0, 2.5, 3.0],
+        'slice_width': [10, 20, 40, 80],
+        'overlap_percent': [0.0, 0.2, 0.4],
+        'backend': ['pyzbar', 'scanline'],
+    },
+}
+DEFAULT_PARAMS = {
+    'scanner': {'horizontal_chunks': 8, 'vertical_steps': 5, 'scale_factor_1': 2.0, 'scale_factor_2': 4.0,
+                'localize': False, 'escalate': False},
+    'slice': {'alpha': 1.5, 'beta': 50, 'scale_factor': 2.0, 'slice_width': 10, 'overlap_percent': 0.2,
+              'backend': 'pyzbar'},
+}
+
+# ---------------------------- 配置文件 ----------------------------
+def profile_path(path=None):
+    """配置文件路径：参数 > 环境变量 BARCODE_PROFILE > ~/.config/barcode_extraction/scan_profile.json"""
+    return path or os.environ.get('BARCODE_PROFILE') or DEFAULT_PROFILE_PATH
+
+def load_profile(target, path=None):
+    """读取某个调优目标保存的参数，没有配置文件或没有该目标时返回 None"""
+    try:
+        with open(profile_path(path), encoding='utf-8') as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return None
+    entry = profile.get(target)
+    return dict(entry['params']) if entry else None
+
+def save_profile(target, params, metrics, path=None):
+    """把选中的参数和对应的延迟、召回率写入配置文件，保留其它目标已有的配置"""
+    path = profile_path(path)
+    try:
+        with open(path, encoding='utf-8') as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        profile = {}
+    profile[target] = {'params': params, 'metrics': metrics, 'tuned_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, ensure_ascii=False, indent=2)
+    return path
+
+def scan_image_kwargs(params):
+    """把 scanner 目标的参数转换成 scan_image 的关键字参数"""
+    return {
+        'horizontal_chunks': params['horizontal_chunks'],
+        'vertical_steps': params['vertical_steps'],
+        'scale_factors': (params['scale_factor_1'], params['scale_factor_2']),
+        'localize': params['localize'],
+        'escalate': params['escalate'],
+    }
+
+# ---------------------------- 样例与评估 ----------------------------
+def load_samples(folder, expected_path=None):
+    """
+    读取样例图像和期望结果：支持基准测试生成的 manifest.json，或 {文件名: [数据, ...]} 形式的 JSON
+    :return: {图像路径: 期望数据集合}
+    """
+    expected_path = expected_path or os.path.join(folder, 'manifest.json')
+    with open(expected_path, encoding='utf-8') as f:
+        expected = json.load(f)
+    if 'images' in expected:
+        expected = {image['file']: [barcode['data'] for barcode in image['barcodes']] for image in expected['images']}
+    return {os.path.join(folder, name): set(values) for name, values in sorted(expected.items())}
+
+def make_runner(target):
+    """返回 run(图像路径, 参数) -> 识别出的数据列表；切片目标使用与界面相同的切片流程（不依赖Qt）"""
+    if target == 'scanner':
+        scan_image = importlib.import_module('扫描引擎').scan_image
+        return lambda path, params: [result['data'] for result in scan_image(path, **scan_image_kwargs(params))]
+    process_image = importlib.import_module('横向移动识别').process_image
+    return lambda path, params: [data for data, _ in process_image(
+        path, params['slice_width'], params['overlap_percent'], params['alpha'], params['beta'],
+        params['scale_factor'], backend=params['backend'])]
+
+def config_key(params):
+    return json.dumps(params, sort_keys=True)
+
+class Evaluator:
+    """逐张图像评估参数组合，结果按 (参数, 图像) 缓存，晋级到下一轮时只评估新增的图像"""
+
+    def __init__(self, target, samples):
+        self.run = make_runner(target)
+        self.samples = samples
+        self.records = {}  # 参数键 -> {图像路径: (延迟, 识别出的数据集合)}
+
+    def evaluate(self, params, image_paths):
+        records = self.records.setdefault(config_key(params), {})
+        with open(os.devnull, 'w') as devnull:
+            for path in image_paths:
+                if path in records:
+                    continue
+                start_time = time.perf_counter()
+                try:
+                    with contextlib.redirect_stdout(devnull):
+                        predicted = set(self.run(path, params))
+                except Exception as e:
+                    print(f"Error evaluating {path}: {e}", file=sys.stderr)
+                    predicted = set()
+                records[path] = (time.perf_counter() - start_time, predicted)
+        return self.summary(params)
+
+    def summary(self, params):
+        """已评估图像上的平均延迟、召回率和精确率"""
+        records = self.records[config_key(params)]
+        true_positives = predicted_total = expected_total = 0
+        for path, (_, predicted) in records.items():
+            expected = self.samples[path]
+            true_positives += len(predicted & expected)
+            predicted_total += len(predicted)
+            expected_total += len(expected)
+        return {
+            'params': params,
+            'images': len(records),
+            'latency': round(sum(latency for latency, _ in records.values()) / len(records), 4),
+            'recall': round(true_positives / expected_total, 4) if expected_total else 1.0,
+            'precision': round(true_positives / predicted_total, 4) if predicted_total else None,
+        }
+
+# ---------------------------- 逐次减半搜索 ----------------------------
+def valid_configs(target):
+    """搜索空间中所有合法的参数组合"""
+    space = SEARCH_SPACES[target]
+    configs = []
+    for values in itertools.product(*space.values()):
+        params = dict(zip(space, values))
+        if target == 'scanner' and params['scale_factor_2'] < params['scale_factor_1']:
+            continue  # 第二个缩放因子用于补充更大的放大倍数
+        if target == 'scanner' and params['escalate'] and not params['localize']:
+            continue  # 自适应缩放总会开启定位，与 localize=True 的组合相同
+        configs.append(params)
+    return configs
+
+def sample_configs(target, count, rng):
+    """从搜索空间随机抽取不重复的合法参数组合，界面默认值总是包含在内作为基线；数量超过合法组合总数时全部使用"""
+    default = dict(DEFAULT_PARAMS[target])
+    candidates = [params for params in valid_configs(target) if config_key(params) != config_key(default)]
+    if count > len(candidates) + 1:
+        print(f"Only {len(candidates) + 1} valid configuration(s) for {target}, using all of them", file=sys.stderr)
+    return [default] + rng.sample(candidates, max(0, min(count - 1, len(candidates))))
+
+def rank_key(summary, budget):
+    """超出时间预算的排在后面，其余按召回率从高到低、延迟从低到高"""
+    over_budget = budget is not None and summary['latency'] > budget
+    return (over_budget, -summary['recall'], summary['latency'])
+
+def successive_halving(evaluator, configs, image_paths, budget=None, eta=3, min_images=2, min_finalists=4):
+    """
+    每轮在更多的图像上评估剩余的参数组合，只保留前 1/eta，最后一轮使用全部图像
+    :return: 在全部图像上评估过的参数组合的汇总列表
+    """
+    rung_size = min(min_images, len(image_paths))
+    survivors = configs
+    while True:
+        summaries = [evaluator.evaluate(params, image_paths[:rung_size]) for params in survivors]
+        print(f"Rung with {rung_size} image(s): evaluated {len(survivors)} configuration(s)", file=sys.stderr)
+        if rung_size >= len(image_paths):
+            return summaries
+        keep = max(min_finalists, math.ceil(len(survivors) / eta))
+        survivors = [summary['params'] for summary in sorted(summaries, key=lambda s: rank_key(s, budget))[:keep]]
+        rung_size = min(len(image_paths), rung_size * eta)
+
+def pareto_front(summaries):
+    """延迟越低、召回率越高越好，返回不被其它组合同时在两项上超过的组合，按延迟排序"""
+    front = []
+    for summary in summaries:
+        dominated = any(other['latency'] <= summary['latency'] and other['recall'] >= summary['recall']
+                        and (other['latency'] < summary['latency'] or other['recall'] > summary['recall'])
+                        for other in summaries)
+        if not dominated:
+            front.append(summary)
+    return sorted(front, key=lambda s: s['latency'])
+
+def choose_profile(front, budget=None):
+    """在时间预算内选召回率最高（相同时延迟最低）的组合；没有组合满足预算时选最快的"""
+    within_budget = [summary for summary in front if budget is None or summary['latency'] <= budget]
+    if not within_budget:
+        print("No configuration meets the time budget, choosing the fastest one.", file=sys.stderr)
+        return front[0]
+    return min(within_budget, key=lambda s: (-s['recall'], s['latency']))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="在已知结果的样例图像上自动调优扫描参数")
+    parser.add_argument('folder', help="样例图像目录")
+    parser.add_argument('--expected', default=None, help="期望结果 JSON，默认使用目录下的 manifest.json")
+    parser.add_argument('--target', choices=sorted(SEARCH_SPACES), default='scanner', help="scanner：分块扫描界面；slice：横向切片界面")
+    parser.add_argument('--budget', type=float, default=None, help="每张图像的平均时间预算（秒）")
+    parser.add_argument('--samples', type=int, default=27, help="随机抽取的参数组合数量")
+    parser.add_argument('--eta', type=int, default=3, help="每轮保留 1/eta 的组合，图像数量乘以 eta")
+    parser.add_argument('--min-images', type=int, default=2, help="第一轮使用的图像数量")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    parser.add_argument('--profile', default=None, help="配置文件路径，默认读取 BARCODE_PROFILE 或 ~/.config/barcode_extraction/scan_profile.json")
+    parser.add_argument('--no-save', action='store_true', help="只输出报告，不写入配置文件")
+    parser.add_argument('--report', default='-', help="JSON 报告文件，'-' 表示标准输出")
+    args = parser.parse_args(argv)
+
+    samples = load_samples(args.folder, args.expected)
+    rng = random.Random(args.seed)
+    image_paths = list(samples)
+    rng.shuffle(image_paths)  # 打乱后前几轮使用的子集更有代表性
+    evaluator = Evaluator(args.target, samples)
+    finalists = successive_halving(evaluator, sample_configs(args.target, args.samples, rng), image_paths,
+                                   args.budget, args.eta, args.min_images)
+    front = pareto_front(finalists)
+    chosen = choose_profile(front, args.budget)
+    report = {
+        'target': args.target,
+        'budget': args.budget,
+        'images': len(image_paths),
+        'evaluations': [evaluator.summary(json.loads(key)) for key in evaluator.records],
+        'pareto_front': front,
+        'chosen': chosen,
+    }
+    if not args.no_save:
+        report['profile'] = save_profile(args.target, chosen['params'],
+                                         {key: chosen[key] for key in ('latency', 'recall', 'precision', 'images')},
+                                         args.profile)
+        print(f"Saved {args.target} profile to {report['profile']}", file=sys.stderr)
+    print(f"Chosen: {chosen['params']} latency {chosen['latency']}s recall {chosen['recall']}", file=sys.stderr)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.report == '-':
+        print(text)
+    else:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+界面共用的已解码图像缓存：预览按缩放尺寸解码，整幅图像只解码一次，扫描线程直接复用。
+
+按字节数做 LRU 淘汰，最近使用的几幅图像保持在内存中；文件修改后（修改时间或大小变化）自动重新解码。
+同一图像正在后台预取时，扫描线程等待预取完成而不是再解码一次。
+"""
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+from 流式读取 import read_gray_page  # 灰度读取与扫描脚本保持一致
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 默认缓存上限 512MB
+
+# ---------------------------- 预览 ----------------------------
+def load_preview(path, width, height):
+    """
+    按显示尺寸解码预览，不构建整幅 QPixmap：Qt 的 JPEG 插件直接按比例解码，
+    Qt 读取失败（如超出分配上限的大图）时用 Pillow 的 draft 模式和 thumbnail
+    :return: QPixmap，无法读取时返回 None
+    """
+    from PyQt5.QtCore import Qt
+    from PyQt5.QtGui import QImage, QImageReader, QPixmap
+    reader = QImageReader(path)
+    size = reader.size()
+    if size.isValid():
+        reader.setScaledSize(size.scaled(width, height, Qt.KeepAspectRatio))
+        image = reader.read()
+        if not image.isNull():
+            return QPixmap.fromImage(image)
+    try:
+        with Image.open(path) as image:
+            image.draft('RGB', (width, height))  # JPEG 按 1/2、1/4、1/8 缩小解码
+            image.thumbnail((width, height))
+            image = image.convert('RGB')
+    except OSError:
+        return None
+    qimage = QImage(image.tobytes(), image.width, image.height, image.width * 3, QImage.Format_RGB888)
+    return QPixmap.fromImage(qimage)
+
+# ---------------------------- 整幅图像缓存 ----------------------------
+def _decode_image(path, page):
+    """Pillow 解码一页，与 scan_image 的读取方式相同"""
+    image = Image.open(path)
+    if page:
+        image.seek(page)
+    image.load()
+    return image
+
+def _decode_gray(path, page):
+    """按灰度解码一页，与 read_gray_page 相同；返回只读数组，避免调用方修改共享数据"""
+    gray = read_gray_page(path, page)
+    if gray is not None:
+        gray.flags.writeable = False
+    return gray
+
+DECODERS = {'image': _decode_image, 'gray': _decode_gray}
+
+def _size_of(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return value.width * value.height * len(value.getbands())
+
+class ImageCache:
+    """线程安全的已解码图像 LRU 缓存，键为 (路径, 修改时间, 文件大小, 页码, 解码方式)"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param max_bytes: 缓存图像的总大小上限（字节），超过上限的单幅图像不缓存
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # 键 -> (图像, 字节数)，按最近使用排序
+        self.total_bytes = 0
+        self.loading = {}  # 正在解码的键 -> threading.Event
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def key(self, path, page, kind):
+        stat = os.stat(path)
+        return os.path.abspath(path), stat.st_mtime_ns, stat.st_size, page, kind
+
+    def get(self, path, page=0, kind='image'):
+        """
+        取得解码后的图像，未缓存时解码一次并放入缓存
+        :param kind: 'image' 返回已加载的 PIL 图像；'gray' 返回 uint8 灰度数组
+        :return: 图像，解码失败时 'gray' 返回 None，'image' 抛出异常
+        """
+        key = self.key(path, page, kind)
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                event = self.loading.get(key)
+                if event is None:
+                    event = self.loading[key] = threading.Event()
+                    self.misses += 1
+                    break
+            event.wait()  # 其它线程正在解码同一图像，完成后再查缓存
+            with self.lock:
+                if key not in self.entries and key not in self.loading:
+                    # 对方解码失败或图像太大没有缓存，由本线程自己解码
+                    event = self.loading[key] = threading.Event()
+                    self.misses += 1
+                    break
+        try:
+            value = DECODERS[kind](path, page)
+            if value is not None:
+                self.put(key, value)
+            return value
+        finally:
+            with self.lock:
+                self.loading.pop(key, None)
+            event.set()
+
+    def put(self, key, value):
+        size = _size_of(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self.entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def get_image(self, path, page=0):
+        return self.get(path, page, 'image')
+
+    def get_gray(self, path, page=0):
+        return self.get(path, page, 'gray')
+
+    def prefetch(self, path, page=0, kind='image'):
+        """在后台线程中解码，打开图像后立即调用，开始扫描时通常已经解码完成"""
+        def run():
+            try:
+                self.get(path, page, kind)
+            except Exception as e:
+                print(f"Error prefetching {path}: {e}")
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+shared_cache = ImageCache()  # 同一进程内的界面和扫描线程共用
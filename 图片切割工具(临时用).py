@@ -1,9 +1,226 @@
-from PyQt5.QtWidgets import QApplication, QMainWindow, QPushButton, QLabel, QFileDialog, QMessageBox, QVBoxLayout, QWidget
-from PyQt5.QtGui import QImage, QPixmap, QPainter, QPen
-from PyQt5.QtCore import Qt, QRect, QPoint
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QFileDialog, QMessageBox, QVBoxLayout, QWidget, QTextEdit,
+                             QGraphicsView, QGraphicsScene, QGraphicsPixmapItem, QGraphicsRectItem, QGraphicsSimpleTextItem)
+from PyQt5.QtGui import QImage, QPixmap, QPen, QColor
+from PyQt5.QtCore import Qt, QRectF, QPointF, QThread, pyqtSignal
 from PIL import Image as PILImage
+from collections import OrderedDict
+import math
 import sys
 import os
+import re
+from 扫描引擎 import scan_regions  # 选定区域直接在内存中解码
+
+class SelectionDecodeThread(QThread):
+    region_signal = pyqtSignal(int, list)  # 区域下标、该区域的结果
+    finished_signal = pyqtSignal(list)  # 全部区域的结果，与选择顺序一致
+    error_signal = pyqtSignal(str)
+
+    def __init__(self, image, boxes):
+        super().__init__()
+        self.image = image  # 原始分辨率的PIL图像
+        self.boxes = boxes  # 原图坐标下的选择区域
+
+    def run(self):
+        try:
+            results = scan_regions(self.image, self.boxes, workers=min(len(self.boxes), os.cpu_count() or 1),
+                                   on_region=self.region_signal.emit)
+            self.finished_signal.emit(results)
+        except Exception as e:
+            self.error_signal.emit(str(e))
+
+# ---------------------------- 分块多级图像视图 ----------------------------
+TILE_SIZE = 512  # 瓦片边长（所在层级的像素）
+PREVIEW_MAX_SIDE = 1024  # 预览层的最长边，整幅预览始终显示在最底层
+MAX_CACHED_TILES = 256  # 缓存的瓦片数量上限
+
+def pil_to_pixmap(image):
+    """把 L、RGB、RGBA 的 PIL 图像转换为 QPixmap，显式给出每行字节数"""
+    if image.mode == 'L':
+        qimage = QImage(image.tobytes(), image.width, image.height, image.width, QImage.Format_Grayscale8)
+    elif image.mode == 'RGBA':
+        qimage = QImage(image.tobytes(), image.width, image.height, image.width * 4, QImage.Format_RGBA8888)
+    else:
+        image = image.convert('RGB')
+        qimage = QImage(image.tobytes(), image.width, image.height, image.width * 3, QImage.Format_RGB888)
+    return QPixmap.fromImage(qimage)  # fromImage 会复制像素，不引用已释放的字节串
+
+def build_pyramid(image):
+    """
+    构建逐级缩小一半的金字塔，只在加载时构建一次
+    :return: 层级列表，第0层为原图（非 L/RGB/RGBA 时转换一次），最后一层最长边不超过 PREVIEW_MAX_SIDE
+    """
+    if image.mode not in ('L', 'RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    levels = [image]
+    while max(levels[-1].size) > PREVIEW_MAX_SIDE:
+        levels.append(levels[-1].reduce(2))
+    return levels
+
+class TiledImageView(QGraphicsView):
+    """
+    按缩放级别显示图像：底层是整幅预览，放大时只加载可见范围内对应层级的瓦片；
+    场景坐标即原图像素坐标，选择框是独立的图形项，重绘时不修改图像像素
+    """
+    selection_changed = pyqtSignal(int)  # 选择框数量
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setScene(QGraphicsScene(self))
+        self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+        self.setViewportUpdateMode(QGraphicsView.SmartViewportUpdate)
+        self.setBackgroundBrush(QColor(64, 64, 64))
+        self.levels = []
+        self.tiles = OrderedDict()  # (层级, 列, 行) -> 瓦片图形项，按最近使用排序
+        self.current_level = None
+        self.selection_items = []  # [(矩形项, 编号项)]
+        self.drag_origin = None
+        self.drag_item = None
+        self.pan_origin = None
+        self.horizontalScrollBar().valueChanged.connect(self.update_tiles)
+        self.verticalScrollBar().valueChanged.connect(self.update_tiles)
+
+    def set_image(self, image):
+        """显示新图像：构建预览金字塔，清除旧的瓦片和选择框"""
+        self.scene().clear()
+        self.tiles.clear()
+        self.selection_items = []
+        self.current_level = None
+        self.levels = build_pyramid(image)
+        width, height = image.size
+        self.scene().setSceneRect(0, 0, width, height)
+        preview = self.levels[-1]
+        preview_item = QGraphicsPixmapItem(pil_to_pixmap(preview))
+        preview_item.setScale(width / preview.width)
+        preview_item.setTransformationMode(Qt.SmoothTransformation)
+        preview_item.setZValue(0)
+        self.scene().addItem(preview_item)
+        self.resetTransform()
+        self.fitInView(self.scene().sceneRect(), Qt.KeepAspectRatio)
+        self.selection_changed.emit(0)
+        self.update_tiles()
+
+    def level_for_zoom(self):
+        """屏幕上一个像素对应原图 2^k 个像素时使用第 k 层"""
+        zoom = self.transform().m11()
+        level = int(math.floor(math.log2(1.0 / zoom))) if zoom < 1.0 else 0
+        return max(0, min(level, len(self.levels) - 1))
+
+    def update_tiles(self):
+        # 只为可见范围创建当前层级的瓦片；预览层已经足够时不加载瓦片
+        if not self.levels:
+            return
+        level = self.level_for_zoom()
+        if level != self.current_level:
+            for key in [key for key in self.tiles if key[0] != level]:
+                self.scene().removeItem(self.tiles.pop(key))
+            self.current_level = level
+        if level == len(self.levels) - 1:
+            return
+        factor = 2 ** level
+        image = self.levels[level]
+        visible = self.mapToScene(self.viewport().rect()).boundingRect().intersected(self.scene().sceneRect())
+        span = TILE_SIZE * factor  # 一个瓦片在原图中的边长
+        for row in range(int(visible.top() // span), int(math.ceil(visible.bottom() / span))):
+            for column in range(int(visible.left() // span), int(math.ceil(visible.right() / span))):
+                key = (level, column, row)
+                if key in self.tiles:
+                    self.tiles.move_to_end(key)
+                    continue
+                left, top = column * TILE_SIZE, row * TILE_SIZE
+                tile = image.crop((left, top, min(left + TILE_SIZE, image.width), min(top + TILE_SIZE, image.height)))
+                item = QGraphicsPixmapItem(pil_to_pixmap(tile))
+                item.setPos(left * factor, top * factor)
+                item.setScale(factor)
+                item.setZValue(1)
+                self.scene().addItem(item)
+                self.tiles[key] = item
+        while len(self.tiles) > MAX_CACHED_TILES:
+            _, item = self.tiles.popitem(last=False)
+            self.scene().removeItem(item)
+
+    def wheelEvent(self, event):
+        # 滚轮以鼠标位置为中心缩放
+        if not self.levels:
+            return
+        factor = 1.25 if event.angleDelta().y() > 0 else 0.8
+        zoom = self.transform().m11() * factor
+        fit_zoom = min(self.viewport().width() / self.sceneRect().width(), self.viewport().height() / self.sceneRect().height())
+        if zoom > 8.0 or zoom < min(fit_zoom, 1.0) * 0.5:
+            return
+        self.scale(factor, factor)
+        self.update_tiles()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_tiles()
+
+    def mousePressEvent(self, event):
+        # 左键拖动框选区域，中键拖动平移
+        if not self.levels:
+            return
+        if event.button() == Qt.MiddleButton:
+            self.pan_origin = event.pos()
+        elif event.button() == Qt.LeftButton:
+            self.drag_origin = self.clamp_to_image(self.mapToScene(event.pos()))
+            self.drag_item = QGraphicsRectItem(QRectF(self.drag_origin, self.drag_origin))
+            self.drag_item.setPen(self.selection_pen())
+            self.drag_item.setZValue(2)
+            self.scene().addItem(self.drag_item)
+
+    def mouseMoveEvent(self, event):
+        if self.pan_origin is not None:
+            delta = event.pos() - self.pan_origin
+            self.pan_origin = event.pos()
+            self.horizontalScrollBar().setValue(self.horizontalScrollBar().value() - delta.x())
+            self.verticalScrollBar().setValue(self.verticalScrollBar().value() - delta.y())
+        elif self.drag_item is not None:
+            end_point = self.clamp_to_image(self.mapToScene(event.pos()))
+            self.drag_item.setRect(QRectF(self.drag_origin, end_point).normalized())
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.MiddleButton:
+            self.pan_origin = None
+        elif event.button() == Qt.LeftButton and self.drag_item is not None:
+            rect = self.drag_item.rect()
+            if rect.width() >= 1 and rect.height() >= 1:
+                self.add_selection_label(self.drag_item)
+            else:
+                self.scene().removeItem(self.drag_item)
+            self.drag_item = None
+            self.selection_changed.emit(len(self.selection_items))
+
+    def clamp_to_image(self, point):
+        rect = self.scene().sceneRect()
+        return QPointF(min(max(point.x(), rect.left()), rect.right()), min(max(point.y(), rect.top()), rect.bottom()))
+
+    def selection_pen(self):
+        pen = QPen(Qt.red, 2, Qt.SolidLine)
+        pen.setCosmetic(True)  # 线宽按屏幕像素计算，不随缩放变粗变细
+        return pen
+
+    def add_selection_label(self, rect_item):
+        # 区域编号，与识别结果对应；忽略视图缩放，始终保持可读的字号
+        label = QGraphicsSimpleTextItem(str(len(self.selection_items) + 1))
+        label.setBrush(Qt.red)
+        label.setFlag(QGraphicsSimpleTextItem.ItemIgnoresTransformations)
+        label.setPos(rect_item.rect().topLeft())
+        label.setZValue(2)
+        self.scene().addItem(label)
+        self.selection_items.append((rect_item, label))
+
+    def selection_boxes(self):
+        """选择框在原图坐标下的 (left, top, right, bottom)"""
+        boxes = []
+        for rect_item, _ in self.selection_items:
+            rect = rect_item.rect()
+            boxes.append((int(rect.left()), int(rect.top()), int(math.ceil(rect.right())), int(math.ceil(rect.bottom()))))
+        return boxes
+
+    def undo_selection(self):
+        if self.selection_items:
+            for item in self.selection_items.pop():
+                self.scene().removeItem(item)
+            self.selection_changed.emit(len(self.selection_items))
 
 class ImageSelector(QMainWindow):
     def __init__(self):
@@ -21,9 +238,10 @@ class ImageSelector(QMainWindow):
         self.setCentralWidget(self.central_widget)
         self.layout = QVBoxLayout(self.central_widget)
         
-        # 图片显示标签
-        self.imageLabel = QLabel(self)
-        self.layout.addWidget(self.imageLabel)
+        # 图片显示视图：滚轮缩放，左键框选，中键拖动
+        self.imageView = TiledImageView(self)
+        self.imageView.selection_changed.connect(lambda count: self.undoButton.setEnabled(count > 0))
+        self.layout.addWidget(self.imageView, stretch=1)
         
         # 按钮设置
         self.loadButton = QPushButton('加载图片', self)
@@ -35,59 +253,55 @@ class ImageSelector(QMainWindow):
         self.saveButton.setEnabled(False)
         self.layout.addWidget(self.saveButton)
 
+        self.decodeButton = QPushButton('识别选择部分', self)
+        self.decodeButton.clicked.connect(self.decode_selection)
+        self.decodeButton.setEnabled(False)
+        self.layout.addWidget(self.decodeButton)
+
         self.undoButton = QPushButton('撤销选择', self)
         self.undoButton.clicked.connect(self.undo_selection)
         self.undoButton.setEnabled(False)
         self.layout.addWidget(self.undoButton)
 
+        # 各选择区域的识别结果
+        self.resultText = QTextEdit(self)
+        self.resultText.setReadOnly(True)
+        self.resultText.setMaximumHeight(160)
+        self.layout.addWidget(self.resultText)
+
         # 状态变量初始化
-        self.origin_point = None
-        self.current_rect = QRect()
-        self.selection_rects = []
         self.originalImage = None
-        self.scaled_factor = 1.0
+        self.next_file_index = {}  # (文件名前缀, 扩展名) -> 下一个可用的序号
+        self.decode_thread = None
+        self.region_results = []  # 各选择区域的识别结果，与选择顺序一致
 
     def load_image(self):
         # 加载图片
-        file_name, _ = QFileDialog.getOpenFileName(self, '打开图片文件', '', "Images (*.png *.jpg *.jpeg *.bmp)")
+        file_name, _ = QFileDialog.getOpenFileName(self, '打开图片文件', '', "Images (*.png *.jpg *.jpeg *.bmp *.tif *.tiff)")
         if file_name:
             try:
                 self.originalImage = PILImage.open(file_name)
                 self.display_image()
                 self.saveButton.setEnabled(True)
-                self.undoButton.setEnabled(False)
-                self.selection_rects.clear()
+                self.decodeButton.setEnabled(True)
+                self.resultText.clear()
             except Exception as e:
                 QMessageBox.critical(self, '错误', f"加载图片失败: {e}")
 
     def display_image(self):
-        # 显示图像在标签中
+        # 构建预览金字塔并显示，原图像素只在放大时按瓦片读取
         if self.originalImage:
-            # 将 PIL 图像转换为 QImage
-            qImg = QImage(self.originalImage.tobytes("raw", "RGB"), 
-                          self.originalImage.width, 
-                          self.originalImage.height, 
-                          QImage.Format_RGB888)
-            
-            # 创建 QPixmap 并缩放以适应标签
-            pixmap = QPixmap.fromImage(qImg)
-            scaled_pixmap = pixmap.scaled(self.imageLabel.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            self.scaled_factor = pixmap.width() / scaled_pixmap.width()
-            self.imageLabel.setPixmap(scaled_pixmap)
-            self.imageLabel.setAlignment(Qt.AlignTop | Qt.AlignLeft)
-            self.imageLabel.update()
+            self.imageView.set_image(self.originalImage)
+
+    def selection_boxes(self):
+        # 选择框本身就在原图坐标下
+        return self.imageView.selection_boxes()
 
     def save_selection(self):
         # 保存选择部分
         try:
-            for selection_rect in self.selection_rects:
-                # 将坐标从缩放的 QPixmap 转换为原始图像的坐标
-                x1 = int(selection_rect.left() * self.scaled_factor)
-                y1 = int(selection_rect.top() * self.scaled_factor)
-                x2 = int(selection_rect.right() * self.scaled_factor)
-                y2 = int(selection_rect.bottom() * self.scaled_factor)
-                
-                cropped_image = self.originalImage.crop((x1, y1, x2, y2))
+            for box in self.selection_boxes():
+                cropped_image = self.originalImage.crop(box)
                 output_filename = self.get_unique_filename('selected_part', 'png')
                 cropped_image.save(output_filename)
                 QMessageBox.information(self, '保存成功', f"选择部分已保存为 {output_filename}")
@@ -95,59 +309,62 @@ class ImageSelector(QMainWindow):
             QMessageBox.critical(self, '错误', f"保存选择区域失败: {e}")
 
     def get_unique_filename(self, base_name, extension):
-        # 生成唯一的文件名
-        index = 1
-        while True:
-            filename = f"{base_name}_{index}.{extension}"
-            if not os.path.exists(filename):
-                return filename
-            index += 1
+        # 生成唯一的文件名：首次使用时列出一次目录取已有的最大序号，之后直接递增
+        key = (base_name, extension)
+        if key not in self.next_file_index:
+            pattern = re.compile(rf"{re.escape(base_name)}_(\d+)\.{re.escape(extension)}$")
+            existing = [int(match.group(1)) for match in map(pattern.match, os.listdir('.')) if match]
+            self.next_file_index[key] = max(existing, default=0) + 1
+        index = self.next_file_index[key]
+        self.next_file_index[key] = index + 1
+        return f"{base_name}_{index}.{extension}"
 
-    def mousePressEvent(self, event):
-        # 鼠标按下事件处理
-        if event.button() == Qt.LeftButton and self.imageLabel.pixmap() is not None:
-            self.origin_point = self.imageLabel.mapFrom(self, event.pos())
-            self.current_rect = QRect(self.origin_point, self.origin_point)
-            self.update()
+    def decode_selection(self):
+        # 所有选择区域按原始分辨率直接交给扫描引擎并行识别，不写临时文件
+        if not self.selection_boxes():
+            QMessageBox.information(self, '提示', "请先在图片上框选区域")
+            return
+        if self.decode_thread is not None and self.decode_thread.isRunning():
+            return
+        boxes = self.selection_boxes()
+        self.region_results = [None] * len(boxes)  # 尚未完成的区域为 None
+        self.show_region_results()
+        self.decodeButton.setEnabled(False)
+        self.decode_thread = SelectionDecodeThread(self.originalImage, boxes)
+        self.decode_thread.region_signal.connect(self.region_decoded)
+        self.decode_thread.finished_signal.connect(self.show_selection_results)
+        self.decode_thread.error_signal.connect(self.decode_failed)
+        self.decode_thread.start()
 
-    def mouseMoveEvent(self, event):
-        # 鼠标移动事件处理
-        if self.current_rect is not None and self.imageLabel.pixmap() is not None:
-            end_point = self.imageLabel.mapFrom(self, event.pos())
-            self.current_rect.setBottomRight(end_point)
-            self.update()
+    def region_decoded(self, index, results):
+        # 每完成一个区域就更新显示，不必等所有区域都识别完
+        self.region_results[index] = results
+        self.show_region_results()
 
-    def mouseReleaseEvent(self, event):
-        # 鼠标释放事件处理
-        if event.button() == Qt.LeftButton and self.imageLabel.pixmap() is not None:
-            end_point = self.imageLabel.mapFrom(self, event.pos())
-            self.current_rect.setBottomRight(end_point)
-            if self.current_rect.isValid():
-                self.selection_rects.append(self.current_rect)
-            self.current_rect = QRect()
-            self.update()
+    def show_selection_results(self, region_results):
+        self.region_results = region_results
+        self.show_region_results()
+        self.decodeButton.setEnabled(True)
+
+    def show_region_results(self):
+        # 按选择顺序逐个区域显示结果
+        lines = []
+        for index, results in enumerate(self.region_results):
+            if results is None:
+                lines.append(f"区域 {index + 1}: 正在识别...")
+                continue
+            lines.append(f"区域 {index + 1}: {len(results)} 个条码")
+            for result in results:
+                lines.append(f"    {result['type']}: {result['data']}  位置: {result['position']}")
+        self.resultText.setPlainText("\n".join(lines))
+
+    def decode_failed(self, message):
+        self.decodeButton.setEnabled(True)
+        QMessageBox.critical(self, '错误', f"识别选择区域失败: {message}")
 
     def undo_selection(self):
         # 撤销选择
-        if self.selection_rects:
-            self.selection_rects.pop()
-            self.update()
-
-    def paintEvent(self, event):
-        # 绘制选择矩形
-        super().paintEvent(event)
-        if self.imageLabel.pixmap() is not None:
-            painter = QPainter(self.imageLabel.pixmap())
-            pen = QPen(Qt.red, 2, Qt.SolidLine)
-            painter.setPen(pen)
-
-            for selection_rect in self.selection_rects:
-                painter.drawRect(selection_rect)
-            if self.current_rect and self.current_rect.isValid():
-                painter.drawRect(self.current_rect)
-
-            painter.end()
-            self.imageLabel.update()
+        self.imageView.undo_selection()
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
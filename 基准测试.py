@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+条码识别基准测试：用固定随机种子生成可复现的合成语料，每种识别策略在独立进程中运行，
+输出吞吐量、延迟分位数、峰值内存、pyzbar 解码调用次数和召回率/精确率的 JSON 报告，便于跨版本对比。
+
+示例：
+    python 基准测试.py --corpus bench_corpus --count 20 --seed 0 --output bench_report.json
+    python 基准测试.py --rotation 90 --blur 1.0 --jpeg-quality 70 --strategies scanner_thread chunk_slide
+"""
+import argparse
+import contextlib
+import importlib
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+from 生成code128 import generate_random_number, render_code128  # Code128 渲染
+from 流式读取 import peak_rss_mb  # 进程的峰值常驻内存
+
+# 语料参数的默认值，写入语料清单，参数相同时复用已生成的语料
+CORPUS_DEFAULTS = {
+    'count': 20,               # 图像数量
+    'seed': 0,                 # 随机种子
+    'barcodes_per_image': 4,   # 每张图像的条码数量
+    'data_length': 12,         # 条码数据长度（数字）
+    'module_width': 0.2,       # 条码模块宽度（毫米，300 DPI 渲染），控制条码尺寸
+    'density': 0.3,            # 条码占所在网格单元面积的比例，越大越密集
+    'rotation': 0.0,           # 随机旋转角度范围 ±rotation 度
+    'blur': 0.0,               # 高斯模糊半径
+    'jpeg_quality': None,      # JPEG 质量，None 表示保存为 PNG
+    'noise': 0.0,              # 高斯噪声标准差
+    'clutter': 0,              # 背景干扰元素（文字、线条、色块）数量
+}
+
+# ---------------------------- 合成语料 ----------------------------
+def render_corpus_image(params, rng, np_rng):
+    """
+    按参数合成一张含多个条码的图像
+    :return: (PIL图像, [{'data': 数据, 'box': [left, top, right, bottom]}])
+    """
+    labels = []
+    for _ in range(params['barcodes_per_image']):
+        data = generate_random_number(params['data_length'], rng)
+        label = render_code128(data, {'module_width': params['module_width']})
+        if params['rotation']:
+            angle = rng.uniform(-params['rotation'], params['rotation'])
+            label = label.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor='white')
+        labels.append((data, label))
+
+    # 按网格放置，每个单元的面积按密度放大，条码在单元内随机偏移
+    columns = math.ceil(math.sqrt(len(labels)))
+    rows = math.ceil(len(labels) / columns)
+    spread = 1 / math.sqrt(params['density'])
+    cell_width = int(max(label.width for _, label in labels) * spread)
+    cell_height = int(max(label.height for _, label in labels) * spread)
+    background = tuple(rng.randint(170, 235) for _ in range(3))
+    canvas = Image.new('RGB', (columns * cell_width, rows * cell_height), background)
+
+    # 背景干扰先画，条码自带的白色静区覆盖在上面
+    draw = ImageDraw.Draw(canvas)
+    for _ in range(params['clutter']):
+        x, y = rng.randrange(canvas.width), rng.randrange(canvas.height)
+        color = tuple(rng.randint(0, 160) for _ in range(3))
+        kind = rng.choice(('text', 'line', 'box'))
+        if kind == 'text':
+            draw.text((x, y), ''.join(rng.choices('ABCDEFGHJKLMNPRSTUVWXYZ0123456789 ', k=rng.randint(4, 16))), fill=color)
+        elif kind == 'line':
+            draw.line((x, y, x + rng.randint(-300, 300), y + rng.randint(-300, 300)), fill=color, width=rng.randint(1, 6))
+        else:
+            draw.rectangle((x, y, x + rng.randint(10, 200), y + rng.randint(10, 200)), outline=color, width=rng.randint(1, 4))
+
+    barcodes = []
+    for index, (data, label) in enumerate(labels):
+        left = (index % columns) * cell_width + rng.randint(0, cell_width - label.width)
+        top = (index // columns) * cell_height + rng.randint(0, cell_height - label.height)
+        canvas.paste(label, (left, top))
+        barcodes.append({'data': data, 'box': [left, top, left + label.width, top + label.height]})
+
+    if params['blur']:
+        canvas = canvas.filter(ImageFilter.GaussianBlur(params['blur']))
+    if params['noise']:
+        pixels = np.asarray(canvas, dtype=np.float32) + np_rng.normal(0, params['noise'], (canvas.height, canvas.width, 3))
+        canvas = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    return canvas, barcodes
+
+def generate_corpus(directory, params):
+    """
+    生成语料图像和清单 manifest.json，同一组参数（含种子）总是生成相同的语料
+    :return: 语料清单
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(params['seed'])
+    np_rng = np.random.default_rng(params['seed'])
+    extension = '.png' if params['jpeg_quality'] is None else '.jpg'
+    images = []
+    for index in range(params['count']):
+        canvas, barcodes = render_corpus_image(params, rng, np_rng)
+        file_name = f"bench_{index:04d}{extension}"
+        if params['jpeg_quality'] is None:
+            canvas.save(os.path.join(directory, file_name))
+        else:
+            canvas.save(os.path.join(directory, file_name), quality=params['jpeg_quality'])
+        images.append({'file': file_name, 'size': list(canvas.size), 'barcodes': barcodes})
+    manifest = {'params': params, 'images': images}
+    with open(os.path.join(directory, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+def load_or_generate_corpus(directory, params, regenerate=False):
+    """参数与已有清单一致时复用语料，否则重新生成"""
+    manifest_path = os.path.join(directory, 'manifest.json')
+    if not regenerate and os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest['params'] == params:
+            return manifest
+    print(f"Generating {params['count']} corpus image(s) in {directory}", file=sys.stderr)
+    return generate_corpus(directory, params)
+
+# ---------------------------- 识别策略 ----------------------------
+# 策略名 -> (模块名, 运行函数)，运行函数返回识别出的数据列表
+STRATEGIES = {
+    'horizontal_slice': ('横向移动识别', lambda module, path, workdir: [
+        data for data, _ in module.process_image(path)]),
+    'horizontal_slice_scanline': ('横向移动识别', lambda module, path, workdir: [
+        data for data, _ in module.process_image(path, backend='scanline')]),
+    'horizontal_slice_gui': ('纯横向移动识别(GUI)', lambda module, path, workdir: [
+        data for data, _ in module.process_image(path)]),
+    'chunk_slide': ('切割成块滑动识别', lambda module, path, workdir: [
+        result['data'] for result in module.extract_barcodes_and_qrcodes(path)]),
+    'crop_zoom': ('裁剪放大识别', lambda module, path, workdir: [
+        data for data, _ in module.extract_barcodes_and_qrcodes(path)[1]]),
+    'stepwise': ('逐步识别', lambda module, path, workdir: [
+        data for data, _ in module.extract_barcodes_and_qrcodes(path, output_file=os.path.join(workdir, 'stepwise.txt'))]),
+    'backward_slide': ('向后滑动简单版本', lambda module, path, workdir: module.process_image(path)),
+    'scanner_thread': ('扫描引擎', lambda module, path, workdir: [
+        result['data'] for result in module.scan_image(path)]),  # BarcodeScannerThread 使用的扫描逻辑和界面默认参数
+}
+
+def run_strategy(name, image_paths):
+    """
+    在独立进程中运行一种策略：先包装 pyzbar.decode 计数，再导入策略模块，逐张图像计时
+    :return: {'records': [...], 'decode_calls': 调用次数, 'peak_rss_mb': 峰值内存}
+    """
+    from pyzbar import pyzbar
+    original_decode = pyzbar.decode
+    decode_calls = [0]
+
+    def counting_decode(*args, **kwargs):
+        decode_calls[0] += 1
+        return original_decode(*args, **kwargs)
+    pyzbar.decode = counting_decode  # 必须在导入策略模块之前替换，from pyzbar.pyzbar import decode 才会取到计数版本
+
+    module_name, runner = STRATEGIES[name]
+    module = importlib.import_module(module_name)
+    records = []
+    with tempfile.TemporaryDirectory(prefix='barcode_bench_') as workdir, open(os.devnull, 'w') as devnull:
+        for path in image_paths:
+            error = None
+            start_time = time.perf_counter()
+            try:
+                with contextlib.redirect_stdout(devnull):  # 策略本身的逐块日志不计入报告
+                    predicted = runner(module, path, workdir) or []
+            except Exception as e:
+                predicted = []
+                error = str(e)
+            records.append({'image': os.path.basename(path), 'latency': time.perf_counter() - start_time,
+                            'predicted': sorted(set(predicted)), 'error': error})
+    return {'records': records, 'decode_calls': decode_calls[0], 'peak_rss_mb': peak_rss_mb()}
+
+# ---------------------------- 统计报告 ----------------------------
+def summarize(outcome, manifest):
+    """按语料清单计算吞吐量、延迟分位数、解码调用次数和召回率/精确率"""
+    truth = {image['file']: {barcode['data'] for barcode in image['barcodes']} for image in manifest['images']}
+    records = outcome['records']
+    latencies = np.array([record['latency'] for record in records])
+    true_positives = predicted_total = truth_total = 0
+    for record in records:
+        expected = truth[record['image']]
+        predicted = set(record['predicted'])
+        true_positives += len(predicted & expected)
+        predicted_total += len(predicted)
+        truth_total += len(expected)
+    return {
+        'images': len(records),
+        'images_per_sec': round(len(records) / latencies.sum(), 3) if latencies.sum() else None,
+        'latency_p50': round(float(np.percentile(latencies, 50)), 4),
+        'latency_p95': round(float(np.percentile(latencies, 95)), 4),
+        'peak_rss_mb': outcome['peak_rss_mb'],
+        'decode_calls': outcome['decode_calls'],
+        'decode_calls_per_image': round(outcome['decode_calls'] / len(records), 1),
+        'recall': round(true_positives / truth_total, 4) if truth_total else None,
+        'precision': round(true_positives / predicted_total, 4) if predicted_total else None,
+        'errors': sum(1 for record in records if record['error']),
+    }
+
+def run_benchmark(manifest, corpus_directory, strategy_names, details=False):
+    """每种策略使用一个全新的子进程，峰值内存互不影响"""
+    image_paths = [os.path.join(corpus_directory, image['file']) for image in manifest['images']]
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'corpus': manifest['params'],
+        'strategies': {},
+    }
+    for name in strategy_names:
+        print(f"Running {name} on {len(image_paths)} image(s)...", file=sys.stderr)
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            outcome = executor.submit(run_strategy, name, image_paths).result()
+        summary = summarize(outcome, manifest)
+        if details:
+            summary['records'] = outcome['records']
+        report['strategies'][name] = summary
+        print(f"  {summary['images_per_sec']} img/s, p50 {summary['latency_p50']}s, "
+              f"recall {summary['recall']}, precision {summary['precision']}", file=sys.stderr)
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="在合成语料上对各条码识别策略做吞吐量和准确率基准测试")
+    parser.add_argument('--corpus', default='bench_corpus', help="语料目录，参数不变时复用")
+    parser.add_argument('--regenerate', action='store_true', help="强制重新生成语料")
+    parser.add_argument('--count', type=int, default=CORPUS_DEFAULTS['count'], help="图像数量")
+    parser.add_argument('--seed', type=int, default=CORPUS_DEFAULTS['seed'], help="随机种子")
+    parser.add_argument('--barcodes-per-image', type=int, default=CORPUS_DEFAULTS['barcodes_per_image'], help="每张图像的条码数量")
+    parser.add_argument('--data-length', type=int, default=CORPUS_DEFAULTS['data_length'], help="条码数据长度")
+    parser.add_argument('--module-width', type=float, default=CORPUS_DEFAULTS['module_width'], help="模块宽度（毫米），控制条码尺寸")
+    parser.add_argument('--density', type=float, default=CORPUS_DEFAULTS['density'], help="条码占网格单元面积的比例 (0-1]")
+    parser.add_argument('--rotation', type=float, default=CORPUS_DEFAULTS['rotation'], help="随机旋转角度范围（度）")
+    parser.add_argument('--blur', type=float, default=CORPUS_DEFAULTS['blur'], help="高斯模糊半径")
+    parser.add_argument('--jpeg-quality', type=int, default=CORPUS_DEFAULTS['jpeg_quality'], help="保存为指定质量的 JPEG，默认 PNG")
+    parser.add_argument('--noise', type=float, default=CORPUS_DEFAULTS['noise'], help="高斯噪声标准差")
+    parser.add_argument('--clutter', type=int, default=CORPUS_DEFAULTS['clutter'], help="背景干扰元素数量")
+    parser.add_argument('--strategies', nargs='+', choices=sorted(STRATEGIES), default=list(STRATEGIES), help="要运行的策略")
+    parser.add_argument('--details', action='store_true', help="报告中包含每张图像的延迟和识别结果")
+    parser.add_argument('-o', '--output', default='-', help="JSON 报告文件，'-' 表示标准输出")
+    args = parser.parse_args(argv)
+
+    params = {key: getattr(args, key) for key in CORPUS_DEFAULTS}
+    if not 0 < params['density'] <= 1:
+        parser.error("--density must be in (0, 1]")
+    manifest = load_or_generate_corpus(args.corpus, params, args.regenerate)
+    report = run_benchmark(manifest, args.corpus, args.strategies, args.details)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,22 +1,121 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-from PIL import ImageGrab
+from PIL import Image, ImageGrab
+from pyzbar.pyzbar import decode
 import datetime
+import hashlib
 
+# ---------------------------- 截屏来源 ----------------------------
+class ScreenCapture:
+    """从屏幕截取指定区域"""
+
+    def grab(self, bbox):
+        return ImageGrab.grab(bbox=bbox)
+
+class FileCapture:
+    """用图像文件代替屏幕，每次截取时重新读取文件，便于在没有显示器的环境中驱动截屏和监视"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def grab(self, bbox):
+        with Image.open(self.path) as image:
+            image.load()
+            return image.crop(bbox) if bbox else image.copy()
+
+# ---------------------------- 内存解码 ----------------------------
+def decode_capture(image, scale_factors=(1.0, 2.0)):
+    """
+    直接解码截屏得到的图像，不写入磁盘；原尺寸识别不到时再放大，屏幕上的条码通常较小
+    :param image: PIL 图像
+    :return: [(数据, 类型)]，按首次识别的顺序去重
+    """
+    gray = image.convert('L')
+    results = {}
+    for scale_factor in scale_factors:
+        if scale_factor != 1.0:
+            scaled = gray.resize((int(gray.width * scale_factor), int(gray.height * scale_factor)), Image.LANCZOS)
+        else:
+            scaled = gray
+        for obj in decode(scaled):
+            results.setdefault(obj.data.decode('utf-8'), obj.type)
+        if results:
+            break
+    return list(results.items())
+
+def image_digest(image):
+    """图像像素的快速摘要，用于判断两次截屏是否相同"""
+    return hashlib.blake2b(image.tobytes(), digest_size=16).digest()
+
+class RegionWatcher:
+    """定时重新截取同一区域，只有像素发生变化时才解码"""
+
+    def __init__(self, source, bbox):
+        """
+        :param source: 截屏来源，提供 grab(bbox) 方法
+        :param bbox: 截取区域 (x1, y1, x2, y2)
+        """
+        self.source = source
+        self.bbox = bbox
+        self.last_digest = None
+        self.captures = 0  # 截屏次数
+        self.decodes = 0  # 实际解码次数
+
+    def poll(self):
+        """
+        截取一次区域
+        :return: 像素变化时返回 (图像, 解码结果)，未变化时返回 None
+        """
+        image = self.source.grab(self.bbox)
+        self.captures += 1
+        digest = image_digest(image)
+        if digest == self.last_digest:
+            return None
+        self.last_digest = digest
+        self.decodes += 1
+        return image, decode_capture(image)
+
+# ---------------------------- 界面 ----------------------------
 class ScreenshotTool:
-    def __init__(self, root):
+    def __init__(self, root, source=None):
+        """
+        :param source: 截屏来源，默认截取屏幕；可传入 FileCapture 等替代来源
+        """
         self.root = root
         self.root.title("截屏工具")
-        self.root.geometry("400x300")
+        self.root.geometry("460x420")
         self.root.resizable(False, False)
+        self.source = source or ScreenCapture()
+        self.bbox = None  # 最近一次选择的区域
+        self.last_image = None  # 最近一次截取的图像，保存时使用
+        self.watcher = None
+        self.watch_job = None
 
         # 创建样式
         style = ttk.Style()
         style.configure("TButton", padding=10, font=('Arial', 12))
 
         # 创建按钮
-        self.screenshot_button = ttk.Button(root, text="选择区域截屏", command=self.select_area)
-        self.screenshot_button.pack(pady=50)
+        button_frame = ttk.Frame(root)
+        button_frame.pack(pady=10)
+        self.screenshot_button = ttk.Button(button_frame, text="选择区域截屏", command=self.select_area)
+        self.screenshot_button.grid(row=0, column=0, padx=5)
+        self.watch_button = ttk.Button(button_frame, text="开始监视", command=self.toggle_watch)
+        self.watch_button.grid(row=0, column=1, padx=5)
+        self.save_button = ttk.Button(button_frame, text="保存截图", command=self.save_screenshot)
+        self.save_button.grid(row=0, column=2, padx=5)
+
+        # 监视间隔
+        interval_frame = ttk.Frame(root)
+        interval_frame.pack()
+        ttk.Label(interval_frame, text="监视间隔 (毫秒):").pack(side=tk.LEFT)
+        self.interval_var = tk.IntVar(value=500)
+        ttk.Spinbox(interval_frame, from_=100, to=10000, increment=100, width=8,
+                    textvariable=self.interval_var).pack(side=tk.LEFT, padx=5)
+
+        # 识别结果
+        self.result_list = tk.Listbox(root, height=12)
+        self.result_list.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
         # 状态栏
         self.status_var = tk.StringVar()
@@ -26,6 +125,7 @@ class ScreenshotTool:
         self.status_var.set("准备截屏...")
 
     def select_area(self):
+        self.stop_watch()
         self.status_var.set("请拖动选择截屏区域...")
         self.root.withdraw()  # 隐藏主窗口
         self.root.after(100, self.start_selection)
@@ -55,7 +155,9 @@ class ScreenshotTool:
 
     def on_button_release(self, event):
         self.selection_window.withdraw()  # 隐藏选择窗口
-        x1, y1, x2, y2 = self.start_x, self.start_y, event.x, event.y
+        # 从右下往左上拖动时交换坐标
+        x1, x2 = sorted((self.start_x, event.x))
+        y1, y2 = sorted((self.start_y, event.y))
         self.take_screenshot(x1, y1, x2, y2)
 
     def cancel_selection(self, event):
@@ -64,14 +166,67 @@ class ScreenshotTool:
         self.status_var.set("截屏已取消")
 
     def take_screenshot(self, x1, y1, x2, y2):
-        # 截取指定区域
-        screenshot = ImageGrab.grab(bbox=(x1, y1, x2, y2))
+        # 截取指定区域并直接在内存中解码
+        self.root.deiconify()  # 显示主窗口
+        if getattr(self, 'selection_window', None) is not None:
+            self.selection_window.destroy()  # 关闭选择窗口
+            self.selection_window = None
+        if x2 <= x1 or y2 <= y1:
+            self.status_var.set("截屏区域为空")
+            return
+        self.bbox = (x1, y1, x2, y2)
+        self.last_image = self.source.grab(self.bbox)
+        self.show_results(decode_capture(self.last_image))
+
+    def show_results(self, results):
+        self.result_list.delete(0, tk.END)
+        for data, barcode_type in results:
+            self.result_list.insert(tk.END, f"{barcode_type}: {data}")
+        now = datetime.datetime.now().strftime('%H:%M:%S')
+        self.status_var.set(f"{now} 识别到 {len(results)} 个条码" if results else f"{now} 未识别到条码")
+
+    def save_screenshot(self):
+        if self.last_image is None:
+            messagebox.showinfo("提示", "请先截屏")
+            return
         now = datetime.datetime.now()
         filename = f"screenshot_{now.strftime('%Y%m%d_%H%M%S')}.png"
-        screenshot.save(filename)
+        self.last_image.save(filename)
         self.status_var.set(f"截图已保存为 {filename}")
-        self.root.deiconify()  # 显示主窗口
-        self.selection_window.destroy()  # 关闭选择窗口
+
+    # ---------------------------- 监视模式 ----------------------------
+    def toggle_watch(self):
+        if self.watcher is not None:
+            self.stop_watch()
+            self.status_var.set("已停止监视")
+            return
+        if self.bbox is None:
+            messagebox.showinfo("提示", "请先选择截屏区域")
+            return
+        self.watcher = RegionWatcher(self.source, self.bbox)
+        self.watch_button.config(text="停止监视")
+        self.watch_tick()
+
+    def watch_tick(self):
+        # 像素未变化时跳过解码，保持上一次的结果
+        result = self.watcher.poll()
+        if result is not None:
+            self.last_image, results = result
+            self.show_results(results)
+        try:
+            interval = max(100, self.interval_var.get())
+        except tk.TclError:
+            interval = 500  # 输入框内容无效时使用默认间隔
+        self.watch_job = self.root.after(interval, self.watch_tick)
+
+    def stop_watch(self):
+        if self.watch_job is not None:
+            self.root.after_cancel(self.watch_job)
+            self.watch_job = None
+        if self.watcher is not None:
+            print(f"Watch: {self.watcher.captures} capture(s), {self.watcher.decodes} decode(s)")
+        self.watcher = None
+        self.watch_button.config(text="开始监视")
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,788 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait  # 多进程并行解码
+import numpy as np
+from PIL import Image, ImageEnhance, ImageStat  # 用于图像处理和增强
+from pyzbar.pyzbar import decode  # 用于解码条形码和二维码
+from 条码定位 import locate_barcode_candidates, filter_tiles  # 快速定位候选区域
+from 阶段计时 import stage, count, timed_scan  # 各阶段计时（BARCODE_TIMING=1 开启）
+from 流式读取 import open_reader, image_statistics, peak_rss_mb, reduced_box, MemoryBudgetError, iter_pages, page_count  # 大图按条带读取，多页按页读取
+
+# ---------------------------- 图像金字塔 ----------------------------
+class ImagePyramid:
+    """按缩放因子缓存预处理后的图像层级，一次扫描中每个层级只构建一次"""
+
+    def __init__(self, image, contrast_factor=2.0):
+        """
+        :param image: 原始PIL图像对象
+        :param contrast_factor: 对比度增强因子（默认值为2.0）
+        """
+        self.image = image
+        self.contrast_factor = contrast_factor
+        self._base = None  # 灰度化并增强对比度后的原尺寸图像
+        self._levels = {}  # 缩放因子 -> 放大后的图像
+
+    def base(self):
+        """灰度化并增强对比度，与缩放因子无关，只做一次"""
+        if self._base is None:
+            with stage('grayscale'):
+                grayscale_image = self.image.convert('L')
+            with stage('contrast'):
+                enhancer = ImageEnhance.Contrast(grayscale_image)
+                self._base = enhancer.enhance(self.contrast_factor)
+        return self._base
+
+    def level(self, scale_factor):
+        """返回指定缩放因子的预处理图像，首次访问时构建并缓存"""
+        if scale_factor not in self._levels:
+            base = self.base()
+            new_size = (int(base.width * scale_factor), int(base.height * scale_factor))
+            with stage('resize'):
+                self._levels[scale_factor] = base.resize(new_size, Image.LANCZOS)
+            print(f"Built pyramid level with scale factor {scale_factor}")
+        return self._levels[scale_factor]
+
+    def crop(self, box, scale_factor):
+        """
+        从对应层级中裁剪出区块
+        :param box: 原图坐标下的区块 (left, top, right, bottom)
+        :param scale_factor: 缩放因子
+        :return: (区块图像, 区块在放大图中的left, 区块在放大图中的top)
+        """
+        left, top, right, bottom = box
+        pre_left = int(left * scale_factor)
+        pre_top = int(top * scale_factor)
+        pre_right = int(right * scale_factor)
+        pre_bottom = int(bottom * scale_factor)
+        level = self.level(scale_factor)  # 首次访问时的放大计入 resize 阶段
+        with stage('crop'):
+            chunk = level.crop((pre_left, pre_top, pre_right, pre_bottom))
+        return chunk, pre_left, pre_top
+
+    def export(self, scale_factors, directory):
+        """把各层级写入内存映射文件，返回供工作进程重建的描述"""
+        levels = {}
+        for scale_factor in scale_factors:
+            levels[scale_factor] = _write_shared_array(np.asarray(self.level(scale_factor)), directory)
+        return {'kind': 'pyramid', 'levels': levels}
+
+    def release(self):
+        """释放所有缓存的层级"""
+        self._base = None
+        self._levels.clear()
+
+# ---------------------------- 区块级预处理 ----------------------------
+class RegionPreprocessor:
+    """只对区块及其保护边距做灰度化、对比度增强和放大，内存占用与区块大小相关"""
+
+    def __init__(self, image, margin=0, contrast_factor=2.0):
+        """
+        :param image: 原始PIL图像对象
+        :param margin: 区块四周额外保留的保护边距（原图像素），避免切断跨区块的条码
+        :param contrast_factor: 对比度增强因子（默认值为2.0）
+        """
+        self.image = image
+        self.margin = margin
+        self.contrast_factor = contrast_factor
+        self._contrast_table = None  # 对比度查找表
+
+    def contrast_table(self):
+        """按整幅灰度图的均值构建对比度查找表，与 ImageEnhance.Contrast 的结果一致"""
+        if self._contrast_table is None:
+            with stage('grayscale'):
+                grayscale_image = self.image.convert('L')
+            self._contrast_table = build_contrast_table(ImageStat.Stat(grayscale_image).mean[0], self.contrast_factor)
+        return self._contrast_table
+
+    def crop(self, box, scale_factor):
+        """
+        裁剪区块（含保护边距）后再预处理
+        :param box: 原图坐标下的区块 (left, top, right, bottom)
+        :param scale_factor: 缩放因子
+        :return: (区块图像, 区块在放大坐标系中的left, 区块在放大坐标系中的top)
+        """
+        left, top, right, bottom = box
+        width, height = self.image.size
+        region_left = max(0, left - self.margin)
+        region_top = max(0, top - self.margin)
+        region_right = min(width, right + self.margin)
+        region_bottom = min(height, bottom + self.margin)
+        table = self.contrast_table()
+        with stage('crop'):
+            region = self.image.crop((region_left, region_top, region_right, region_bottom))
+        with stage('grayscale'):
+            region = region.convert('L')
+        with stage('contrast'):
+            region = region.point(table)
+        new_size = (int(region.width * scale_factor), int(region.height * scale_factor))
+        with stage('resize'):
+            chunk = region.resize(new_size, Image.LANCZOS)
+        return chunk, int(region_left * scale_factor), int(region_top * scale_factor)
+
+    def export(self, scale_factors, directory):
+        """把原尺寸灰度图写入内存映射文件，工作进程各自完成区块级预处理"""
+        grayscale = _write_shared_array(np.asarray(self.image.convert('L')), directory)
+        return {'kind': 'region', 'grayscale': grayscale, 'margin': self.margin,
+                'contrast_table': self.contrast_table()}
+
+    def release(self):
+        """释放查找表"""
+        self._contrast_table = None
+
+def build_contrast_table(mean, contrast_factor):
+    """按灰度均值构建对比度查找表"""
+    mean = int(mean + 0.5)
+    table = []
+    for value in range(256):
+        enhanced = mean + contrast_factor * (value - mean)
+        table.append(min(255, max(0, int(enhanced))))
+    return table
+
+# ---------------------------- 流式区块来源 ----------------------------
+class StreamingTileSource(RegionPreprocessor):
+    """从流式读取器按需读取区块，整幅原图和放大图都不驻留内存；预处理与 RegionPreprocessor 一致"""
+
+    def __init__(self, reader, margin=32, contrast_factor=2.0, memory_budget=None):
+        """
+        :param reader: 流式读取.open_reader 返回的读取器
+        :param margin: 区块四周额外保留的保护边距（原图像素）
+        :param memory_budget: 内存预算（字节），用于拆分过大的区块
+        """
+        super().__init__(None, margin=margin, contrast_factor=contrast_factor)
+        self.reader = reader
+        self.size = reader.size
+        self.memory_budget = memory_budget
+        self._statistics = None  # (均值, 缩略图, 缩小比例)
+
+    def statistics(self):
+        """逐条带扫描一遍，得到精确的灰度均值和定位用的缩略图"""
+        if self._statistics is None:
+            with stage('statistics'):
+                self._statistics = image_statistics(self.reader)
+        return self._statistics
+
+    def contrast_table(self):
+        if self._contrast_table is None:
+            self._contrast_table = build_contrast_table(self.statistics()[0], self.contrast_factor)
+        return self._contrast_table
+
+    def crop(self, box, scale_factor):
+        """读取区块（含保护边距）的灰度像素后预处理，返回值与 RegionPreprocessor.crop 相同"""
+        left, top, right, bottom = box
+        width, height = self.size
+        region_left = max(0, left - self.margin)
+        region_top = max(0, top - self.margin)
+        region_right = min(width, right + self.margin)
+        region_bottom = min(height, bottom + self.margin)
+        table = self.contrast_table()
+        with stage('crop'):
+            region = Image.fromarray(np.ascontiguousarray(
+                self.reader.read((region_left, region_top, region_right, region_bottom))))
+        with stage('contrast'):
+            region = region.point(table)
+        # 降采样解码时按原图尺寸计算放大后的大小，坐标系与整幅读取时相同
+        new_size = (int((region_right - region_left) * scale_factor), int((region_bottom - region_top) * scale_factor))
+        with stage('resize'):
+            chunk = region.resize(new_size, Image.LANCZOS)
+        return chunk, int(region_left * scale_factor), int(region_top * scale_factor)
+
+    def export(self, scale_factors, directory):
+        """逐条带把灰度图写入内存映射文件，不在内存中拼出整幅图像"""
+        width, height = self.size
+        reduction = self.reader.reduction
+        shape = (-(-height // reduction), -(-width // reduction))
+        handle, path = tempfile.mkstemp(suffix='.u8', dir=directory)
+        os.close(handle)
+        shared = np.memmap(path, dtype=np.uint8, mode='w+', shape=shape)
+        for top, band in self.reader.iter_bands():
+            band_top = top // reduction
+            shared[band_top:band_top + band.shape[0]] = band
+        shared.flush()
+        del shared
+        return {'kind': 'region', 'grayscale': (path, shape), 'margin': self.margin,
+                'contrast_table': self.contrast_table(), 'reduction': reduction, 'size': self.size}
+
+    def fit_tiles(self, tiles, scale_factors, workers=1):
+        """
+        把按最大缩放因子预处理时超出内存预算的区块对半拆分，直到每块都放得下
+        :return: 拆分后的区块列表
+        """
+        if self.memory_budget is None:
+            return tiles
+        # 每个工作进程同时处理一个区块，读取器预留的内存之外平均分配
+        available = (self.memory_budget - self.reader.reserved_bytes) // max(1, workers)
+        scale_factor = max(scale_factors)
+        margin = self.margin
+        # 按条带读取时区块（含边距和块对齐）不高于一个条带，同一行的区块只解码一次
+        band_rows = self.reader.band_rows
+        max_rows = None if band_rows is None else band_rows - getattr(self.reader, 'block_height', 0) - 2 * margin
+
+        def cost(box):
+            # 区块原图、对比度增强结果各一份，放大后的图像及传给 pyzbar 的副本各一份
+            left, top, right, bottom = box
+            return (right - left + 2 * margin) * (bottom - top + 2 * margin) * (2 + 2 * scale_factor ** 2)
+
+        fitted = []
+        pending = list(tiles)
+        while pending:
+            left, top, right, bottom = box = pending.pop(0)
+            if cost(box) <= available and (max_rows is None or bottom - top <= max_rows):
+                fitted.append(box)
+                continue
+            if max(right - left, bottom - top) < 16:
+                raise MemoryBudgetError(f"Memory budget {self.memory_budget / 2**20:.0f} MB is too small "
+                                        f"for tiles at scale factor {scale_factor}")
+            if (max_rows is None or bottom - top <= max_rows) and right - left >= bottom - top:
+                middle = (left + right) // 2
+                pending[:0] = [(left, top, middle, bottom), (middle, top, right, bottom)]
+            else:
+                middle = (top + bottom) // 2
+                pending[:0] = [(left, top, right, middle), (left, middle, right, bottom)]
+        if len(fitted) > len(tiles):
+            print(f"Split {len(tiles)} tile(s) into {len(fitted)} to fit the memory budget")
+            fitted.sort(key=lambda box: (box[1], box[0]))  # 按行排列，同一行的区块连续读取同一个条带
+        return fitted
+
+    def locate_candidates(self):
+        """在缩略图上定位候选区域，换算回原图坐标"""
+        _, overview, ratio = self.statistics()
+        return locate_on_overview(overview, ratio)
+
+    def release(self):
+        """释放查找表、缩略图和读取器的条带缓存"""
+        super().release()
+        self._statistics = None
+        self.reader.release()
+
+def locate_on_overview(overview, ratio):
+    """
+    在缩略图上定位候选区域，换算回原图坐标
+    :param overview: 灰度缩略图数组
+    :param ratio: 缩略图相对原图的缩小比例
+    """
+    return [(int(left / ratio), int(top / ratio), int(right / ratio), int(bottom / ratio))
+            for left, top, right, bottom in locate_barcode_candidates(overview)]
+
+def image_overview(image, max_side=800):
+    """
+    先按整数倍缩小再转灰度，得到定位用的缩略图，不生成整幅的灰度副本
+    :param image: PIL图像
+    :return: (缩略图数组, 缩略图相对原图的缩小比例)
+    """
+    factor = max(1, max(image.size) // max_side)
+    if factor > 1:
+        if image.mode not in ('L', 'LA', 'RGB', 'RGBA', 'RGBX', 'CMYK', 'YCbCr', 'I', 'F'):
+            image = image.convert('L')  # 调色板、1 位等 reduce 不支持的模式
+        image = image.reduce(factor)  # 按块取平均，与 INTER_AREA 缩小的效果相同
+    return np.asarray(image.convert('L')), 1.0 / factor
+
+def make_tile_source(image, roi_margin=None, contrast_factor=2.0):
+    """
+    根据预处理模式创建区块来源
+    :param roi_margin: 为None时整图构建金字塔；为整数时启用区块级预处理并作为保护边距
+    """
+    if roi_margin is None:
+        return ImagePyramid(image, contrast_factor=contrast_factor)
+    return RegionPreprocessor(image, margin=roi_margin, contrast_factor=contrast_factor)
+
+def split_tiles(width, height, horizontal_chunks, vertical_steps):
+    """按水平切块数量和垂直步骤划分区块，返回原图坐标下的 (left, top, right, bottom) 列表"""
+    tiles = []
+    chunk_width = width // horizontal_chunks
+    step_height = height // vertical_steps
+    for top in range(0, height, step_height):
+        for i in range(horizontal_chunks):
+            left = i * chunk_width
+            right = left + chunk_width if (i < horizontal_chunks - 1) else width
+            bottom = top + step_height if (top + step_height < height) else height
+            tiles.append((left, top, right, bottom))
+    return tiles
+
+# ---------------------------- 并行解码 ----------------------------
+def _write_shared_array(array, directory):
+    """把数组写入内存映射文件，返回 (路径, 形状)"""
+    handle, path = tempfile.mkstemp(suffix='.u8', dir=directory)
+    os.close(handle)
+    shared = np.memmap(path, dtype=np.uint8, mode='w+', shape=array.shape)
+    shared[:] = array
+    shared.flush()
+    del shared
+    return path, array.shape
+
+def _open_shared_array(descriptor):
+    """以只读方式映射共享数组，不复制像素"""
+    path, shape = descriptor
+    return np.memmap(path, dtype=np.uint8, mode='r', shape=shape)
+
+_worker_source = None  # 工作进程内重建的区块来源描述
+
+def _init_worker(descriptor):
+    """工作进程初始化：映射共享的图像数据"""
+    global _worker_source
+    source = dict(descriptor)
+    if source['kind'] == 'pyramid':
+        source['levels'] = {scale_factor: _open_shared_array(level)
+                            for scale_factor, level in descriptor['levels'].items()}
+    else:
+        source['grayscale'] = _open_shared_array(descriptor['grayscale'])
+    _worker_source = source
+
+def _decode_shared_tile(task):
+    """在工作进程中裁剪、预处理并解码一个区块，与串行路径的像素完全一致"""
+    index, box, scale_factor = task
+    left, top, right, bottom = box
+    source = _worker_source
+    if source['kind'] == 'pyramid':
+        pre_left = int(left * scale_factor)
+        pre_top = int(top * scale_factor)
+        pre_right = int(right * scale_factor)
+        pre_bottom = int(bottom * scale_factor)
+        pixels = np.ascontiguousarray(source['levels'][scale_factor][pre_top:pre_bottom, pre_left:pre_right])
+        chunk_height, chunk_width = pixels.shape
+    else:
+        grayscale = source['grayscale']
+        width, height = source.get('size', grayscale.shape[::-1])
+        margin = source['margin']
+        region_left = max(0, left - margin)
+        region_top = max(0, top - margin)
+        region_right = min(width, right + margin)
+        region_bottom = min(height, bottom + margin)
+        # 流式来源降采样解码时，共享灰度图按 reduction 缩小
+        reduced_left, reduced_top, reduced_right, reduced_bottom = reduced_box(
+            (region_left, region_top, region_right, region_bottom), source.get('reduction', 1))
+        region = Image.fromarray(np.ascontiguousarray(grayscale[reduced_top:reduced_bottom, reduced_left:reduced_right]))
+        region = region.point(source['contrast_table'])
+        new_size = (int((region_right - region_left) * scale_factor), int((region_bottom - region_top) * scale_factor))
+        pixels = np.asarray(region.resize(new_size, Image.LANCZOS))
+        chunk_width, chunk_height = new_size
+        pre_left = int(region_left * scale_factor)
+        pre_top = int(region_top * scale_factor)
+    if chunk_width == 0 or chunk_height == 0:
+        return index, pre_left, pre_top, []
+    decoded_objects = decode((pixels.tobytes(), chunk_width, chunk_height))
+    return index, pre_left, pre_top, decoded_objects
+
+def scan_tiles(tile_source, tiles, scale_factors, workers=1):
+    """
+    对每个区块按每个缩放因子解码，按 (区块, 缩放因子) 的顺序逐个产出结果
+    :param tile_source: ImagePyramid、RegionPreprocessor 或 StreamingTileSource
+    :param tiles: 原图坐标下的区块列表
+    :param scale_factors: 缩放因子列表
+    :param workers: 工作进程数量，1 表示在当前进程中串行解码
+    :return: 生成器，每项为 (区块, 缩放因子, 放大坐标left, 放大坐标top, 解码结果)
+    """
+    tasks = [(index, box, scale_factor)
+             for index, box in enumerate(tiles) for scale_factor in scale_factors]
+    if workers <= 1:
+        for index, box, scale_factor in tasks:
+            chunk, pre_left, pre_top = tile_source.crop(box, scale_factor)
+            with stage('decode'):
+                decoded_objects = decode(chunk)
+            yield box, scale_factor, pre_left, pre_top, decoded_objects
+        return
+
+    # 图像数据写入内存映射文件，工作进程只映射不复制
+    directory = tempfile.mkdtemp(prefix='barcode_scan_')
+    try:
+        descriptor = tile_source.export(scale_factors, directory)
+        context = multiprocessing.get_context('spawn')  # 避免在带线程的GUI进程中fork
+        chunksize = max(1, len(tasks) // (workers * 4))
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                       initializer=_init_worker, initargs=(descriptor,))
+        try:
+            # map 按提交顺序返回，合并结果与串行执行完全相同
+            for (index, box, scale_factor), (_, pre_left, pre_top, decoded_objects) in zip(
+                    tasks, executor.map(_decode_shared_tile, tasks, chunksize=chunksize)):
+                count('parallel_decode_calls')
+                yield box, scale_factor, pre_left, pre_top, decoded_objects
+        finally:
+            # 提前停止时取消尚未开始的任务，不再等待整批完成
+            executor.shutdown(wait=True, cancel_futures=True)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+# ---------------------------- 结果合并 ----------------------------
+def to_original_position(rect, pre_left, pre_top, scale_factor):
+    """把放大坐标系中的解码框映射回原图坐标"""
+    left = (pre_left + rect.left) / scale_factor
+    top = (pre_top + rect.top) / scale_factor
+    return {
+        'left': int(round(left)),
+        'top': int(round(top)),
+        'width': int(round(rect.width / scale_factor)),
+        'height': int(round(rect.height / scale_factor))
+    }
+
+def _position_box(position):
+    """position 字典转换为 (left, top, right, bottom)，宽高至少为1以免面积为零"""
+    return (position['left'], position['top'],
+            position['left'] + max(1, position['width']), position['top'] + max(1, position['height']))
+
+def _overlap_ratios(a, b):
+    """返回两个矩形的 (交并比, 交集占较小矩形的比例)"""
+    inter_width = min(a[2], b[2]) - max(a[0], b[0])
+    inter_height = min(a[3], b[3]) - max(a[1], b[1])
+    if inter_width <= 0 or inter_height <= 0:
+        return 0.0, 0.0
+    intersection = inter_width * inter_height
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return intersection / float(area_a + area_b - intersection), intersection / float(min(area_a, area_b))
+
+class ResultAggregator:
+    """把所有区块、所有缩放因子的解码结果放进网格空间索引，按数据和重叠度合并重复结果"""
+
+    def __init__(self, iou_threshold=0.3, containment_threshold=0.9, cell_size=256):
+        """
+        :param iou_threshold: 数据相同且交并比不低于该值时视为同一个条码
+        :param containment_threshold: 数据相同且较小框被覆盖的比例不低于该值时也视为同一个条码（一维条码的扫描线框很扁）
+        :param cell_size: 网格单元的边长（原图像素）
+        """
+        self.iou_threshold = iou_threshold
+        self.containment_threshold = containment_threshold
+        self.cell_size = cell_size
+        self.results = []  # 合并后的结果，按首次发现的顺序排列
+        self._boxes = []  # 与 results 对应的原图坐标矩形
+        self._grid = {}  # (列, 行) -> 落在该单元中的结果下标
+
+    def _cells(self, box):
+        """返回矩形覆盖的所有网格单元"""
+        for column in range(int(box[0] // self.cell_size), int((box[2] - 1) // self.cell_size) + 1):
+            for row in range(int(box[1] // self.cell_size), int((box[3] - 1) // self.cell_size) + 1):
+                yield column, row
+
+    def add(self, barcode_type, barcode_data, position, scale_factor=None):
+        """
+        加入一个原图坐标下的解码结果
+        :return: (合并后的结果记录, 是否为新结果)
+        """
+        box = _position_box(position)
+        checked = set()
+        for cell in self._cells(box):
+            for index in self._grid.get(cell, ()):
+                if index in checked:
+                    continue
+                checked.add(index)
+                result = self.results[index]
+                if result['data'] != barcode_data:
+                    continue
+                iou, containment = _overlap_ratios(box, self._boxes[index])
+                if iou >= self.iou_threshold or containment >= self.containment_threshold:
+                    result['hits'] += 1
+                    return result, False
+        result = {
+            'type': barcode_type,
+            'data': barcode_data,
+            'position': position,
+            'scale_factor': scale_factor,
+            'hits': 1
+        }
+        index = len(self.results)
+        self.results.append(result)
+        self._boxes.append(box)
+        for cell in self._cells(box):
+            self._grid.setdefault(cell, []).append(index)
+        return result, True
+
+# ---------------------------- 自适应缩放 ----------------------------
+def _boxes_intersect(a, b):
+    """判断两个 (left, top, right, bottom) 矩形是否相交"""
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+def _tile_resolved(box, decoded_boxes, candidates):
+    """
+    判断区块是否已解决：区块内的每个候选区域都被至少一个解码结果覆盖，
+    同一区块中的第二个条码只要单独成为候选区域，就会继续放大
+    """
+    for candidate in candidates:
+        if not _boxes_intersect(candidate, box):
+            continue
+        region = (max(candidate[0], box[0]), max(candidate[1], box[1]),
+                  min(candidate[2], box[2]), min(candidate[3], box[3]))
+        if not any(_boxes_intersect(region, decoded_box) for decoded_box in decoded_boxes):
+            return False
+    return True
+
+def scan_tiles_escalating(tile_source, tiles, scale_factors, candidates, workers=1):
+    """
+    自适应缩放：先用最小的缩放因子解码所有区块，只有未解决的区块才换用更大的缩放因子
+    :param candidates: 原图坐标下的候选区域列表（localize_tiles 的结果），据此判断区块是否已解决
+    :return: 生成器，格式与 scan_tiles 相同，按缩放轮次依次产出
+    """
+    pending_tiles = list(tiles)
+    for scale_factor in sorted(scale_factors):
+        if not pending_tiles:
+            break
+        decoded_boxes = {box: [] for box in pending_tiles}
+        for box, _, pre_left, pre_top, decoded_objects in scan_tiles(tile_source, pending_tiles, [scale_factor], workers):
+            # 把解码结果映射回原图坐标，用于判断是否覆盖了候选区域
+            for obj in decoded_objects:
+                rect = obj.rect
+                decoded_boxes[box].append(((pre_left + rect.left) / scale_factor,
+                                           (pre_top + rect.top) / scale_factor,
+                                           (pre_left + rect.left + rect.width) / scale_factor,
+                                           (pre_top + rect.top + rect.height) / scale_factor))
+            yield box, scale_factor, pre_left, pre_top, decoded_objects
+        resolved_count = len(pending_tiles)
+        pending_tiles = [box for box in pending_tiles if not _tile_resolved(box, decoded_boxes[box], candidates)]
+        resolved_count -= len(pending_tiles)
+        print(f"Scale {scale_factor}: {resolved_count} tile(s) resolved, {len(pending_tiles)} escalated")
+
+# ---------------------------- 整图扫描 ----------------------------
+class ScanCancelled(Exception):
+    """扫描在检查点被取消"""
+
+def localize_tiles(image, tiles):
+    """
+    在缩小的灰度图上定位候选区域，输出跳过的区块数量
+    :param image: PIL图像，或 StreamingTileSource（在其缩略图上定位）
+    :return: (与候选区域相交的区块, 候选区域列表)
+    """
+    if isinstance(image, StreamingTileSource):
+        image.statistics()  # 逐条带扫描计入 statistics 阶段
+    with stage('localize'):
+        if isinstance(image, StreamingTileSource):
+            candidates = image.locate_candidates()
+        else:
+            candidates = locate_on_overview(*image_overview(image))
+        kept_tiles = filter_tiles(tiles, candidates)
+    print(f"Localization found {len(candidates)} candidate region(s), skipped {len(tiles) - len(kept_tiles)} of {len(tiles)} tiles")
+    return kept_tiles, candidates
+
+@timed_scan('scan_image')
+def scan_image(image_path, horizontal_chunks=8, vertical_steps=5, scale_factors=(2.0, 4.0), roi_margin=None, workers=1,
+               localize=False, escalate=False, on_result=None, on_progress=None, should_stop=None, cache=None,
+               memory_budget=None, page=0, image_cache=None):
+    """
+    按水平切块和垂直步骤对整幅图像做多尺度分块扫描，不依赖Qt
+    :param image_path: 图像文件路径
+    :param horizontal_chunks: 水平切块数量
+    :param vertical_steps: 垂直扫描步骤
+    :param scale_factors: 缩放因子列表
+    :param roi_margin: 区块级预处理的保护边距，None表示整图预处理
+    :param workers: 并行解码的工作进程数量
+    :param localize: 是否先定位候选区域，只解码与候选区域相交的区块
+    :param escalate: 是否按缩放因子从小到大逐级尝试，区块内的候选区域都解出后不再放大；需要候选区域，会同时开启 localize
+    :param on_result: 每发现一个去重后的新结果时调用 on_result(result)
+    :param on_progress: 每解码完一个区块时调用 on_progress(已完成数, 总数, 已用秒数, 预计剩余秒数)；
+                        自适应缩放时总数按所有区块都放大到最后一级估算，是上限
+    :param should_stop: 无参数的可调用对象，每个区块前后检查，返回True时释放缓存并抛出 ScanCancelled
+    :param cache: 结果缓存（ResultCache），同一图像内容和扫描参数再次扫描时直接返回上次的结果
+    :param memory_budget: 内存预算（字节）；设置后按条带/瓦片流式读取原图，只预处理当前区块，
+                          过大的区块自动拆分，结束时输出峰值内存
+    :param page: 多页 TIFF 等多帧图像的页码（从0开始），只解码这一页
+    :param image_cache: 已解码图像缓存（图像缓存.ImageCache），界面预取过的图像不再重新解码；设置内存预算时不使用
+    :return: 去重后的结果列表，每项包含 type、data、原图坐标的 position、首次解码成功的 scale_factor 和命中次数 hits
+    """
+    localize = localize or escalate  # 自适应缩放依据候选区域判断区块是否已解决
+    if cache is not None:
+        # workers 只影响速度不影响结果，不计入缓存键
+        cache_key = cache.make_key('scan_image', image_path, {
+            'horizontal_chunks': horizontal_chunks, 'vertical_steps': vertical_steps,
+            'scale_factors': [float(s) for s in scale_factors], 'roi_margin': roi_margin,
+            'localize': localize, 'escalate': escalate,
+            **({'memory_budget': memory_budget} if memory_budget is not None else {}),
+            **({'page': page} if page else {})})
+        with stage('cache'):
+            cached_results = cache.get(cache_key)
+        if cached_results is not None:
+            print(f"Cache hit: {len(cached_results)} code(s) for {image_path}")
+            for result in cached_results:
+                if on_result is not None:
+                    on_result(result)
+            if on_progress is not None:
+                on_progress(1, 1, 0.0, 0.0)
+            return cached_results
+
+    if memory_budget is None and image_cache is not None:
+        with stage('load'):
+            original_image = image_cache.get_image(image_path, page)  # 与预览共用的解码结果，只读使用
+        tile_source = make_tile_source(original_image, roi_margin)
+        width, height = original_image.size
+    elif memory_budget is None:
+        with stage('load'):
+            original_image = Image.open(image_path)  # 打开图像文件
+            if page:
+                original_image.seek(page)  # 定位到指定页，只解码这一页
+            original_image.load()  # 立即解码，读取耗时不计入后续的灰度化
+        tile_source = make_tile_source(original_image, roi_margin)  # 金字塔或区块级预处理
+        width, height = original_image.size
+    else:
+        with stage('load'):
+            reader = open_reader(image_path, memory_budget, page)  # 只读取文件头，像素按需解码
+        tile_source = StreamingTileSource(reader, margin=32 if roi_margin is None else roi_margin,
+                                          memory_budget=memory_budget)
+        original_image = tile_source  # 定位在缩略图上进行
+        width, height = reader.size
+    aggregator = ResultAggregator()  # 按原图坐标合并跨区块、跨缩放因子的重复结果
+    print(f"Processing image of size {width}x{height} with {workers} worker(s)")  # 输出图像的尺寸
+
+    # 按水平切块和垂直步长划分区块，逐块逐缩放因子解码
+    tiles = split_tiles(width, height, horizontal_chunks, vertical_steps)
+    if memory_budget is not None:
+        tiles = tile_source.fit_tiles(tiles, scale_factors, workers)
+    candidates = None
+    if localize:
+        tiles, candidates = localize_tiles(original_image, tiles)
+    if escalate:
+        tile_results = scan_tiles_escalating(tile_source, tiles, scale_factors, candidates, workers)
+    else:
+        tile_results = scan_tiles(tile_source, tiles, scale_factors, workers)
+    total_tasks = len(tiles) * len(scale_factors)
+    count('tiles', len(tiles))
+    done_tasks = 0
+    start_time = time.perf_counter()
+    try:
+        for box, scale_factor, pre_left, pre_top, decoded_objects in tile_results:
+            if should_stop is not None and should_stop():
+                print("Scan cancelled.")
+                raise ScanCancelled()
+            left, top, right, bottom = box
+            print(f"Scanned region: left={left}, top={top}, right={right}, bottom={bottom}, scale={scale_factor}")  # 输出每个扫描区域
+
+            # 处理解码结果
+            for obj in decoded_objects:
+                barcode_data = obj.data.decode("utf-8")  # 解码条形码数据
+                barcode_type = obj.type  # 获取条形码类型
+                position = to_original_position(obj.rect, pre_left, pre_top, scale_factor)  # 原图坐标下的位置
+                with stage('dedup'):
+                    result, is_new = aggregator.add(barcode_type, barcode_data, position, scale_factor)
+                if is_new:
+                    print(f"Detected {barcode_type} with data: {barcode_data}")  # 输出检测到的信息
+                    print(f"Barcode position: {position}")  # 输出条形码位置
+                    if on_result is not None:
+                        on_result(result)  # 立即推送新结果
+
+            # 推送进度和预计剩余时间
+            done_tasks += 1
+            if on_progress is not None:
+                elapsed = time.perf_counter() - start_time
+                eta = elapsed / done_tasks * max(0, total_tasks - done_tasks)
+                on_progress(done_tasks, total_tasks, elapsed, eta)
+        if on_progress is not None:
+            on_progress(total_tasks, total_tasks, time.perf_counter() - start_time, 0.0)  # 自适应缩放提前结束时补齐进度
+    finally:
+        tile_results.close()  # 取消时停止产出并关闭进程池
+        tile_source.release()  # 扫描结束或取消后释放缓存的层级
+    if memory_budget is not None:
+        print(f"Peak RSS: {peak_rss_mb()} MB (budget {memory_budget / 2**20:.0f} MB)")
+    if cache is not None:
+        with stage('cache'):
+            cache.put(cache_key, aggregator.results)  # 取消的扫描不会写入缓存
+    return aggregator.results
+
+# ---------------------------- 选定区域扫描 ----------------------------
+def scan_regions(image, boxes, scale_factors=(2.0, 4.0), workers=1, contrast_factor=2.0, on_region=None):
+    """
+    对已加载图像中的若干矩形区域分别做多尺度解码，像素直接从内存裁剪，不写临时文件
+    :param image: PIL图像
+    :param boxes: 原图坐标下的区域列表 [(left, top, right, bottom)]
+    :param workers: 并行解码的线程数量；pyzbar 和 PIL 缩放在C代码中释放GIL，区域之间可以并行
+    :param on_region: 每完成一个区域时调用 on_region(区域下标, 该区域的结果列表)，按完成顺序调用
+    :return: 与 boxes 顺序一致的结果列表，每项为该区域去重后的结果，position 为原图坐标
+    """
+    image.load()  # 先解码像素，线程中只做裁剪
+    tile_source = RegionPreprocessor(image, margin=0, contrast_factor=contrast_factor)
+    tile_source.contrast_table()  # 查找表按整幅图像计算一次，与整图扫描的预处理一致
+
+    def scan_region(index):
+        aggregator = ResultAggregator()
+        for scale_factor in scale_factors:
+            chunk, pre_left, pre_top = tile_source.crop(boxes[index], scale_factor)
+            if chunk.width == 0 or chunk.height == 0:
+                break
+            with stage('decode'):
+                decoded_objects = decode(chunk)
+            for obj in decoded_objects:
+                position = to_original_position(obj.rect, pre_left, pre_top, scale_factor)
+                aggregator.add(obj.type, obj.data.decode("utf-8"), position, scale_factor)
+        return index, aggregator.results
+
+    region_results = [None] * len(boxes)
+    if workers <= 1:
+        finished = (scan_region(index) for index in range(len(boxes)))
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+        finished = (future.result() for future in as_completed(
+            [executor.submit(scan_region, index) for index in range(len(boxes))]))
+    try:
+        for index, results in finished:
+            region_results[index] = results
+            print(f"Region {index + 1} {boxes[index]}: {len(results)} code(s)")
+            if on_region is not None:
+                on_region(index, results)
+    finally:
+        if workers > 1:
+            executor.shutdown(wait=True, cancel_futures=True)
+        tile_source.release()
+    return region_results
+
+# ---------------------------- 多页扫描 ----------------------------
+def _scan_page(image_path, page, params):
+    """在工作进程中扫描一页，日志改写到标准错误"""
+    sys.stdout = sys.stderr
+    return page, scan_image(image_path, page=page, **params)
+
+def scan_pages(image_path, workers=1, on_result=None, on_progress=None, should_stop=None, **params):
+    """
+    扫描多页 TIFF 等多帧图像的每一页，按页完成的顺序逐页产出结果；各页按需读取，不拆分文件
+    :param workers: 大于1时按页分配到工作进程，每页在进程内串行解码区块
+    :param on_result: 每得到一个结果时调用 on_result(result)，结果带有页码 page
+    :param on_progress: 每完成一页时调用 on_progress(已完成页数, 总页数, 已用秒数, 预计剩余秒数)
+    :param should_stop: 每页前后检查，返回True时停止并抛出 ScanCancelled
+    :param params: 传给 scan_image 的其余扫描参数
+    :return: 生成器，每项为 (页码, 该页去重后的结果列表)
+    """
+    total_pages = page_count(image_path) if on_progress is not None else None
+    done_pages = 0
+    start_time = time.perf_counter()
+
+    def finish_page(page, results):
+        nonlocal done_pages
+        for result in results:
+            result['page'] = page  # 每个结果都标注所在的页
+            if on_result is not None:
+                on_result(result)
+        done_pages += 1
+        if on_progress is not None:
+            elapsed = time.perf_counter() - start_time
+            on_progress(done_pages, total_pages, elapsed, elapsed / done_pages * max(0, total_pages - done_pages))
+        print(f"Page {page}: {len(results)} code(s)")
+        return page, results
+
+    pages = iter_pages(image_path)
+    if workers <= 1:
+        for page in pages:
+            if should_stop is not None and should_stop():
+                raise ScanCancelled()
+            results = scan_image(image_path, page=page, should_stop=should_stop, **params)
+            yield finish_page(page, results)
+        return
+
+    # 按页并行：有界提交，哪一页先完成就先产出
+    context = multiprocessing.get_context('spawn')  # 避免在带线程的GUI进程中fork
+    pending = set()
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    try:
+        while True:
+            while len(pending) < workers * 2:
+                page = next(pages, None)
+                if page is None:
+                    break
+                pending.add(executor.submit(_scan_page, image_path, page, params))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield finish_page(*future.result())
+            if should_stop is not None and should_stop():
+                print("Scan cancelled.")
+                raise ScanCancelled()
+    finally:
+        # 提前停止时取消尚未开始的页，不再等待整批完成
+        executor.shutdown(wait=True, cancel_futures=True)
+        pages.close()
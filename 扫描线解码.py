@@ -0,0 +1,205 @@
+import ctypes
+import numpy as np
+
+# Code128 符号 0-105 的条空宽度（模块数），依次为 条、空、条、空、条、空
+CODE128_WIDTHS = (
+    '212222', '222122', '222221', '121223', '121322', '131222', '122213', '122312', '132212', '221213',
+    '221312', '231212', '112232', '122132', '122231', '113222', '123122', '123221', '223211', '221132',
+    '221231', '213212', '223112', '312131', '311222', '321122', '321221', '312212', '322112', '322211',
+    '212123', '212321', '232121', '111323', '131123', '131321', '112313', '132113', '132311', '211313',
+    '231113', '231311', '112133', '112331', '132131', '113123', '113321', '133121', '313121', '211331',
+    '231131', '213113', '213311', '213131', '311123', '311321', '331121', '312113', '312311', '332111',
+    '314111', '221411', '431111', '111224', '111422', '121124', '121421', '141122', '141221', '112214',
+    '112412', '122114', '122411', '142112', '142211', '241211', '221114', '413111', '241112', '134111',
+    '111242', '121142', '121241', '114212', '124112', '124211', '411212', '421112', '421211', '212141',
+    '214121', '412121', '111143', '111341', '131141', '114113', '114311', '411113', '411311', '113141',
+    '114131', '311141', '411131', '211412', '211214', '211232',
+)
+STOP_WIDTHS = '233111'  # 终止符前6个元素，最后还有一个2模块宽的条
+STOP_VALUE = 106
+START_VALUES = {103: 'A', 104: 'B', 105: 'C'}
+MIN_SYMBOL_MODULES = 35  # 起始符 + 校验符 + 终止符的最少模块数，扫描线短于此值不可能含有完整条码
+MIN_ACTIVE_RUNS = 25  # 扫描线上的条空数量达到此值才认为可能含有条码
+
+# 相邻两个元素的宽度和（边到同类边的距离，2-7个模块）按八进制编码成查找表下标；
+# 条普遍变粗或变细时这四个距离不变，比逐个元素取整可靠
+_WEIGHTS = 8 ** np.arange(4)
+_LOOKUP = np.full(8 ** 4, -1, dtype=np.int16)
+for _value, _widths in enumerate(CODE128_WIDTHS + (STOP_WIDTHS,)):
+    _edges = [int(_widths[i]) + int(_widths[i + 1]) for i in range(4)]
+    _LOOKUP[int(np.dot(_edges, _WEIGHTS))] = _value
+
+# ---------------------------- 批量游程编码 ----------------------------
+def binarize_lines(lines, min_contrast=20):
+    """
+    按每条扫描线自身的最亮和最暗值取中点阈值，批量二值化
+    :param lines: 形状为 (扫描线数, 长度) 的灰度数组
+    :param min_contrast: 最亮和最暗之差低于此值的扫描线视为无条码，整条置为空
+    :return: (布尔数组，True 表示条（暗）, 每条扫描线的阈值)
+    """
+    low = lines.min(axis=1, keepdims=True).astype(np.float32)
+    high = lines.max(axis=1, keepdims=True).astype(np.float32)
+    thresholds = (low + high) / 2
+    bars = lines < np.ceil(thresholds).astype(lines.dtype)  # 整数比较，避免整幅转换为浮点
+    bars &= (high - low) >= min_contrast
+    return bars, thresholds
+
+def run_lengths(lines, bars, thresholds):
+    """
+    对所有扫描线一次性做游程编码，游程不会跨越扫描线；
+    条空边缘按相邻两个像素与阈值的线性插值取亚像素位置，减小模糊和取整带来的宽度误差
+    :return: (每个游程所属扫描线, 游程长度（浮点）, 是否为条) 三个一维数组
+    """
+    line_count, length = bars.shape
+    starts = np.ones(bars.shape, dtype=bool)
+    starts[:, 1:] = bars[:, 1:] != bars[:, :-1]
+    positions = np.flatnonzero(starts)
+    line_ids = positions // length
+
+    edges = positions.astype(np.float64) - 0.5  # 扫描线起点的边缘；超过 2^24 像素时 float32 会丢失亚像素精度
+    inner = positions % length != 0
+    values = lines.ravel()
+    previous = values[positions[inner] - 1].astype(np.float32)
+    current = values[positions[inner]].astype(np.float32)
+    edges[inner] = positions[inner] - 1 + (previous - thresholds[line_ids[inner], 0]) / (previous - current)
+    lengths = np.diff(np.append(edges, line_count * length - 0.5))
+    return line_ids, lengths, bars.ravel()[positions]
+
+# ---------------------------- Code128 批量匹配 ----------------------------
+def match_symbols(line_ids, lengths, is_bar):
+    """
+    把每个以条开头的连续6个游程按自身总宽度归一化到11个模块，按边到同类边的距离查表得到符号值
+    :return: 每个游程起点对应的符号值数组，无法匹配时为 -1
+    """
+    values = np.full(len(lengths), -1, dtype=np.int16)
+    if len(lengths) < 6:
+        return values
+    windows = np.lib.stride_tricks.sliding_window_view(lengths, 6)
+    totals = windows.sum(axis=1)
+    edges = np.rint((windows[:, :4] + windows[:, 1:5]) * 11.0 / totals[:, None]).astype(np.int64)
+    valid = ((edges >= 2).all(axis=1) & (edges <= 7).all(axis=1)
+             & is_bar[:len(windows)] & (line_ids[:len(windows)] == line_ids[5:]))
+    keys = np.where(valid, edges @ _WEIGHTS, 0)
+    values[:len(windows)] = np.where(valid, _LOOKUP[keys], -1)
+    return values
+
+def symbols_to_text(symbols):
+    """校验起始符到校验符之间的符号序列，校验通过时返回文本，否则返回 None"""
+    checksum = (symbols[0] + sum(position * value for position, value in enumerate(symbols[1:-1], start=1))) % 103
+    if checksum != symbols[-1]:
+        return None
+    return values_to_text(symbols[:-1])
+
+def values_to_text(values):
+    """按 Code128 的 A/B/C 字符集把符号值（不含校验符）转换为文本，遇到 FNC 等不支持的符号返回 None"""
+    code_set = START_VALUES[values[0]]
+    text = []
+    shift = False
+    for value in values[1:]:
+        current = code_set
+        if shift:
+            current = 'B' if code_set == 'A' else 'A'
+            shift = False
+        if current == 'C':
+            if value < 100:
+                text.append(f"{value:02d}")
+            elif value == 100:
+                code_set = 'B'
+            elif value == 101:
+                code_set = 'A'
+            else:
+                return None
+        elif value < 96:
+            text.append(chr(value + 32) if current == 'B' or value < 64 else chr(value - 64))
+        elif value == 98:
+            shift = True
+        elif value == 99:
+            code_set = 'C'
+        elif value == 100 and current == 'A':
+            code_set = 'B'
+        elif value == 101 and current == 'B':
+            code_set = 'A'
+        else:
+            return None
+    return ''.join(text)
+
+def decode_scanlines(lines, min_contrast=20):
+    """
+    批量解码扫描线上的 Code128，正反两个方向都尝试
+    :param lines: 形状为 (扫描线数, 长度) 的灰度数组
+    :return: [(扫描线下标, 文本)]，同一扫描线上的同一条码只出现一次
+    """
+    line_count = lines.shape[0]
+    if line_count == 0 or lines.shape[1] < MIN_SYMBOL_MODULES:
+        return []
+    both_directions = np.concatenate((lines, lines[:, ::-1]))
+    bars, thresholds = binarize_lines(both_directions, min_contrast)
+    line_ids, lengths, is_bar = run_lengths(both_directions, bars, thresholds)
+    values = match_symbols(line_ids, lengths, is_bar)
+
+    # 每隔6个游程取一个符号：按下标模6分成六组，在组内找到每个位置之后第一个非数据符号，即候选终止符
+    is_data = (values >= 0) & (values <= 102)
+    chain_end = np.empty(len(values), dtype=np.int64)
+    for residue in range(6):
+        group = np.arange(residue, len(values), 6)
+        breaks = np.where(is_data[group], len(values), group)
+        chain_end[group] = np.minimum.accumulate(breaks[::-1])[::-1]
+
+    decoded = set()
+    texts = {}  # 相同的符号序列只校验和转换一次
+    for start in np.flatnonzero((values >= 103) & (values <= 105) & (np.arange(len(values)) + 6 < len(values))):
+        end = chain_end[start + 6]
+        if end >= len(values) or values[end] != STOP_VALUE or line_ids[end] != line_ids[start] or end - start < 18:
+            continue
+        symbols = values[start:end:6]
+        key = symbols.tobytes()
+        if key not in texts:
+            texts[key] = symbols_to_text([int(value) for value in symbols])
+        if texts[key]:
+            decoded.add((int(line_ids[start]) % line_count, texts[key]))
+    return sorted(decoded)
+
+def active_lines(lines, min_contrast=20):
+    """返回每条扫描线上条空数量是否足以含有条码的布尔数组"""
+    bars, _ = binarize_lines(lines, min_contrast)
+    return np.count_nonzero(bars[:, 1:] != bars[:, :-1], axis=1) + 1 >= MIN_ACTIVE_RUNS
+
+# ---------------------------- 横向切片扫描 ----------------------------
+def scan_slices(gray, slices, min_contrast=20, columns=None):
+    """
+    对全高度的竖直切片批量做扫描线解码：所有列只解码一次后分配到各切片，切片足够宽时再解码其中的行
+    :param gray: 单通道灰度图
+    :param slices: [(x, x_end)] 切片的横向范围
+    :param columns: 已按列存储的灰度图（cv2.transpose(gray)），None 时在这里转置
+    :return: 与 slices 一一对应的 (文本集合, 是否可能含有条码) 列表
+    """
+    if columns is None:
+        columns = np.ascontiguousarray(gray.T)
+    column_active = active_lines(columns, min_contrast)
+    active_columns = np.flatnonzero(column_active)  # 只解码条空数量足够的列
+    column_texts = {}
+    for index, text in decode_scanlines(columns[active_columns], min_contrast):
+        column_texts.setdefault(int(active_columns[index]), set()).add(text)
+
+    results = []
+    for x, x_end in slices:
+        texts = set()
+        for column in range(x, x_end):
+            texts |= column_texts.get(column, set())
+        active = bool(column_active[x:x_end].any())
+        if x_end - x >= MIN_SYMBOL_MODULES:
+            rows = gray[:, x:x_end]
+            texts |= {text for _, text in decode_scanlines(rows, min_contrast)}
+            active = active or bool(active_lines(rows, min_contrast).any())
+        results.append((texts, active))
+    return results
+
+def slice_pixels(column_view, height, x, x_end):
+    """
+    从按列存储的灰度图缓冲区中零拷贝取出第 x 到 x_end 列，作为 pyzbar 的 (像素, 宽, 高) 输入；
+    切片在 zbar 中是转置后的图像，zbar 横竖两个方向都扫描，解码内容不变
+    :param column_view: cv2.transpose(gray) 的单字节 memoryview
+    :param height: 原图高度，即每列的像素数
+    """
+    pixels = (ctypes.c_ubyte * ((x_end - x) * height)).from_buffer(column_view, x * height)
+    return pixels, height, x_end - x
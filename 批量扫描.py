@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+无界面批量条形码提取：对目录或通配符匹配到的图像执行分块多尺度扫描，
+每处理完一张图像就输出一行 JSON 记录；多页 TIFF 的每一页作为单独的任务分配到工作进程，每页一行记录。
+
+示例：
+    python 批量扫描.py photos/ "archive/**/*.jpg" --jobs 16 --output results.jsonl
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from 扫描引擎 import scan_image  # 分块多尺度扫描
+from 结果缓存 import ResultCache  # 持久化结果缓存
+from 参数调优 import load_profile, scan_image_kwargs  # 自动调优保存的参数
+from 流式读取 import peak_rss_mb, iter_pages  # 进程的峰值常驻内存，多页图像的页码
+import 阶段计时  # 各阶段计时
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')  # 目录中识别的图像后缀
+MULTI_PAGE_EXTENSIONS = ('.tif', '.tiff', '.gif')  # 可能含有多页的格式，逐页展开为任务
+
+# ---------------------------- 输入展开 ----------------------------
+def iter_image_paths(inputs, recursive=False):
+    """
+    逐个产出待处理的图像路径，目录按后缀过滤，其余按通配符展开
+    :param inputs: 目录、文件或通配符列表
+    :param recursive: 是否递归遍历子目录
+    """
+    for item in inputs:
+        if os.path.isdir(item):
+            if recursive:
+                for root, _, files in os.walk(item):
+                    for name in sorted(files):
+                        if name.lower().endswith(IMAGE_EXTENSIONS):
+                            yield os.path.join(root, name)
+            else:
+                for name in sorted(os.listdir(item)):
+                    path = os.path.join(item, name)
+                    if os.path.isfile(path) and name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield path
+        elif os.path.isfile(item):
+            yield item
+        else:
+            for path in sorted(glob.iglob(item, recursive=True)):
+                if os.path.isfile(path):
+                    yield path
+
+def iter_page_tasks(image_paths):
+    """
+    把图像路径逐个展开为 (路径, 页码) 任务，多页文件只读取各页目录，不解码像素；
+    无法打开的文件按第0页交给工作进程，由其记录错误
+    """
+    for path in image_paths:
+        if not path.lower().endswith(MULTI_PAGE_EXTENSIONS):
+            yield path, 0
+            continue
+        try:
+            pages = list(iter_pages(path))
+        except Exception:
+            pages = [0]
+        for page in pages:
+            yield path, page
+
+# ---------------------------- 单张图像扫描 ----------------------------
+def _init_batch_worker(timing=False):
+    """工作进程的扫描日志改写到标准错误，避免混入 JSON 输出，并按主进程的设置开启计时"""
+    sys.stdout = sys.stderr
+    阶段计时.enable(timing)
+
+def scan_one(image_path, params, page=0):
+    """扫描一张图像并返回结果记录，失败时记录错误而不中断整批；开启计时时附带各阶段分解，设置内存预算时附带工作进程的峰值内存"""
+    start_time = time.perf_counter()
+    record = {'image': image_path, 'page': page, 'results': [], 'error': None}
+    try:
+        with 阶段计时.scan_timings('batch', image_path, emit=False):
+            record['results'] = scan_image(image_path, page=page, **params)
+        for result in record['results']:
+            result['page'] = page  # 与 scan_pages 一致，结果合并到一起后仍能知道所在的页
+    except Exception as e:
+        record['error'] = str(e)
+    record['elapsed'] = round(time.perf_counter() - start_time, 4)
+    if 阶段计时.is_enabled():
+        record['timings'] = 阶段计时.last_report()
+    if params.get('memory_budget') is not None:
+        record['peak_rss_mb'] = peak_rss_mb()
+    return record
+
+# ---------------------------- 批量调度 ----------------------------
+def run_batch(image_paths, params, jobs, output):
+    """
+    用有界进程池并发扫描，每完成一张图像立即写出一行记录
+    :param image_paths: 图像路径的可迭代对象（可以是生成器），多页图像按页展开
+    :param params: 传给 scan_image 的扫描参数
+    :param jobs: 并发扫描的图像数量
+    :param output: 写入 JSON 行的文件对象
+    :return: (页总数, 失败数量, 条码总数)
+    """
+    total = failed = barcodes = 0
+    max_pending = jobs * 2  # 最多同时排队的任务数，避免一次性提交数万个任务
+    tasks = iter_page_tasks(image_paths)
+    pending = set()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_batch_worker,
+                             initargs=(阶段计时.is_enabled(),)) as executor:
+        while True:
+            # 补充任务直到达到排队上限
+            while len(pending) < max_pending:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                path, page = task
+                pending.add(executor.submit(scan_one, path, params, page))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                record = future.result()
+                if record.get('timings'):
+                    阶段计时.merge(record['timings'])  # 汇总工作进程的计时
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+                total += 1
+                barcodes += len(record['results'])
+                if record['error']:
+                    failed += 1
+    return total, failed, barcodes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="无界面批量提取图像中的条形码和二维码")
+    parser.add_argument('inputs', nargs='+', help="图像文件、目录或通配符（如 'photos/**/*.jpg'）")
+    parser.add_argument('-r', '--recursive', action='store_true', help="递归遍历目录")
+    parser.add_argument('-o', '--output', default='-', help="JSON 行输出文件，'-' 表示标准输出")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help="并发扫描的图像数量")
+    parser.add_argument('--horizontal-chunks', type=int, default=8, help="水平切块数量")
+    parser.add_argument('--vertical-steps', type=int, default=5, help="垂直扫描步骤")
+    parser.add_argument('--scale-factors', type=float, nargs='+', default=[2.0, 4.0], help="缩放因子列表")
+    parser.add_argument('--roi-margin', type=int, default=None, help="启用区块级预处理并设置保护边距（像素）")
+    parser.add_argument('--localize', action='store_true', help="先定位候选区域，跳过不含条码的区块")
+    parser.add_argument('--escalate', action='store_true', help="按缩放因子从小到大逐级尝试，区块内每个候选区域都解出结果后不再放大；"
+                             "依据候选区域判断，因此会同时开启 --localize")
+    parser.add_argument('--memory-budget', type=float, default=None, help="每个工作进程的内存预算（MB），设置后流式读取大图并拆分过大的区块")
+    parser.add_argument('--cache', action='store_true', help="启用持久化结果缓存，重复扫描同一图像时直接返回结果")
+    parser.add_argument('--cache-dir', default=None, help="结果缓存目录（指定时自动启用缓存）")
+    parser.add_argument('--timing', action='store_true', help="记录各阶段耗时，每条记录附带 timings 分解")
+    parser.add_argument('--timing-prom', default=None, help="把各阶段累计耗时写成 Prometheus 文本格式文件（自动开启 --timing）")
+    parser.add_argument('--profile', nargs='?', const='', default=None, help="使用参数调优保存的 scanner 配置（可指定配置文件路径），覆盖切块、步骤、缩放、定位和逐级放大参数")
+    args = parser.parse_args(argv)
+
+    params = {
+        'horizontal_chunks': args.horizontal_chunks,
+        'vertical_steps': args.vertical_steps,
+        'scale_factors': tuple(args.scale_factors),
+        'roi_margin': args.roi_margin,
+        'localize': args.localize,
+        'escalate': args.escalate,
+        'memory_budget': int(args.memory_budget * 1024 * 1024) if args.memory_budget else None,
+        'cache': ResultCache(args.cache_dir) if args.cache or args.cache_dir else None,
+    }
+    if args.profile is not None:
+        profile = load_profile('scanner', args.profile or None)
+        if profile is None:
+            parser.error("no tuned scanner profile found, run 参数调优.py first")
+        params.update(scan_image_kwargs(profile))
+    if args.timing or args.timing_prom:
+        阶段计时.enable()
+    image_paths = iter_image_paths(args.inputs, args.recursive)
+    start_time = time.perf_counter()
+    if args.output == '-':
+        total, failed, barcodes = run_batch(image_paths, params, args.jobs, sys.stdout)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            total, failed, barcodes = run_batch(image_paths, params, args.jobs, output)
+    elapsed = time.perf_counter() - start_time
+    print(f"Processed {total} page(s), {failed} failed, {barcodes} code(s) found in {elapsed:.1f}s", file=sys.stderr)
+    if params['cache'] is not None:
+        stats = params['cache'].stats()
+        print(f"Cache: {stats['hits']} hit(s), {stats['misses']} miss(es), {stats['entries']} entries, {stats['bytes']} bytes", file=sys.stderr)
+    if args.timing_prom:
+        阶段计时.write_prometheus(args.timing_prom)
+        print(f"Stage timings written to {args.timing_prom}", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+import cv2  # OpenCV库，用于梯度计算和形态学运算
+import numpy as np
+
+# ---------------------------- 条码候选区域定位 ----------------------------
+def locate_barcode_candidates(gray, max_side=800, min_area_ratio=0.0005, padding_ratio=0.02):
+    """
+    在缩小的灰度图上用梯度方向能量和形态学闭运算快速定位可能含有条码的区域
+    :param gray: 原尺寸灰度图（numpy数组）
+    :param max_side: 定位时把图像长边缩小到的像素数
+    :param min_area_ratio: 候选区域占缩小图面积的最小比例，过滤零散噪点
+    :param padding_ratio: 候选框向外扩展的比例（相对原图长边），避免切掉条码静区
+    :return: 原图坐标下的候选框列表 [(left, top, right, bottom)]
+    """
+    height, width = gray.shape[:2]
+    ratio = min(1.0, max_side / float(max(width, height)))
+    if ratio < 1.0:
+        small = cv2.resize(gray, (max(1, int(width * ratio)), max(1, int(height * ratio))), interpolation=cv2.INTER_AREA)
+    else:
+        small = gray
+    small_height, small_width = small.shape[:2]
+
+    # 条码和二维码的边缘在某一方向上的梯度明显强于另一方向
+    grad_x = np.abs(cv2.Sobel(small, cv2.CV_32F, 1, 0, ksize=3))
+    grad_y = np.abs(cv2.Sobel(small, cv2.CV_32F, 0, 1, ksize=3))
+    energy = cv2.convertScaleAbs(np.abs(grad_x - grad_y))
+    energy = cv2.blur(energy, (9, 9))
+    otsu_threshold, _ = cv2.threshold(energy, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    _, mask = cv2.threshold(energy, max(otsu_threshold, 40), 255, cv2.THRESH_BINARY)  # 设置下限，避免纯色图像中噪声被当成候选
+
+    # 横向和纵向两种闭运算，把竖条或横条之间的空隙连成整块
+    long_side = max(5, max(small_width, small_height) // 40) | 1
+    short_side = max(3, long_side // 3) | 1
+    closed = cv2.bitwise_or(
+        cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (long_side, short_side))),
+        cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (short_side, long_side))))
+    closed = cv2.erode(closed, None, iterations=2)
+    closed = cv2.dilate(closed, None, iterations=2)
+
+    # 取连通区域的外接矩形并映射回原图坐标
+    contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = min_area_ratio * small_width * small_height
+    padding = int(max(width, height) * padding_ratio)
+    candidates = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w * h < min_area:
+            continue
+        candidates.append((max(0, int(x / ratio) - padding),
+                           max(0, int(y / ratio) - padding),
+                           min(width, int((x + w) / ratio) + padding),
+                           min(height, int((y + h) / ratio) + padding)))
+    return candidates
+
+def filter_tiles(tiles, candidates):
+    """只保留与至少一个候选区域相交的区块"""
+    kept_tiles = []
+    for left, top, right, bottom in tiles:
+        for c_left, c_top, c_right, c_bottom in candidates:
+            if left < c_right and c_left < right and top < c_bottom and c_top < bottom:
+                kept_tiles.append((left, top, right, bottom))
+                break
+    return kept_tiles
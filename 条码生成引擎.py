@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Code128 批量生成引擎：直接计算符号序列和条空模块，按整数像素的模块宽度写入 NumPy 缓冲区，
+不经过磁盘、不做缩放重采样；多进程并行渲染，按输入顺序把 PNG 字节或原始灰度像素流式交给调用方。
+
+示例：
+    python 条码生成引擎.py --count 50000 --output-dir labels/ --jobs 8
+    python 条码生成引擎.py --input data.txt --raw labels.raw --module-width 3 --height 120
+    python 条码生成引擎.py --count 50000 --output-dir labels/ --verify --max-failure-rate 0.0001
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import random
+import string
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from 扫描线解码 import CODE128_WIDTHS, STOP_WIDTHS, STOP_VALUE  # 与扫描线解码共用的符号宽度表
+from 标签校验 import LabelVerifier, batch_passed, add_verify_arguments  # 生成后立即解码校验
+
+START_A, START_B, START_C = 103, 104, 105
+CODE_A, CODE_B, CODE_C = 101, 100, 99
+# 每个符号的模块序列（1 为条，0 为空），终止符含最后 2 模块宽的条
+_SYMBOL_MODULES = [np.repeat(np.array([1, 0, 1, 0, 1, 0], dtype=np.uint8), [int(w) for w in widths])
+                   for widths in CODE128_WIDTHS]
+_STOP_MODULES = np.repeat(np.array([1, 0, 1, 0, 1, 0, 1], dtype=np.uint8), [int(w) for w in STOP_WIDTHS + '2'])
+
+# ---------------------------- 编码 ----------------------------
+def _digit_run(data, start):
+    """从 start 开始的连续数字个数"""
+    end = start
+    while end < len(data) and data[end].isdigit():
+        end += 1
+    return end - start
+
+def _char_value(char, code_set):
+    """字符在 A 或 B 字符集中的符号值，不在该字符集中时返回 None"""
+    code = ord(char)
+    if code_set == 'B':
+        return code - 32 if 32 <= code < 128 else None
+    if code < 32:
+        return code + 64
+    return code - 32 if code < 96 else None
+
+def encode_code128(data):
+    """
+    把文本编码为 Code128 符号值序列（起始符、数据、校验符、终止符）；
+    连续数字较多时切换到 C 字符集（每个符号两位数字），控制字符使用 A 字符集，其余使用 B 字符集
+    :param data: ASCII 文本
+    :return: 符号值列表
+    """
+    if not data:
+        raise ValueError("Code128 data must not be empty")
+    if any(ord(char) > 127 for char in data):
+        raise ValueError(f"Code128 supports ASCII only: {data!r}")
+
+    # 起始字符集：开头4位以上数字（或全部为偶数位数字）用 C，先遇到控制字符用 A
+    leading_digits = _digit_run(data, 0)
+    if leading_digits >= 4 or (leading_digits == len(data) and leading_digits % 2 == 0):
+        code_set = 'C'
+    else:
+        code_set = 'B'
+        for char in data:
+            if ord(char) < 32:
+                code_set = 'A'
+                break
+            if ord(char) >= 96:
+                break
+    values = [{'A': START_A, 'B': START_B, 'C': START_C}[code_set]]
+
+    index = 0
+    while index < len(data):
+        if code_set == 'C':
+            if _digit_run(data, index) >= 2:
+                values.append(int(data[index:index + 2]))
+                index += 2
+                continue
+            code_set = 'A' if ord(data[index]) < 32 else 'B'
+            values.append(CODE_A if code_set == 'A' else CODE_B)
+            continue
+        # 中间6位以上或结尾4位以上的偶数位数字切换到 C，奇数位时先用当前字符集编码一位
+        run = _digit_run(data, index)
+        if run >= 6 or (run >= 4 and index + run == len(data)):
+            if run % 2:
+                values.append(_char_value(data[index], code_set))
+                index += 1
+            values.append(CODE_C)
+            code_set = 'C'
+            continue
+        value = _char_value(data[index], code_set)
+        if value is None:
+            code_set = 'A' if code_set == 'B' else 'B'
+            values.append(CODE_A if code_set == 'A' else CODE_B)
+            value = _char_value(data[index], code_set)
+        values.append(value)
+        index += 1
+
+    checksum = (values[0] + sum(position * value for position, value in enumerate(values[1:], start=1))) % 103
+    return values + [checksum, STOP_VALUE]
+
+def code128_modules(data):
+    """文本对应的模块序列（uint8，1 为条），不含静区"""
+    values = encode_code128(data)
+    return np.concatenate([_SYMBOL_MODULES[value] for value in values[:-1]] + [_STOP_MODULES])
+
+# ---------------------------- 渲染 ----------------------------
+_FONT = None
+
+def _font():
+    global _FONT
+    if _FONT is None:
+        _FONT = ImageFont.load_default()
+    return _FONT
+
+def render_label(data, module_width=2, height=100, quiet_zone=10, margin=10, text=False):
+    """
+    按整数像素的模块宽度渲染一个条码标签，每个模块正好 module_width 像素，不做重采样
+    :param module_width: 模块宽度（像素）
+    :param height: 条的高度（像素）
+    :param quiet_zone: 左右静区宽度（模块数），Code128 要求至少 10 个模块
+    :param margin: 上下白边（像素）
+    :param text: 是否在条下方写出可读文本
+    :return: uint8 灰度数组，条为 0，空为 255
+    """
+    modules = code128_modules(data)
+    row = np.repeat(np.uint8(255) - modules * np.uint8(255), module_width)
+    padding = quiet_zone * module_width
+    width = len(row) + 2 * padding
+    text_height = 14 if text else 0
+    label = np.full((height + 2 * margin + text_height, width), 255, dtype=np.uint8)
+    label[margin:margin + height, padding:padding + len(row)] = row  # 一行广播到所有行
+    if text:
+        image = Image.fromarray(label)
+        draw = ImageDraw.Draw(image)
+        text_width = draw.textlength(data, font=_font())
+        draw.text(((width - text_width) / 2, margin + height + 2), data, fill=0, font=_font())
+        label = np.asarray(image)
+    return label
+
+def encode_png(label, bilevel=True, compress_level=1):
+    """
+    把标签编码为 PNG 字节
+    :param bilevel: 标签只有纯黑和纯白时按 1 位深度保存，压缩更快、文件更小；带抗锯齿文本时应为 False
+    """
+    buffer = io.BytesIO()
+    image = Image.fromarray(label)
+    if bilevel:
+        image = image.convert('1', dither=Image.NONE)
+    image.save(buffer, format='PNG', compress_level=compress_level)
+    return buffer.getvalue()
+
+def _render_batch(batch, output_format, options):
+    """工作进程中渲染一批标签，返回 [(数据, 宽, 高, 字节)]"""
+    rendered = []
+    for data in batch:
+        label = render_label(data, **options)
+        height, width = label.shape
+        payload = encode_png(label, bilevel=not options.get('text')) if output_format == 'png' else label.tobytes()
+        rendered.append((data, width, height, payload))
+    return rendered
+
+# ---------------------------- 批量生成 ----------------------------
+def _batches(data_items, batch_size):
+    batch = []
+    for data in data_items:
+        batch.append(data)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def generate_labels(data_items, workers=1, output_format='png', batch_size=256, **options):
+    """
+    批量渲染标签，按输入顺序逐个产出，同时在途的批次有上限，内存占用与总数量无关
+    :param data_items: 条码数据的可迭代对象，可以是生成器
+    :param workers: 工作进程数量，1 表示在当前进程中渲染
+    :param output_format: 'png' 产出 PNG 字节，'raw' 产出按行存储的 8 位灰度像素
+    :param batch_size: 每个任务渲染的标签数量，减少进程间通信次数
+    :param options: 传给 render_label 的渲染参数
+    :return: 生成器，每项为 (数据, 宽, 高, 字节)
+    """
+    if output_format not in ('png', 'raw'):
+        raise ValueError(f"Unknown output format: {output_format}")
+    batches = _batches(data_items, batch_size)
+    if workers <= 1:
+        for batch in batches:
+            yield from _render_batch(batch, output_format, options)
+        return
+
+    context = multiprocessing.get_context('spawn')  # 与扫描引擎一致，避免在带线程的进程中fork
+    pending = deque()
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    try:
+        for batch in batches:
+            pending.append(executor.submit(_render_batch, batch, output_format, options))
+            if len(pending) >= workers * 4:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # 调用方提前停止时取消尚未开始的批次
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def random_data(count, length=12, seed=None):
+    """生成指定数量的随机数字串"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield ''.join(rng.choices(string.digits, k=length))
+
+def read_data(path):
+    """逐行读取条码数据，跳过空行"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if line:
+                yield line
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量生成 Code128 条码标签")
+    parser.add_argument('--input', default=None, help="条码数据文件，每行一个；不指定时生成随机数字")
+    parser.add_argument('--count', type=int, default=1000, help="随机数据的数量")
+    parser.add_argument('--length', type=int, default=12, help="随机数据的位数")
+    parser.add_argument('--seed', type=int, default=None, help="随机种子")
+    parser.add_argument('--output-dir', default=None, help="逐个写出 PNG 的目录，同时写出 index.tsv（序号、数据、文件名）")
+    parser.add_argument('--raw', default=None, help="把所有标签的 8 位灰度像素依次写入该文件，尺寸和偏移写入同名 .tsv")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help="并行渲染的进程数量")
+    parser.add_argument('--batch-size', type=int, default=256, help="每个任务渲染的标签数量")
+    parser.add_argument('--module-width', type=int, default=2, help="模块宽度（像素）")
+    parser.add_argument('--height', type=int, default=100, help="条高（像素）")
+    parser.add_argument('--quiet-zone', type=int, default=10, help="左右静区（模块数）")
+    parser.add_argument('--margin', type=int, default=10, help="上下白边（像素）")
+    parser.add_argument('--text', action='store_true', help="在条下方写出可读文本")
+    add_verify_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.output_dir and args.raw:
+        parser.error("--output-dir and --raw are mutually exclusive")
+
+    data_items = read_data(args.input) if args.input else random_data(args.count, args.length, args.seed)
+    output_format = 'raw' if args.raw else 'png'
+    labels = generate_labels(data_items, args.jobs, output_format, args.batch_size,
+                             module_width=args.module_width, height=args.height,
+                             quiet_zone=args.quiet_zone, margin=args.margin, text=args.text)
+    verifier = None
+    if args.verify:
+        # 写出的 PNG 字节或原始像素同时交给校验进程
+        verifier = LabelVerifier(args.verify_jobs or args.jobs, args.verify_backend, args.verify_report)
+        labels = verifier.labels(labels, output_format)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    start_time = time.perf_counter()
+    total = total_bytes = 0
+    index_file = None
+    raw_file = None
+    try:
+        if args.output_dir:
+            index_file = open(os.path.join(args.output_dir, 'index.tsv'), 'w', encoding='utf-8')
+        elif args.raw:
+            raw_file = open(args.raw, 'wb')
+            index_file = open(os.path.splitext(args.raw)[0] + '.tsv', 'w', encoding='utf-8')
+        for data, width, height, payload in labels:
+            if args.output_dir:
+                filename = f"{total:06d}.png"
+                with open(os.path.join(args.output_dir, filename), 'wb') as f:
+                    f.write(payload)
+                index_file.write(f"{total}\t{data}\t{filename}\n")
+            elif raw_file is not None:
+                index_file.write(f"{total}\t{data}\t{width}\t{height}\t{total_bytes}\n")
+                raw_file.write(payload)
+            total += 1
+            total_bytes += len(payload)
+    finally:
+        for f in (index_file, raw_file):
+            if f is not None:
+                f.close()
+        summary = verifier.finish() if verifier is not None else None
+    elapsed = time.perf_counter() - start_time
+    print(f"Generated {total} label(s), {total_bytes / 2**20:.1f} MB in {elapsed:.2f}s "
+          f"({total / elapsed if elapsed else 0:.0f} labels/s, {args.jobs} job(s))", file=sys.stderr)
+    if summary is not None and not batch_passed(summary, args.max_failure_rate):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
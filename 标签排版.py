@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+条码标签排版：把批量生成的标签按固定网格逐页排入固定尺寸的页面（纸张、DPI、行列、间距、页边距可调），
+每排满一页就写入多页 TIFF 或单独的图像文件，内存中只保留当前一页；
+每页在索引文件中写一行 JSON（页码、文件、每个标签的数据、行列和像素位置），可直接与扫描结果对照。
+
+示例：
+    python 标签排版.py --count 50000 --output sheets.tif --jobs 8
+    python 标签排版.py --input data.txt --output-dir sheets/ --paper letter --dpi 600 --columns 4 --rows 12
+    python 标签排版.py --count 50000 --output sheets.tif --verify --verify-report verify.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+from PIL import Image, TiffImagePlugin
+from 条码生成引擎 import generate_labels, random_data, read_data  # 并行渲染标签
+from 标签校验 import LabelVerifier, batch_passed, add_verify_arguments  # 排版后按索引位置解码校验
+
+PAPER_SIZES = {'a4': (210.0, 297.0), 'a3': (297.0, 420.0), 'letter': (215.9, 279.4)}  # 纸张尺寸（毫米）
+MM_PER_INCH = 25.4
+
+def mm_to_pixels(mm, dpi):
+    return int(round(mm / MM_PER_INCH * dpi))
+
+# ---------------------------- 排版 ----------------------------
+class SheetLayout:
+    """页面网格：页面尺寸、页边距和单元格间距都以像素表示"""
+
+    def __init__(self, page_width, page_height, columns, rows, padding=0, margin=0):
+        """
+        :param page_width: 页面宽度（像素）
+        :param page_height: 页面高度（像素）
+        :param columns: 每页列数
+        :param rows: 每页行数
+        :param padding: 相邻单元格之间的间距（像素）
+        :param margin: 页边距（像素）
+        """
+        self.page_width = page_width
+        self.page_height = page_height
+        self.columns = columns
+        self.rows = rows
+        self.padding = padding
+        self.margin = margin
+        self.cell_width = (page_width - 2 * margin - (columns - 1) * padding) // columns
+        self.cell_height = (page_height - 2 * margin - (rows - 1) * padding) // rows
+        if self.cell_width <= 0 or self.cell_height <= 0:
+            raise ValueError("Page is too small for the requested grid")
+
+    @classmethod
+    def from_paper(cls, paper, dpi, columns, rows, padding_mm=2.0, margin_mm=10.0):
+        """按纸张名称或 (宽, 高) 毫米数和 DPI 构建页面网格"""
+        width_mm, height_mm = PAPER_SIZES[paper.lower()] if isinstance(paper, str) else paper
+        return cls(mm_to_pixels(width_mm, dpi), mm_to_pixels(height_mm, dpi), columns, rows,
+                   mm_to_pixels(padding_mm, dpi), mm_to_pixels(margin_mm, dpi))
+
+    @property
+    def per_page(self):
+        return self.columns * self.rows
+
+    def place(self, slot, width, height):
+        """
+        第 slot 个单元格中居中放置标签的位置
+        :return: (left, top, right, bottom) 页面像素坐标
+        """
+        if width > self.cell_width or height > self.cell_height:
+            raise ValueError(f"Label {width}x{height} does not fit the {self.cell_width}x{self.cell_height} cell; "
+                             f"reduce the module width or the grid size")
+        row, column = divmod(slot, self.columns)
+        left = self.margin + column * (self.cell_width + self.padding) + (self.cell_width - width) // 2
+        top = self.margin + row * (self.cell_height + self.padding) + (self.cell_height - height) // 2
+        return left, top, left + width, top + height
+
+def compose_sheets(labels, layout):
+    """
+    把标签逐个排入页面，排满一页（或标签用完）时产出该页；同一时刻只有一页的缓冲区
+    :param labels: 可迭代的 (数据, uint8 灰度数组)
+    :param layout: SheetLayout
+    :return: 生成器，每项为 (页面灰度数组, [{'data', 'row', 'column', 'box'}])
+    """
+    page = None
+    placements = []
+    for data, label in labels:
+        if page is None:
+            page = np.full((layout.page_height, layout.page_width), 255, dtype=np.uint8)
+        slot = len(placements)
+        height, width = label.shape
+        left, top, right, bottom = layout.place(slot, width, height)
+        page[top:bottom, left:right] = label
+        row, column = divmod(slot, layout.columns)
+        placements.append({'data': data, 'row': row, 'column': column, 'box': [left, top, right, bottom]})
+        if len(placements) == layout.per_page:
+            yield page, placements
+            page = None  # 页面交给调用方写出后释放，下一页重新分配
+            placements = []
+    if placements:
+        yield page, placements
+
+# ---------------------------- 写出 ----------------------------
+def _page_image(page, bilevel):
+    image = Image.fromarray(page)
+    return image.convert('1', dither=Image.NONE) if bilevel else image
+
+def write_sheets(pages, dpi=300, output=None, output_dir=None, page_format='png', index_path=None, bilevel=True):
+    """
+    逐页写出，每写完一页就在索引文件中追加一行 JSON
+    :param pages: compose_sheets 产出的页面
+    :param output: 多页 TIFF 路径，所有页追加到同一个文件
+    :param output_dir: 每页一个文件的目录，文件名为 sheet_00001.<page_format>
+    :param page_format: output_dir 模式下的格式，png 或 tif
+    :param index_path: 索引文件（JSON 行），默认与输出同名的 .jsonl
+    :param bilevel: 页面只有纯黑白时按 1 位深度保存（TIFF 使用 CCITT Group 4 压缩）
+    :return: (页数, 标签数)
+    """
+    if (output is None) == (output_dir is None):
+        raise ValueError("Exactly one of output and output_dir is required")
+    if index_path is None:
+        index_path = os.path.splitext(output)[0] + '.jsonl' if output else os.path.join(output_dir, 'index.jsonl')
+    tiff_compression = 'group4' if bilevel else 'tiff_lzw'
+    page_total = label_total = 0
+    tiff_file = None
+    tiff_writer = None
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    try:
+        with open(index_path, 'w', encoding='utf-8') as index_file:
+            if output:
+                tiff_file = open(output, 'w+b')
+                tiff_writer = TiffImagePlugin.AppendingTiffWriter(tiff_file, new=True)  # 逐页追加，不在内存中收集所有页
+            for page, placements in pages:
+                image = _page_image(page, bilevel)
+                if tiff_writer is not None:
+                    image.save(tiff_writer, format='TIFF', dpi=(dpi, dpi), compression=tiff_compression)
+                    tiff_writer.newFrame()
+                    record = {'file': output, 'page': page_total}
+                else:
+                    filename = f"sheet_{page_total + 1:05d}.{page_format}"
+                    path = os.path.join(output_dir, filename)
+                    if page_format == 'png':
+                        image.save(path, format='PNG', dpi=(dpi, dpi), compress_level=1)
+                    else:
+                        image.save(path, format='TIFF', dpi=(dpi, dpi), compression=tiff_compression)
+                    record = {'file': path, 'page': 0}
+                record.update({'sheet': page_total, 'size': [image.width, image.height], 'dpi': dpi, 'labels': placements})
+                index_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                index_file.flush()
+                page_total += 1
+                label_total += len(placements)
+                print(f"Sheet {page_total}: {len(placements)} label(s)", file=sys.stderr)
+    finally:
+        if tiff_writer is not None:
+            tiff_writer.close()
+        if tiff_file is not None:
+            tiff_file.close()
+    return page_total, label_total
+
+def load_index(index_path):
+    """
+    读取索引文件
+    :return: {(文件, 页码): [{'data', 'row', 'column', 'box'}]}
+    """
+    index = {}
+    with open(index_path, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            index[(record['file'], record['page'])] = record['labels']
+    return index
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="把批量生成的 Code128 标签逐页排版")
+    parser.add_argument('--input', default=None, help="条码数据文件，每行一个；不指定时生成随机数字")
+    parser.add_argument('--count', type=int, default=1000, help="随机数据的数量")
+    parser.add_argument('--length', type=int, default=12, help="随机数据的位数")
+    parser.add_argument('--seed', type=int, default=None, help="随机种子")
+    parser.add_argument('--output', default=None, help="多页 TIFF 输出路径")
+    parser.add_argument('--output-dir', default=None, help="每页一个文件的输出目录")
+    parser.add_argument('--page-format', choices=['png', 'tif'], default='png', help="--output-dir 模式下每页的格式")
+    parser.add_argument('--index', default=None, help="索引文件（JSON 行），默认与输出同名的 .jsonl 或输出目录下的 index.jsonl")
+    parser.add_argument('--paper', choices=sorted(PAPER_SIZES), default='a4', help="纸张尺寸")
+    parser.add_argument('--page-size', default=None, help="自定义页面尺寸（毫米），如 100x150，优先于 --paper")
+    parser.add_argument('--dpi', type=int, default=300, help="页面分辨率")
+    parser.add_argument('--columns', type=int, default=3, help="每页列数")
+    parser.add_argument('--rows', type=int, default=10, help="每页行数")
+    parser.add_argument('--padding', type=float, default=2.0, help="单元格间距（毫米）")
+    parser.add_argument('--margin', type=float, default=10.0, help="页边距（毫米）")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help="并行渲染标签的进程数量")
+    parser.add_argument('--module-width', type=int, default=2, help="模块宽度（像素）")
+    parser.add_argument('--height', type=int, default=100, help="条高（像素）")
+    parser.add_argument('--text', action='store_true', help="在条下方写出可读文本")
+    add_verify_arguments(parser)
+    args = parser.parse_args(argv)
+    if (args.output is None) == (args.output_dir is None):
+        parser.error("exactly one of --output and --output-dir is required")
+
+    paper = tuple(float(value) for value in args.page_size.lower().split('x')) if args.page_size else args.paper
+    layout = SheetLayout.from_paper(paper, args.dpi, args.columns, args.rows, args.padding, args.margin)
+    data_items = read_data(args.input) if args.input else random_data(args.count, args.length, args.seed)
+    rendered = generate_labels(data_items, args.jobs, 'raw', module_width=args.module_width, height=args.height,
+                               text=args.text)
+    labels = ((data, np.frombuffer(payload, dtype=np.uint8).reshape(height, width))
+              for data, width, height, payload in rendered)
+    sheets = compose_sheets(labels, layout)
+    verifier = None
+    if args.verify:
+        # 每排好一页就把整页交给校验进程，按索引中的位置裁出每个标签解码
+        verifier = LabelVerifier(args.verify_jobs or args.jobs, args.verify_backend, args.verify_report)
+        sheets = verifier.sheets(sheets)
+    start_time = time.perf_counter()
+    try:
+        pages, total = write_sheets(sheets, args.dpi, args.output, args.output_dir,
+                                    args.page_format, args.index, bilevel=not args.text)
+    finally:
+        summary = verifier.finish() if verifier is not None else None
+    elapsed = time.perf_counter() - start_time
+    print(f"Composed {total} label(s) on {pages} sheet(s) of {layout.page_width}x{layout.page_height} px "
+          f"({layout.per_page} per sheet) in {elapsed:.2f}s", file=sys.stderr)
+    if summary is not None and not batch_passed(summary, args.max_failure_rate):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""
+生成后立即校验：每个标签（单独的标签或排版后页面中的标签）渲染后交给工作进程解码，
+记录每个标签是否读回了相同的数据和解码耗时，汇总通过率与每秒校验的标签数，失败率超过阈值时整批判为失败。
+
+校验以直通方式包在生成流程外面：标签照常交给写出步骤，同时提交到进程池；在途任务有上限，内存占用与批量大小无关。
+"""
+import io
+import json
+import multiprocessing
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+from 扫描线解码 import decode_scanlines  # NumPy 扫描线解码，作为更快的可选后端
+
+MAX_LISTED_FAILURES = 20  # 汇总中列出的失败标签数量上限
+
+# ---------------------------- 单个标签 ----------------------------
+def decode_label(pixels, backend='pyzbar'):
+    """
+    解码一个标签的灰度像素
+    :param backend: 'pyzbar' 与现场扫描使用同一个解码器；'scanline' 只在条高中部取几行做扫描线解码，更快
+    :return: 解码出的 Code128 文本集合
+    """
+    if backend == 'scanline':
+        height = pixels.shape[0]
+        rows = pixels[np.linspace(height * 0.25, height * 0.75, 5).astype(int)]
+        return {text for _, text in decode_scanlines(rows)}
+    from pyzbar import pyzbar  # 只有 pyzbar 后端需要 zbar 库，生成和排版在不校验或使用扫描线后端时不依赖它
+    return {barcode.data.decode('utf-8', 'replace') for barcode in pyzbar.decode(pixels) if barcode.type == 'CODE128'}
+
+def check_label(data, pixels, backend='pyzbar'):
+    """
+    校验标签能否读回原数据：必须解出且只解出这一个数据
+    :return: {'data', 'passed', 'latency_ms'}，失败时另有 'decoded'
+    """
+    start_time = time.perf_counter()
+    try:
+        decoded = decode_label(pixels, backend)
+    except Exception as e:
+        decoded = {f"error: {e}"}
+    record = {'data': data, 'passed': decoded == {data},
+              'latency_ms': round((time.perf_counter() - start_time) * 1000, 3)}
+    if not record['passed']:
+        record['decoded'] = sorted(decoded)
+    return record
+
+def label_pixels(width, height, payload, output_format):
+    """把生成引擎产出的 PNG 字节或原始像素还原为灰度数组；PNG 从字节重新解码，校验的是实际写出的内容"""
+    if output_format == 'png':
+        with Image.open(io.BytesIO(payload)) as image:
+            return np.asarray(image.convert('L'))
+    return np.frombuffer(payload, dtype=np.uint8).reshape(height, width)
+
+def _verify_labels(items, output_format, backend):
+    """工作进程中校验一批单独的标签"""
+    return [check_label(data, label_pixels(width, height, payload, output_format), backend)
+            for data, width, height, payload in items]
+
+def _verify_sheet(page, placements, sheet, backend):
+    """工作进程中按索引位置从页面裁出每个标签并校验"""
+    records = []
+    for placement in placements:
+        left, top, right, bottom = placement['box']
+        record = check_label(placement['data'], page[top:bottom, left:right], backend)
+        record.update({'sheet': sheet, 'row': placement['row'], 'column': placement['column']})
+        records.append(record)
+    return records
+
+# ---------------------------- 批量校验 ----------------------------
+class LabelVerifier:
+    """把生成的标签或页面提交到进程池解码，按提交顺序收集结果并写出逐标签报告"""
+
+    def __init__(self, workers=1, backend='pyzbar', report_path=None, batch_size=256):
+        """
+        :param workers: 校验进程数量，1 表示在当前进程中校验
+        :param backend: 解码后端，见 decode_label
+        :param report_path: 逐标签的 JSON 行报告，None 表示不写出
+        :param batch_size: 单独的标签每批提交的数量
+        """
+        self.workers = workers
+        self.backend = backend
+        self.batch_size = batch_size
+        self.report_file = open(report_path, 'w', encoding='utf-8') if report_path else None
+        self.pending = deque()
+        self.executor = None
+        if workers > 1:
+            context = multiprocessing.get_context('spawn')  # 与扫描引擎一致，避免在带线程的进程中fork
+            self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        self.total = 0
+        self.failures = []
+        self.latencies = []
+        self.start_time = time.perf_counter()
+
+    def _submit(self, function, *args):
+        if self.executor is None:
+            self._collect(function(*args))
+            return
+        self.pending.append(self.executor.submit(function, *args))
+        while len(self.pending) > self.workers * 2:
+            self._collect(self.pending.popleft().result())  # 在途任务有上限，生成速度超过校验时等待
+
+    def _collect(self, records):
+        for record in records:
+            self.total += 1
+            self.latencies.append(record['latency_ms'])
+            if not record['passed']:
+                self.failures.append(record)
+                print(f"Unreadable label: {record['data']!r} decoded as {record['decoded']}", file=sys.stderr)
+            if self.report_file is not None:
+                self.report_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def labels(self, rendered, output_format):
+        """
+        直通包装生成引擎的输出：原样产出每一项，同时按批提交校验
+        :param rendered: generate_labels 产出的 (数据, 宽, 高, 字节)
+        """
+        batch = []
+        for item in rendered:
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                self._submit(_verify_labels, batch, output_format, self.backend)
+                batch = []
+            yield item
+        if batch:
+            self._submit(_verify_labels, batch, output_format, self.backend)
+
+    def sheets(self, pages):
+        """直通包装 compose_sheets 的输出：每排好一页就提交整页，工作进程按索引位置逐个校验"""
+        for sheet, (page, placements) in enumerate(pages):
+            self._submit(_verify_sheet, page, placements, sheet, self.backend)
+            yield page, placements
+
+    def finish(self):
+        """等待所有校验完成，关闭进程池和报告文件，返回汇总"""
+        try:
+            while self.pending:
+                self._collect(self.pending.popleft().result())
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True, cancel_futures=True)
+            if self.report_file is not None:
+                self.report_file.close()
+        return self.summary()
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start_time
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        return {
+            'labels': self.total,
+            'passed': self.total - len(self.failures),
+            'failed': len(self.failures),
+            'failure_rate': round(len(self.failures) / self.total, 6) if self.total else 0.0,
+            'backend': self.backend,
+            'workers': self.workers,
+            'elapsed_seconds': round(elapsed, 3),
+            'labels_per_second': round(self.total / elapsed, 1) if elapsed else 0.0,
+            'latency_ms': {'mean': round(float(latencies.mean()), 3),
+                           'p50': round(float(np.percentile(latencies, 50)), 3),
+                           'p95': round(float(np.percentile(latencies, 95)), 3),
+                           'max': round(float(latencies.max()), 3)},
+            'failures': [record['data'] for record in self.failures[:MAX_LISTED_FAILURES]],
+        }
+
+def batch_passed(summary, max_failure_rate=0.0):
+    """按失败率阈值判定整批是否合格，并把汇总输出到标准错误"""
+    passed = summary['failure_rate'] <= max_failure_rate
+    print(f"Verification: {summary['passed']}/{summary['labels']} label(s) readable, "
+          f"{summary['labels_per_second']} labels/s, decode p50 {summary['latency_ms']['p50']} ms "
+          f"p95 {summary['latency_ms']['p95']} ms", file=sys.stderr)
+    print(f"Verify: {json.dumps(summary, ensure_ascii=False)}", file=sys.stderr)
+    if not passed:
+        print(f"Batch FAILED: failure rate {summary['failure_rate']:.4%} exceeds {max_failure_rate:.4%}", file=sys.stderr)
+    return passed
+
+def add_verify_arguments(parser):
+    """两个生成脚本共用的校验参数"""
+    parser.add_argument('--verify', action='store_true', help="生成后立即解码校验每个标签")
+    parser.add_argument('--verify-backend', choices=['pyzbar', 'scanline'], default='pyzbar', help="校验使用的解码器")
+    parser.add_argument('--verify-jobs', type=int, default=None, help="校验进程数量，默认与 --jobs 相同")
+    parser.add_argument('--verify-report', default=None, help="逐标签的校验结果（JSON 行）")
+    parser.add_argument('--max-failure-rate', type=float, default=0.0, help="允许的最大失败率，超过时以非零状态退出")
@@ -1,6 +1,12 @@
+import time
+import tracemalloc
 import cv2
 from pyzbar import pyzbar
 import numpy as np
+from 条码定位 import locate_barcode_candidates  # 快速定位候选区域
+from 扫描线解码 import scan_slices, slice_pixels  # NumPy 批量扫描线解码 Code128，零拷贝切片
+from 阶段计时 import stage, count, timed_scan  # 各阶段计时（BARCODE_TIMING=1 开启）
+from 流式读取 import open_reader, image_statistics, peak_rss_mb, read_gray_page, MemoryBudgetError  # 大图按条带读取，多页按页读取
 
 def enhance_image(image, alpha=1.5, beta=50, scale_factor=2.0):
     """
@@ -12,15 +18,17 @@ def enhance_image(image, alpha=1.5, beta=50, scale_factor=2.0):
     :return: 增强后的图像
     """
     # 调整对比度和亮度
-    enhanced_image = cv2.convertScaleAbs(image, alpha=alpha, beta=beta)
+    with stage('contrast'):
+        enhanced_image = cv2.convertScaleAbs(image, alpha=alpha, beta=beta)
     # 获取图像的尺寸
     height, width = enhanced_image.shape[:2]
     # 放大图像
-    enlarged_image = cv2.resize(
-        enhanced_image, 
-        (int(width * scale_factor), int(height * scale_factor)), 
-        interpolation=cv2.INTER_LINEAR
-    )
+    with stage('resize'):
+        enlarged_image = cv2.resize(
+            enhanced_image, 
+            (int(width * scale_factor), int(height * scale_factor)), 
+            interpolation=cv2.INTER_LINEAR
+        )
     return enlarged_image
 def decode_barcode(image):
     """
@@ -28,9 +36,197 @@ def decode_barcode(image):
     :param image: 输入图像
     :return: 解码后的条形码对象列表
     """
-    barcodes = pyzbar.decode(image)
+    with stage('decode'):
+        barcodes = pyzbar.decode(image)
     return barcodes
-def process_image(image_path, slice_width=10, overlap_percent=0.2, alpha=1.5, beta=50, scale_factor=2.0):
+def decode_window(image, x_offset, slice_starts, slice_width, full_width, candidate_ranges, backend, decoded_results,
+                  on_result=None, on_slice=None, should_stop=None):
+    """
+    解码一个已增强放大的竖直窗口中的切片，结果加入 decoded_results
+    :param image: 增强放大后的灰度窗口
+    :param x_offset: 窗口左边缘在整幅放大图中的横坐标
+    :param slice_starts: 落在该窗口内的切片起点（整幅放大图坐标）
+    :param full_width: 整幅放大图的宽度
+    :param candidate_ranges: 候选区域在放大图中的横坐标范围，None 表示不跳过切片
+    :param on_result: 发现新条码时调用 on_result(数据, 类型)
+    :param on_slice: 每处理完（或跳过）一个切片时调用，无参数
+    :param should_stop: 无参数的可调用对象，每个切片前检查，返回True时停止
+    :return: (跳过的切片数, pyzbar 调用次数, 是否被停止)
+    """
+    height, width = image.shape[:2]
+    skipped_slices = 0
+    decode_calls = 0
+
+    def add_results(found):
+        with stage('dedup'):
+            for result in found:
+                if on_result is not None and result not in decoded_results:
+                    on_result(*result)
+                decoded_results.add(result)
+    # 转置成按列存储的连续缓冲区（每个窗口只复制这一次），每个竖直切片都是其中连续的一段
+    with stage('transpose'):
+        columns = cv2.transpose(image)
+    column_view = memoryview(columns).cast('B')
+    # 扫描线后端：窗口内所有列一次性批量解码，再按切片分配结果
+    scanline_results = None
+    if backend == 'scanline':
+        with stage('scanline'):
+            scanline_results = scan_slices(image, [(x - x_offset, min(x + slice_width, full_width) - x_offset)
+                                                   for x in slice_starts], columns=columns)
+
+    def decode_slice(x, index):
+        """解码一个切片，返回 pyzbar 调用次数"""
+        nonlocal skipped_slices
+        # 定义切片的右边界
+        x_end = min(x + slice_width, full_width)
+        # 跳过与所有候选区域都不相交的切片
+        if candidate_ranges is not None and not any(x < right and left < x_end for left, right in candidate_ranges):
+            skipped_slices += 1
+            return 0
+        if scanline_results is not None:
+            texts, active = scanline_results[index]
+            add_results([(text, 'CODE128') for text in sorted(texts)])
+            # 已解出或不可能含有条码的切片不再调用 pyzbar
+            if texts or not active:
+                return 0
+        # 零拷贝取出切片并解码
+        with stage('crop'):
+            slice_img = slice_pixels(column_view, height, x - x_offset, min(x_end - x_offset, width))
+        barcodes = decode_barcode(slice_img)
+        # 如果解码成功，将结果添加到集合中
+        add_results([(barcode.data.decode('utf-8'), barcode.type) for barcode in barcodes])
+        return 1
+
+    # 从左到右逐个切片并尝试解码
+    for index, x in enumerate(slice_starts):
+        if should_stop is not None and should_stop():
+            return skipped_slices, decode_calls, True
+        decode_calls += decode_slice(x, index)
+        if on_slice is not None:
+            on_slice()
+    return skipped_slices, decode_calls, False
+
+def stream_windows(reader, slice_starts, slice_width, alpha, beta, scale_factor, memory_budget, backend='pyzbar'):
+    """
+    按内存预算把切片分组成竖直窗口，逐个读取原图的对应列并增强放大，整幅放大图不会同时存在；
+    条带 TIFF 的每个窗口都要重新解码整幅高度的条带，瓦片 TIFF 只解码窗口所在的瓦片列
+    :param reader: 流式读取.open_reader 返回的读取器
+    :param slice_starts: 所有切片起点（整幅放大图坐标）
+    :param memory_budget: 内存预算（字节）
+    :return: 生成器，每项为 (增强放大后的窗口, 窗口在放大图中的左边缘, 窗口内的切片起点)
+    """
+    width, height = reader.size
+    full_width = int(width * scale_factor)
+    full_height = int(height * scale_factor)
+    # 放大后每列同时存在的副本：窗口和转置缓冲区，扫描线后端另有若干中间数组
+    copies = 8 if backend == 'scanline' else 3
+    window_width = int((memory_budget - reader.reserved_bytes) // (full_height * copies) - 2 * scale_factor)
+    if window_width < slice_width:
+        raise MemoryBudgetError(f"Memory budget {memory_budget / 2**20:.0f} MB is too small for slices of {full_height} rows")
+    index = 0
+    while index < len(slice_starts):
+        window_start = slice_starts[index]
+        end = index + 1
+        while end < len(slice_starts) and slice_starts[end] + slice_width - window_start <= window_width:
+            end += 1
+        window_end = min(slice_starts[end - 1] + slice_width, full_width)
+        # 窗口两侧各多读一列原图，插值结果与整幅放大一致
+        left = max(0, int(window_start / scale_factor) - 1)
+        right = min(width, int(np.ceil(window_end / scale_factor)) + 1)
+        x_offset = int(left * scale_factor)
+        with stage('crop'):
+            region = reader.read((left, 0, right, height))
+        with stage('contrast'):
+            enhanced = cv2.convertScaleAbs(region, alpha=alpha, beta=beta)
+        with stage('resize'):
+            window = cv2.resize(enhanced, (min(full_width, int(right * scale_factor)) - x_offset, full_height),
+                                interpolation=cv2.INTER_LINEAR)
+        del region, enhanced
+        yield window, x_offset, slice_starts[index:end]
+        index = end
+
+def decode_slices(image_path, slice_width, overlap_percent, alpha, beta, scale_factor, localize, backend, stats,
+                  memory_budget, page, on_result=None, on_progress=None, should_stop=None, image_cache=None):
+    """
+    process_image 的切片解码部分，不含结果缓存，参数含义相同
+    :return: (解码结果的集合, 是否被停止)
+    """
+    step_size = int(slice_width * (1 - overlap_percent))
+    candidate_ranges = None
+    if memory_budget is None:
+        # 直接按灰度解码读取图像，之后整个流程只有这一份单通道数据
+        with stage('load'):
+            if image_cache is not None:
+                image = image_cache.get_gray(image_path, page)  # 共享的只读灰度数据，后续处理都生成新数组
+            else:
+                image = read_gray_page(image_path, page)
+        # 在原图上定位候选区域，并换算到放大后的横坐标范围
+        if localize:
+            with stage('localize'):
+                candidates = locate_barcode_candidates(image)
+            candidate_ranges = [(int(left * scale_factor), int(right * scale_factor)) for left, _, right, _ in candidates]
+        # 增强图像，整幅图像作为唯一的窗口
+        image = enhance_image(image, alpha=alpha, beta=beta, scale_factor=scale_factor)
+        width = image.shape[1]
+        slice_starts = range(0, width, step_size)
+        windows = [(image, 0, slice_starts)]
+    else:
+        # 按条带读取原图，每次只增强放大一个竖直窗口
+        with stage('load'):
+            reader = open_reader(image_path, memory_budget, page)
+        # 在缩略图上定位候选区域，并换算到放大后的横坐标范围
+        if localize:
+            with stage('localize'):
+                _, overview, ratio = image_statistics(reader)
+                candidates = locate_barcode_candidates(overview)
+            candidate_ranges = [(int(left / ratio * scale_factor), int(right / ratio * scale_factor)) for left, _, right, _ in candidates]
+        width = int(reader.size[0] * scale_factor)
+        slice_starts = range(0, width, step_size)
+        windows = stream_windows(reader, slice_starts, slice_width, alpha, beta, scale_factor, memory_budget, backend)
+    # 初始化一个集合来存储解码结果，避免重复
+    decoded_results = set()
+    skipped_slices = 0
+    decode_calls = 0
+    count('slices', len(slice_starts))
+    if stats is not None:
+        traced_before_loop, process_peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+    start_time = time.perf_counter()
+    done_slices = 0
+
+    def slice_done():
+        nonlocal done_slices
+        done_slices += 1
+        if on_progress is not None:
+            elapsed = time.perf_counter() - start_time
+            on_progress(done_slices, len(slice_starts), elapsed, elapsed / done_slices * (len(slice_starts) - done_slices))
+    cancelled = False
+    for window, x_offset, window_starts in windows:
+        skipped, calls, cancelled = decode_window(window, x_offset, window_starts, slice_width, width, candidate_ranges,
+                                                  backend, decoded_results, on_result, slice_done, should_stop)
+        skipped_slices += skipped
+        decode_calls += calls
+        if cancelled:
+            print("Scan cancelled.")
+            break
+    if candidate_ranges is not None:
+        print(f"Localization skipped {skipped_slices} of {len(slice_starts)} slices")
+    if memory_budget is not None:
+        reader.release()
+        print(f"Peak RSS: {peak_rss_mb()} MB (budget {memory_budget / 2**20:.0f} MB)")
+    if stats is not None:
+        loop_seconds = time.perf_counter() - start_time
+        _, loop_peak = tracemalloc.get_traced_memory()
+        # 切片循环的峰值减去循环开始时已占用的内存，即循环中临时分配（如逐切片复制）的最大值
+        stats.update({'slices': len(slice_starts), 'decode_calls': decode_calls,
+                      'slice_loop_seconds': loop_seconds,
+                      'peak_traced_bytes': max(process_peak, loop_peak),
+                      'slice_loop_peak_bytes': loop_peak - traced_before_loop, 'cached': False})
+    return decoded_results, cancelled
+
+@timed_scan('process_image')
+def process_image(image_path, slice_width=10, overlap_percent=0.2, alpha=1.5, beta=50, scale_factor=2.0, localize=False, cache=None, backend='pyzbar', stats=None, memory_budget=None, page=0,
+                  on_result=None, on_progress=None, should_stop=None, image_cache=None):
     """
     处理图像，逐个切片解码条形码，并统计结果。
     :param image_path: 图像文件路径
@@ -39,45 +235,70 @@ def process_image(image_path, slice_width=10, overlap_percent=0.2, alpha=1.5, be
     :param alpha: 对比度控制
     :param beta: 亮度控制
     :param scale_factor: 缩放因子
+    :param localize: 是否先定位候选区域，只解码与候选区域横向相交的切片
+    :param cache: 结果缓存（ResultCache），同一图像内容和参数再次处理时直接返回上次的结果
+    :param backend: 'pyzbar' 逐个切片调用 pyzbar；'scanline' 先用 NumPy 批量解码所有切片中的 Code128，
+                    只有可能含有条码但未解出的切片才交给 pyzbar
+    :param stats: 传入字典时写入切片数量、pyzbar 调用次数、切片循环耗时，以及 tracemalloc 统计的峰值分配字节数
+                  （整个处理过程和切片循环各一项），便于对比优化前后；缓存命中时各项为 0，cached 为 True
+    :param memory_budget: 内存预算（字节）；设置后按条带读取原图，每次只增强放大一个竖直窗口，并输出峰值内存
+    :param page: 多页 TIFF 等多帧图像的页码（从0开始），只解码这一页
+    :param on_result: 发现新条码时立即调用 on_result(数据, 类型)
+    :param on_progress: 每处理完一个切片调用 on_progress(已完成切片数, 总数, 已用秒数, 预计剩余秒数)
+    :param should_stop: 无参数的可调用对象，每个切片前检查，返回True时停止并返回已得到的结果（不写入缓存）
+    :param image_cache: 已解码图像缓存（图像缓存.ImageCache），复用界面预取的灰度数据；设置内存预算时不使用
     :return: 解码结果的列表，包含数据和类型
     """
-    # 读取图像
-    image = cv2.imread(image_path)
-    # 增强图像
-    image = enhance_image(image, alpha=alpha, beta=beta, scale_factor=scale_factor)
-    # 获取图像的高度和宽度
-    height, width = image.shape[:2]
-    # 初始化一个集合来存储解码结果，避免重复
-    decoded_results = set()
-    # 计算重叠步长
-    step_size = int(slice_width * (1 - overlap_percent))
-    # 从左到右逐个切片并尝试解码
-    for x in range(0, width, step_size):
-        # 定义切片的右边界
-        x_end = min(x + slice_width, width)
-        # 提取图像的切片
-        slice_img = image[0:height, x:x_end]
-        # 解码切片
-        barcodes = decode_barcode(slice_img)
-        # 如果解码成功，将结果添加到集合中
-        for barcode in barcodes:
-            barcode_data = barcode.data.decode('utf-8')
-            barcode_type = barcode.type
-            decoded_results.add((barcode_data, barcode_type))
+    if cache is not None:
+        cache_key = cache.make_key('横向移动识别', image_path, {
+            'slice_width': slice_width, 'overlap_percent': overlap_percent, 'alpha': alpha,
+            'beta': beta, 'scale_factor': scale_factor, 'localize': localize, 'backend': backend,
+            **({'memory_budget': memory_budget} if memory_budget is not None else {}),
+            **({'page': page} if page else {})})
+        with stage('cache'):
+            cached_results = cache.get(cache_key)
+        if cached_results is not None:
+            if stats is not None:
+                stats.update({'slices': 0, 'decode_calls': 0, 'slice_loop_seconds': 0.0,
+                              'peak_traced_bytes': 0, 'slice_loop_peak_bytes': 0, 'cached': True})
+            print(f"Cache hit: {len(cached_results)} barcode(s).")
+            for barcode_data, barcode_type in cached_results:
+                if on_result is not None:
+                    on_result(barcode_data, barcode_type)
+            if on_progress is not None:
+                on_progress(1, 1, 0.0, 0.0)
+            return [tuple(result) for result in cached_results]
+    # 需要统计时用 tracemalloc 记录分配（NumPy 和 OpenCV 返回的数组都会被记录），调用方已开启时沿用
+    trace_allocations = stats is not None and not tracemalloc.is_tracing()
+    if trace_allocations:
+        tracemalloc.start()
+    try:
+        if stats is not None:
+            tracemalloc.reset_peak()
+        decoded_results, cancelled = decode_slices(image_path, slice_width, overlap_percent, alpha, beta, scale_factor,
+                                                   localize, backend, stats, memory_budget, page,
+                                                   on_result, on_progress, should_stop, image_cache)
+    finally:
+        if trace_allocations:
+            tracemalloc.stop()  # 出错时也停止，避免整个进程一直带着分配记录
+    if cache is not None and not cancelled:
+        with stage('cache'):
+            cache.put(cache_key, list(decoded_results))  # 取消时只有部分结果，不写入缓存
     return list(decoded_results)
 # 示例调用
-image_path = '1742882753632.jpg'
-results = process_image(
-    image_path, 
-    slice_width=10, 
-    overlap_percent=0.2, 
-    alpha=1.5, 
-    beta=50, 
-    scale_factor=2.0
-)
-# 打印解码结果
-for data, barcode_type in results:
-    print(f"Data: {data}, Type: {barcode_type}")
+if __name__ == '__main__':
+    image_path = '1742882753632.jpg'
+    results = process_image(
+        image_path, 
+        slice_width=10, 
+        overlap_percent=0.2, 
+        alpha=1.5, 
+        beta=50, 
+        scale_factor=2.0
+    )
+    # 打印解码结果
+    for data, barcode_type in results:
+        print(f"Data: {data}, Type: {barcode_type}")
 
 """
 参数说明：
@@ -87,4 +308,12 @@ for data, barcode_type in results:
 - alpha: 对比度控制，浮点数，范围为1.0到3.0，默认为1.5。
 - beta: 亮度控制，整数类型，范围为0到100，默认为50。
 - scale_factor: 缩放因子，浮点数，默认为2.0。
+- localize: 是否先定位候选区域并跳过空白切片，布尔值，默认为False。
+- cache: 结果缓存（结果缓存.ResultCache），默认为None，即不使用缓存。
+- backend: 解码后端，'pyzbar'（默认）或 'scanline'（NumPy 批量解码 Code128，失败的切片再用 pyzbar）。
+- stats: 传入字典时写入 slices、decode_calls、slice_loop_seconds、cached，以及 tracemalloc 统计的 peak_traced_bytes 和 slice_loop_peak_bytes；缓存命中时计数为 0，cached 为 True。
+- memory_budget: 内存预算（字节），默认为None即整幅读取；设置后按条带/瓦片读取大图，按竖直窗口增强放大。
+- page: 多页 TIFF 等多帧图像的页码，从0开始，默认为0。
+- on_result / on_progress / should_stop: 界面线程用的回调，分别在发现新条码、处理完每个切片、每个切片前调用。
+- image_cache: 已解码图像缓存（图像缓存.ImageCache），默认为None。
 """
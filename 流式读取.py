@@ -0,0 +1,333 @@
+"""
+大图流式读取：按条带或瓦片按需解码灰度像素，不在内存中保留整幅原图，更不会构建整幅放大图。
+
+- 条带/瓦片 TIFF（libtiff 支持的任意压缩）：只把所需的条带或瓦片拼成一个小 TIFF 交给 Pillow 解码
+- JPEG：按内存预算选择 1、1/2、1/4、1/8 的 DCT 降采样解码
+- 其它格式（PNG 等）：PNG 每一行依赖上一行的滤波结果，Pillow 的解码器又不能中途续解，
+  只能按原分辨率直接解码成灰度图，超出内存预算时抛出 MemoryBudgetError
+
+多页 TIFF 等多帧图像按页读取：iter_pages() 只读取各页的目录，像素在处理到该页时才解码。
+
+内存预算只约束像素缓冲区（条带缓存、区块及其放大结果），不含解释器和 OpenCV/Qt 等库本身的常驻内存。
+"""
+import io
+import math
+import struct
+import sys
+import cv2  # 用于生成定位用的缩略图
+import numpy as np
+from PIL import Image, TiffImagePlugin
+
+try:
+    import resource  # 仅 Unix 可用，用于读取进程的峰值内存
+except ImportError:
+    resource = None
+
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024  # 默认内存预算（字节）
+BAND_SHARE = 0.25  # 内存预算中留给条带缓存的比例
+PIECE_SHARE = 0.125  # 条带分段解码，每段不超过条带的这一比例（Pillow 解码时会临时占用数倍于结果的内存）
+# 拼小 TIFF 时不复制的标签：条带/瓦片位置，以及指向其它 IFD 的偏移
+_SKIPPED_TIFF_TAGS = {273, 279, 324, 325, 330, 34665, 34853, 40965}
+
+class MemoryBudgetError(MemoryError):
+    """图像或区块在内存预算内无法处理"""
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB），不支持的平台返回 None"""
+    # Linux 上 ru_maxrss 会带上 fork 时父进程的峰值，优先读取随 exec 重置的 VmHWM
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)  # macOS 以字节为单位，其余以 KB 为单位
+
+def reduced_box(box, reduction):
+    """原图坐标的区域换算到降采样后的坐标（向外取整）"""
+    left, top, right, bottom = box
+    return left // reduction, top // reduction, -(-right // reduction), -(-bottom // reduction)
+
+# ---------------------------- 读取器 ----------------------------
+class TiffBandReader:
+    """按条带或瓦片读取 TIFF，只解码与请求区域相交的块，并缓存最近一次解码的条带"""
+    reduction = 1
+
+    def __init__(self, path, band_bytes, page=0):
+        """
+        :param path: TIFF 文件路径
+        :param band_bytes: 一次解码的条带最多占用的字节数
+        :param page: 页码（从0开始），各页的条带位置记录在各自的目录中
+        """
+        image = Image.open(path)
+        if page:
+            image.seek(page)
+        tags = image.tag_v2
+        if getattr(tags, '_bigtiff', False) or tags.get(284, 1) != 1:
+            raise ValueError("BigTIFF and planar TIFF are not streamed")
+        self.path = path
+        self.size = image.size
+        self.tags = tags
+        self.band_bytes = band_bytes
+        width, height = self.size
+        if 322 in tags:
+            self.tiled = True
+            self.block_width, self.block_height = tags[322], tags[323]
+            self.offsets, self.byte_counts = tags[324], tags[325]
+        else:
+            self.tiled = False
+            self.block_width, self.block_height = width, min(height, tags.get(278, height))
+            self.offsets, self.byte_counts = tags[273], tags[279]
+        self.block_columns = math.ceil(width / self.block_width)
+        self.block_rows = math.ceil(height / self.block_height)
+        if len(self.offsets) != self.block_columns * self.block_rows:
+            raise ValueError("Unexpected TIFF block layout")
+        self._band = None  # (区域, 灰度数组) 最近一次解码的块
+        image.close()
+
+    @property
+    def resident_bytes(self):
+        """读取器常驻的像素字节数（最近一次解码的条带）"""
+        return 0 if self._band is None else self._band[1].nbytes
+
+    @property
+    def reserved_bytes(self):
+        """区块处理时应为读取器预留的字节数：条带缓存，加上分段解码时 Pillow 的临时内存"""
+        return int(self.band_bytes * (1 + 4 * PIECE_SHARE))
+
+    @property
+    def band_rows(self):
+        """整幅宽度的一个条带缓存能容纳的行数，区块（含边距）不高于它时，同一行的区块共用一次解码"""
+        rows_per_band = max(1, self.band_bytes // max(1, self.block_columns * self.block_width * self.block_height))
+        return rows_per_band * self.block_height
+
+    def _decode_blocks(self, row_start, row_end, column_start, column_end):
+        """分段解码指定范围的条带或瓦片，写入同一个灰度数组"""
+        width, height = self.size
+        span_width = min(column_end * self.block_width, width) - column_start * self.block_width
+        band_top = row_start * self.block_height
+        output = np.empty((min(row_end * self.block_height, height) - band_top, span_width), dtype=np.uint8)
+        rows_per_piece = max(1, int(self.band_bytes * PIECE_SHARE) // max(1, span_width * self.block_height))
+        for row in range(row_start, row_end, rows_per_piece):
+            piece = self._decode_piece(row, min(row_end, row + rows_per_piece), column_start, column_end)
+            piece_top = row * self.block_height - band_top
+            output[piece_top:piece_top + piece.shape[0]] = piece
+        return output
+
+    def _decode_piece(self, row_start, row_end, column_start, column_end):
+        """把指定范围的条带或瓦片拼成一个小 TIFF 并解码为灰度数组"""
+        width, height = self.size
+        with open(self.path, 'rb') as f:
+            chunks = []
+            for row in range(row_start, row_end):
+                for column in range(column_start, column_end):
+                    index = row * self.block_columns + column
+                    f.seek(self.offsets[index])
+                    chunks.append(f.read(self.byte_counts[index]))
+        directory = TiffImagePlugin.ImageFileDirectory_v2(prefix=self.tags.prefix)
+        for tag, value in self.tags.items():
+            if tag in _SKIPPED_TIFF_TAGS:
+                continue
+            if tag in self.tags.tagtype:
+                directory.tagtype[tag] = self.tags.tagtype[tag]
+            directory[tag] = value
+        directory[256] = min(column_end * self.block_width, width) - column_start * self.block_width
+        directory[257] = min(row_end * self.block_height, height) - row_start * self.block_height
+        offset_tag, count_tag = (324, 325) if self.tiled else (273, 279)
+        relative_offsets = []
+        position = 0
+        for chunk in chunks:
+            relative_offsets.append(position)
+            position += len(chunk)
+        directory.tagtype[offset_tag] = directory.tagtype[count_tag] = 4  # LONG
+        directory[count_tag] = tuple(len(chunk) for chunk in chunks)
+        endian = '<' if self.tags.prefix == b'II' else '>'
+        header = self.tags.prefix + struct.pack(endian + 'HI', 42, 8)
+        if self.tiled:
+            # 瓦片偏移不会被 Pillow 自动修正，先按占位值算出目录长度，再写入绝对偏移
+            directory[offset_tag] = tuple(relative_offsets)
+            data_start = len(header) + len(directory.tobytes(len(header)))
+            directory[offset_tag] = tuple(data_start + offset for offset in relative_offsets)
+        else:
+            directory[offset_tag] = tuple(relative_offsets)  # 条带偏移由 Pillow 自动加上目录长度
+        blob = header + directory.tobytes(len(header)) + b''.join(chunks)
+        with Image.open(io.BytesIO(blob)) as band:
+            if band.mode != 'L':
+                band = band.convert('L')
+            return np.frombuffer(band.tobytes(), dtype=np.uint8).reshape(band.height, band.width)
+
+    def read(self, box):
+        """
+        读取原图坐标下的灰度区域，按条带分批解码，单次解码不超过 band_bytes
+        :param box: (left, top, right, bottom)
+        :return: 形状为 (bottom - top, right - left) 的 uint8 数组
+        """
+        left, top, right, bottom = box
+        if self._band is not None:
+            cached_box, cached = self._band
+            if cached_box[0] <= left and cached_box[1] <= top and right <= cached_box[2] and bottom <= cached_box[3]:
+                return cached[top - cached_box[1]:bottom - cached_box[1], left - cached_box[0]:right - cached_box[0]]
+        column_start = left // self.block_width
+        column_end = -(-right // self.block_width)
+        span_width = (column_end - column_start) * self.block_width
+        rows_per_band = max(1, self.band_bytes // max(1, span_width * self.block_height))
+        output = None
+        row = top // self.block_height
+        last_row = -(-bottom // self.block_height)
+        self._band = None  # 先释放旧条带再解码，两者不同时占用内存
+        while row < last_row:
+            # 在预算内尽量多解码几行块，留给后续相邻的请求命中缓存
+            row_end = min(self.block_rows, row + rows_per_band)
+            band_left = column_start * self.block_width
+            band_top = row * self.block_height
+            band = self._decode_blocks(row, row_end, column_start, column_end)
+            self._band = ((band_left, band_top, band_left + band.shape[1], band_top + band.shape[0]), band)
+            if row == top // self.block_height and row_end >= last_row:
+                # 一个条带就覆盖了整个请求，直接返回视图
+                return band[top - band_top:bottom - band_top, left - band_left:right - band_left]
+            if output is None:
+                output = np.empty((bottom - top, right - left), dtype=np.uint8)
+            copy_top = max(top, band_top)
+            copy_bottom = min(bottom, band_top + band.shape[0])
+            output[copy_top - top:copy_bottom - top] = band[copy_top - band_top:copy_bottom - band_top,
+                                                            left - band_left:right - band_left]
+            row = row_end
+        return output
+
+    def iter_bands(self):
+        """从上到下逐条带产出 (top, 灰度数组)，用于统计均值和生成缩略图"""
+        width, height = self.size
+        rows_per_band = max(1, self.band_bytes // max(1, width * self.block_height)) * self.block_height
+        for top in range(0, height, rows_per_band):
+            yield top, self.read((0, top, width, min(height, top + rows_per_band)))
+
+    def release(self):
+        self._band = None
+
+class DecodedImageReader:
+    """整幅解码成灰度图后按区域切片；JPEG 按内存预算使用 DCT 降采样"""
+
+    def __init__(self, path, memory_budget, page=0):
+        """
+        :param path: 图像文件路径
+        :param memory_budget: 内存预算（字节），灰度图最多占用其一半，其余留给区块处理
+        :param page: 多帧图像的页码（从0开始）
+        """
+        image = Image.open(path)
+        if page:
+            image.seek(page)
+        self.path = path
+        self.size = image.size
+        width, height = self.size
+        allowed = memory_budget // 2
+        self.reduction = 1
+        if image.format == 'JPEG':
+            # 找到灰度图能放进预算的最小降采样倍数
+            while self.reduction < 8 and 2 * math.ceil(width / self.reduction) * math.ceil(height / self.reduction) > allowed:
+                self.reduction *= 2
+            image.draft('L', (math.ceil(width / self.reduction), math.ceil(height / self.reduction)))
+            self.reduction = max(1, round(width / image.size[0]))
+            decoded_bytes = 2 * image.size[0] * image.size[1]  # 解码结果和转换后的灰度图
+        else:
+            decoded_bytes = width * height * (len(image.getbands()) + 1)  # 原模式解码后再转灰度，两份同时存在
+        if decoded_bytes > allowed:
+            raise MemoryBudgetError(f"{path} needs about {decoded_bytes / 2**20:.0f} MB to decode, "
+                                    f"over half of the {memory_budget / 2**20:.0f} MB budget; "
+                                    f"convert it to a striped or tiled TIFF to stream it")
+        if self.reduction > 1:
+            print(f"Decoding {path} at 1/{self.reduction} resolution to fit the memory budget")
+        self.gray = np.asarray(image.convert('L'))
+        image.close()
+
+    @property
+    def resident_bytes(self):
+        return self.gray.nbytes
+
+    @property
+    def reserved_bytes(self):
+        return self.gray.nbytes
+
+    band_rows = None  # 整幅常驻内存，区块高度不受条带限制
+
+    def read(self, box):
+        """读取原图坐标下的区域，降采样解码时返回的数组按 reduction 缩小"""
+        left, top, right, bottom = reduced_box(box, self.reduction)
+        return self.gray[top:bottom, left:right]
+
+    def iter_bands(self):
+        yield 0, self.gray
+
+    def release(self):
+        pass
+
+def open_reader(path, memory_budget=DEFAULT_MEMORY_BUDGET, page=0):
+    """
+    为图像选择流式读取器：条带/瓦片 TIFF 按块解码，其余格式整幅解码为灰度图（JPEG 可降采样）
+    :param page: 多帧图像的页码（从0开始）
+    :return: 提供 size、reduction、reserved_bytes、read(box)、iter_bands()、release() 的读取器
+    """
+    with Image.open(path) as image:
+        image_format = image.format
+    if image_format == 'TIFF':
+        try:
+            return TiffBandReader(path, int(memory_budget * BAND_SHARE), page)
+        except (KeyError, ValueError) as e:
+            print(f"Cannot stream {path} by blocks ({e}), decoding it whole")
+    return DecodedImageReader(path, memory_budget, page)
+
+def image_statistics(reader, max_side=800):
+    """
+    逐条带扫描一遍，返回 (灰度均值, 缩略图)；缩略图长边不超过 max_side，用于候选区域定位
+    :return: (均值, 缩略图数组, 缩略图相对原图的缩小比例)
+    """
+    width, height = reader.size
+    ratio = min(1.0, max_side / float(max(width, height)))
+    total = 0
+    count = 0
+    rows = []
+    for top, band in reader.iter_bands():
+        total += int(band.sum(dtype=np.uint64))
+        count += band.size
+        band_height = max(1, int(round(band.shape[0] * reader.reduction * ratio)))
+        rows.append(cv2.resize(band, (max(1, int(width * ratio)), band_height), interpolation=cv2.INTER_AREA))
+        del band  # 读取下一条带前释放引用，读取器才能先释放旧条带
+    return total / float(max(1, count)), np.vstack(rows), ratio
+
+# ---------------------------- 多页 ----------------------------
+def iter_pages(path):
+    """
+    逐页产出多帧图像（多页 TIFF、GIF 等）的页码，只读取各页的目录，不解码像素；单帧图像只产出 0
+    """
+    with Image.open(path) as image:
+        page = 0
+        while True:
+            yield page
+            page += 1
+            try:
+                image.seek(page)
+            except EOFError:
+                return
+
+def page_count(path):
+    """图像的页数，单帧图像为 1"""
+    with Image.open(path) as image:
+        return getattr(image, 'n_frames', 1)
+
+def read_gray_page(path, page=0):
+    """
+    按灰度读取一页，第一页与 cv2.imread(path, cv2.IMREAD_GRAYSCALE) 相同；
+    其余页由 Pillow 定位后转换，与流式读取器的灰度转换一致
+    :return: uint8 灰度数组，读取失败时返回 None
+    """
+    if page == 0:
+        return cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    try:
+        with Image.open(path) as image:
+            image.seek(page)
+            return np.array(image.convert('L'))
+    except (OSError, EOFError):
+        return None
@@ -1,52 +1,66 @@
+import argparse
 import os
 import random
 import string
+import sys
 import barcode
 from barcode.writer import ImageWriter
 from PIL import Image
-def generate_random_number(length=12):
-    """生成指定长度的随机数字字符串"""
-    return ''.join(random.choices(string.digits, k=length))
-# 生成随机条形码数据的数量
-num_barcodes = 4  # 可根据需要修改
-# 随机生成条形码数据列表
-data_list = [generate_random_number() for _ in range(num_barcodes)]
-# 获取当前工作目录
-current_directory = os.getcwd()
-# 用于保存所有生成的条形码图片路径列表
-image_paths = []
-# 生成条形码并保存到本地
-for data in data_list:
-    # 使用 Code128 条形码格式
+from 条码生成引擎 import render_label  # 按整数模块宽度直接渲染，不经过磁盘
+from 标签校验 import LabelVerifier, batch_passed, add_verify_arguments  # 指定 --verify 时渲染后立即解码校验
+def generate_random_number(length=12, rng=random):
+    """生成指定长度的随机数字字符串，传入 random.Random 实例时可复现"""
+    return ''.join(rng.choices(string.digits, k=length))
+def render_code128(data, writer_options=None):
+    """在内存中渲染 Code128 条形码，返回 PIL 图像，不写入磁盘"""
     code128 = barcode.get('code128', data, writer=ImageWriter())
-    # 注意：传入不带扩展名的文件名，barcode 库会自动追加 ".png"
-    filename = f"{data}"
-    filepath = os.path.join(current_directory, filename)
-    saved_filepath = code128.save(filepath)  # 保存条形码图片，返回保存后的完整文件路径
-    print(f"条形码 {data} 已保存为: {saved_filepath}")
-    image_paths.append(saved_filepath)
-# 加载所有图片并合并为一张竖向拼接的大图片
-barcode_images = []
-# 为确保每个条形码尺寸统一，这里设置每个条形码的目标宽度和高度
-barcode_width = 300
-barcode_height = 150
-for path in image_paths:
-    img = Image.open(path)
-    img = img.resize((barcode_width, barcode_height))  # 调整大小
-    barcode_images.append(img)
-# 设置拼接时的间距
-padding = 10
-# 计算合并后图片的总尺寸
-total_width = barcode_width  # 因为竖向拼接，宽度就是单个图片的宽度
-total_height = len(barcode_images) * barcode_height + (len(barcode_images) - 1) * padding
-# 创建一张空白图片，用于粘贴所有条形码
-combined_image = Image.new('RGB', (total_width, total_height), 'white')
-# 将所有条形码图片竖向拼接
-y_offset = 0
-for img in barcode_images:
-    combined_image.paste(img, (0, y_offset))
-    y_offset += barcode_height + padding
-# 保存最终合并的图片
-combined_filepath = os.path.join(current_directory, "combined_barcodes_vertical.png")
-combined_image.save(combined_filepath)
-print(f"所有条形码已竖向合并并保存为: {combined_filepath}")
+    return code128.render(writer_options).convert('RGB')
+def combine_vertical(images, barcode_width=None, barcode_height=None, padding=10):
+    """
+    把条形码图像竖向拼接成一张图片，适合少量条码；大批量请用 标签排版.py 逐页排版
+    :param barcode_width: 统一缩放到的宽度；None 表示保持原尺寸，缩放会使条边模糊，只在必须统一尺寸时使用
+    :param barcode_height: 统一缩放到的高度，与 barcode_width 一起使用
+    """
+    if barcode_width is not None:
+        images = [img.resize((barcode_width, barcode_height), Image.NEAREST) for img in images]
+    # 计算合并后图片的总尺寸：宽度取最宽的条码，较窄的条码左对齐，右侧留白也是静区
+    total_width = max(img.width for img in images)
+    total_height = sum(img.height for img in images) + (len(images) - 1) * padding
+    # 创建一张空白图片，用于粘贴所有条形码
+    combined_image = Image.new('RGB', (total_width, total_height), 'white')
+    # 将所有条形码图片竖向拼接
+    y_offset = 0
+    for img in images:
+        combined_image.paste(img, (0, y_offset))
+        y_offset += img.height + padding
+    return combined_image
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成随机 Code128 条形码并竖向拼接成一张图片")
+    parser.add_argument('--count', type=int, default=4, help="条形码数量")
+    parser.add_argument('--output', default=os.path.join(os.getcwd(), "combined_barcodes_vertical.png"), help="拼接后图片的保存路径")
+    add_verify_arguments(parser)
+    args = parser.parse_args(argv)
+    # 随机生成条形码数据列表
+    data_list = [generate_random_number() for _ in range(args.count)]
+    # 在内存中按 2 像素模块宽度渲染，拼接时不再缩放
+    labels = [render_label(data, module_width=2, height=100, text=True) for data in data_list]
+    summary = None
+    if args.verify:
+        # 每个条码生成后立即读回，确认能识别出相同的数据
+        verifier = LabelVerifier(args.verify_jobs or 1, args.verify_backend, args.verify_report)
+        try:
+            for _ in verifier.labels(((data, label.shape[1], label.shape[0], label.tobytes())
+                                      for data, label in zip(data_list, labels)), 'raw'):
+                pass
+        finally:
+            summary = verifier.finish()
+    images = [Image.fromarray(label) for label in labels]
+    combined_image = combine_vertical(images)
+    # 保存最终合并的图片
+    combined_image.save(args.output)
+    print(f"所有条形码已竖向合并并保存为: {args.output}")
+    if summary is not None and not batch_passed(summary, args.max_failure_rate):
+        return 1
+    return 0
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,63 +1,34 @@
 import sys
 from PyQt5.QtWidgets import (QApplication, QWidget, QLabel, QVBoxLayout, QHBoxLayout, QPushButton,
-                             QFileDialog, QSlider, QLineEdit, QFormLayout, QTabWidget, QTextEdit)
+                             QFileDialog, QSlider, QLineEdit, QFormLayout, QTabWidget, QTextEdit, QCheckBox)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from PyQt5.QtGui import QPixmap
-import cv2
-from pyzbar import pyzbar
 import os
 import traceback
+from 结果缓存 import ResultCache  # 持久化结果缓存
+from 参数调优 import load_profile  # 自动调优保存的参数
+import 横向移动识别  # 切片解码的共用实现
+from 阶段计时 import stage, scan_timings  # 各阶段计时（BARCODE_TIMING=1 开启）
+from 流式读取 import iter_pages, page_count  # 多页 TIFF 按页读取
+from 图像缓存 import shared_cache, load_preview  # 预览按显示尺寸解码，整幅灰度图只解码一次
 
 # --------------------------- 图像处理函数 ---------------------------
 
-def enhance_image(image, alpha=1.5, beta=50, scale_factor=2.0):
-    try:
-        print("Enhancing image...")
-        enhanced_image = cv2.convertScaleAbs(image, alpha=alpha, beta=beta)
-        height, width = enhanced_image.shape[:2]
-        enlarged_image = cv2.resize(enhanced_image, (int(width * scale_factor), int(height * scale_factor)), interpolation=cv2.INTER_LINEAR)
-        print("Image enhanced successfully.")
-        return enlarged_image
-    except Exception as e:
-        print("Error in enhance_image:", e)
-        traceback.print_exc()
-        return image
-
-def decode_barcode(image):
-    try:
-        print("Decoding barcode...")
-        barcodes = pyzbar.decode(image)
-        print(f"Found {len(barcodes)} barcodes.")
-        return barcodes
-    except Exception as e:
-        print("Error in decode_barcode:", e)
-        traceback.print_exc()
-        return []
-
-def process_image(image_path, slice_width=10, overlap_percent=0.2, alpha=1.5, beta=50, scale_factor=2.0):
+def process_image(image_path, slice_width=10, overlap_percent=0.2, alpha=1.5, beta=50, scale_factor=2.0,
+                  on_result=None, on_progress=None, should_stop=None, cache=None, backend='pyzbar', page=0, image_cache=None):
+    # 切片、解码、去重与 横向移动识别.process_image 共用同一实现（零拷贝切片、各阶段计时、结果缓存）
+    # on_result(data, type) 在发现新条码时立即调用，on_progress(已完成切片数, 总数, 已用秒数, 预计剩余秒数) 每处理完一个切片调用
+    # should_stop() 返回True时在下一个切片前停止，并返回已得到的结果
+    # 界面线程中出错时输出错误并返回空列表
     try:
         print(f"Processing image: {image_path}")
         if not os.path.exists(image_path):
             print(f"File does not exist: {image_path}")
             return []
-        image = cv2.imread(image_path)
-        if image is None:
-            print(f"Failed to load image: {image_path}")
-            return []
-        image = enhance_image(image, alpha=alpha, beta=beta, scale_factor=scale_factor)
-        height, width = image.shape[:2]
-        decoded_results = set()
-        step_size = int(slice_width * (1 - overlap_percent))
-        for x in range(0, width, step_size):
-            x_end = min(x + slice_width, width)
-            slice_img = image[0:height, x:x_end]
-            barcodes = decode_barcode(slice_img)
-            for barcode in barcodes:
-                barcode_data = barcode.data.decode('utf-8')
-                barcode_type = barcode.type
-                decoded_results.add((barcode_data, barcode_type))
-        print(f"Decoding complete. Found {len(decoded_results)} unique barcodes.")
-        return list(decoded_results)
+        results = 横向移动识别.process_image(image_path, slice_width, overlap_percent, alpha, beta, scale_factor,
+                                             cache=cache, backend=backend, page=page, on_result=on_result,
+                                             on_progress=on_progress, should_stop=should_stop, image_cache=image_cache)
+        print(f"Decoding complete. Found {len(results)} unique barcodes.")
+        return results
     except Exception as e:
         print("Error in process_image:", e)
         traceback.print_exc()
@@ -67,9 +38,15 @@ def process_image(image_path, slice_width=10, overlap_percent=0.2, alpha=1.5, be
 
 class BarcodeScannerThread(QThread):
     resultReady = pyqtSignal(list)
+    resultFound = pyqtSignal(str, str, int)  # 每发现一个新条码就发出 (数据, 类型, 页码)
+    progressChanged = pyqtSignal(int, int, float, float)  # 已完成切片数、总数、已用秒数、预计剩余秒数
+    pageFinished = pyqtSignal(int, int, list)  # 多页图像每完成一页发出 (页码, 总页数, 该页结果)
 
-    def __init__(self, imagePath, slice_width, overlap_percent, alpha, beta, scale_factor):
+    def __init__(self, imagePath, slice_width, overlap_percent, alpha, beta, scale_factor, cache=None, backend='pyzbar', image_cache=None):
         super().__init__()
+        self.cache = cache
+        self.image_cache = image_cache
+        self.backend = backend
         self.imagePath = imagePath
         self.slice_width = slice_width
         self.overlap_percent = overlap_percent
@@ -79,14 +56,35 @@ class BarcodeScannerThread(QThread):
 
     def run(self):
         print("Thread started for barcode scanning.")
-        results = process_image(self.imagePath, self.slice_width, self.overlap_percent, self.alpha, self.beta, self.scale_factor)
-        self.resultReady.emit(results)
+        # 逐页处理多页图像，每页只在处理到时解码；结果为 (数据, 类型, 页码)
+        total_pages = page_count(self.imagePath) if os.path.exists(self.imagePath) else 1
+        results = []
+        for page in iter_pages(self.imagePath) if total_pages > 1 else [0]:
+            if self.isInterruptionRequested():
+                break
+            with scan_timings('BarcodeScannerThread.run', self.imagePath):
+                page_results = process_image(self.imagePath, self.slice_width, self.overlap_percent, self.alpha, self.beta,
+                                             self.scale_factor,
+                                             on_result=lambda data, barcode_type, page=page: self.resultFound.emit(data, barcode_type, page),
+                                             on_progress=self.progressChanged.emit,
+                                             should_stop=self.isInterruptionRequested, cache=self.cache,
+                                             backend=self.backend, page=page, image_cache=self.image_cache)
+            results.extend((data, barcode_type, page) for data, barcode_type in page_results)
+            if total_pages > 1:
+                self.pageFinished.emit(page, total_pages, page_results)
+        if not self.isInterruptionRequested():
+            self.resultReady.emit(results)
 
 # --------------------------- 主应用程序类 ---------------------------
 
 class BarcodeScannerApp(QWidget):
     def __init__(self):
         super().__init__()
+        self.scanner_thread = None  # 当前的扫描线程
+        self.retired_threads = []  # 已取消、等待退出的扫描线程
+        self.result_cache = ResultCache()  # 按图像内容和参数缓存的结果
+        self.page_total = 1  # 当前图像的页数
+        self.pages_done = 0  # 本次扫描已完成的页数
         self.init_ui()
 
     def init_ui(self):
@@ -104,6 +102,7 @@ class BarcodeScannerApp(QWidget):
         # 设置选项卡
         self.setup_main_tab()
         self.setup_info_tab()
+        self.apply_profile()  # 载入自动调优保存的参数
 
         # 主布局
         main_layout = QVBoxLayout()
@@ -147,6 +146,9 @@ class BarcodeScannerApp(QWidget):
         self.overlap_percent_input = QLineEdit('0.2')
         form_layout.addRow('重叠比例:', self.overlap_percent_input)
 
+        self.scanline_checkbox = QCheckBox('NumPy 批量解码 Code128，失败时用 pyzbar')
+        form_layout.addRow('扫描线解码:', self.scanline_checkbox)
+
         layout.addLayout(form_layout)
 
         # 按钮布局
@@ -159,8 +161,17 @@ class BarcodeScannerApp(QWidget):
         self.scan_button.clicked.connect(self.scan_barcode)
         button_layout.addWidget(self.scan_button)
 
+        self.cancel_button = QPushButton('取消扫描')
+        self.cancel_button.clicked.connect(self.cancel_scan)
+        self.cancel_button.setEnabled(False)
+        button_layout.addWidget(self.cancel_button)
+
         layout.addLayout(button_layout)
 
+        # 进度显示标签
+        self.progress_label = QLabel('')
+        layout.addWidget(self.progress_label)
+
         # 结果显示标签
         self.results_label = QLabel('结果将在这里显示。')
         layout.addWidget(self.results_label)
@@ -181,7 +192,10 @@ class BarcodeScannerApp(QWidget):
             "- Beta (亮度): 调整图像的亮度。\n"
             "- 缩放因子: 缩放图像以便更好地检测条形码。\n"
             "- 切片宽度: 条形码扫描时的图像切片宽度。\n"
-            "- 重叠比例: 切片之间的重叠百分比。\n\n"
+            "- 重叠比例: 切片之间的重叠百分比。\n"
+            "- 扫描线解码: 一次性批量解码所有切片中的 Code128，只有疑似含有条码但未解出的切片才调用 pyzbar。\n"
+            "- 调优配置: 启动时自动载入 参数调优.py --target slice 保存的参数。\n"
+            "- 多页图像: 多页 TIFF 逐页解码扫描，结果标注页码（从0开始）。\n\n"
             "使用方法:\n"
             "1. 使用“加载图像”按钮加载图像。\n"
             "2. 调整参数以增强图像。\n"
@@ -191,19 +205,37 @@ class BarcodeScannerApp(QWidget):
         self.info_tab.setLayout(layout)
         print("Info tab set up.")
 
+    def apply_profile(self):
+        """把参数调优保存的 slice 配置填入滑块和输入框，没有配置时保持默认值"""
+        profile = load_profile('slice')
+        if profile is None:
+            return
+        self.alpha_slider.setValue(int(round(profile['alpha'] * 10)))
+        self.beta_slider.setValue(int(profile['beta']))
+        self.scale_factor_slider.setValue(int(round(profile['scale_factor'] * 10)))
+        self.slice_width_input.setText(str(profile['slice_width']))
+        self.overlap_percent_input.setText(str(profile['overlap_percent']))
+        self.scanline_checkbox.setChecked(profile['backend'] == 'scanline')
+        self.progress_label.setText('已载入调优配置。')
+        print(f"Loaded tuned profile: {profile}")
+
     def load_image(self):
         print("Loading image...")
         # 加载图像文件
         options = QFileDialog.Options()
-        file_name, _ = QFileDialog.getOpenFileName(self, "打开图像文件", "", "Images (*.png *.xpm *.jpg);;All Files (*)", options=options)
+        file_name, _ = QFileDialog.getOpenFileName(self, "打开图像文件", "", "Images (*.png *.xpm *.jpg *.tif *.tiff);;All Files (*)", options=options)
         if file_name:
             if not os.path.exists(file_name):
                 self.results_label.setText('文件不存在。')
                 print(f"File does not exist: {file_name}")
                 return
             self.image_path = file_name
-            pixmap = QPixmap(file_name)
-            self.image_label.setPixmap(pixmap.scaled(self.image_label.size(), Qt.KeepAspectRatio))
+            self.page_total = page_count(file_name)  # 多页图像逐页扫描
+            # 预览按标签尺寸解码，整幅灰度图在后台预取，扫描时直接复用
+            pixmap = load_preview(file_name, self.image_label.width(), self.image_label.height())
+            if pixmap is not None:
+                self.image_label.setPixmap(pixmap)
+            shared_cache.prefetch(file_name, kind='gray')
             print(f"Image loaded: {file_name}")
         else:
             self.results_label.setText('未选择图像文件。')
@@ -218,22 +250,69 @@ class BarcodeScannerApp(QWidget):
             scale_factor = self.scale_factor_slider.value() / 10.0
             slice_width = int(self.slice_width_input.text())
             overlap_percent = float(self.overlap_percent_input.text())
+            backend = 'scanline' if self.scanline_checkbox.isChecked() else 'pyzbar'
 
             # 使用线程处理图像以避免界面卡顿
-            self.thread = BarcodeScannerThread(self.image_path, slice_width, overlap_percent, alpha, beta, scale_factor)
-            self.thread.resultReady.connect(self.display_results)
-            self.thread.start()
+            # 新的扫描抢占正在运行的扫描
+            self.cancel_scan()
+            self.live_results = []
+            self.pages_done = 0
+            self.scanner_thread = BarcodeScannerThread(self.image_path, slice_width, overlap_percent, alpha, beta, scale_factor, self.result_cache, backend,
+                                                       shared_cache)
+            self.scanner_thread.resultReady.connect(self.display_results)
+            self.scanner_thread.resultFound.connect(self.append_result)
+            self.scanner_thread.progressChanged.connect(self.update_progress)
+            self.scanner_thread.pageFinished.connect(self.page_finished)
+            self.scanner_thread.finished.connect(lambda: self.cancel_button.setEnabled(False))
+            self.scanner_thread.start()
+            self.cancel_button.setEnabled(True)
             self.results_label.setText('正在处理...')
             print("Barcode scanning thread started.")
         else:
             self.results_label.setText('未加载图像。')
             print("Image not loaded.")
 
+    def cancel_scan(self):
+        # 请求当前扫描线程停止，并断开信号以忽略过期结果
+        thread = self.scanner_thread
+        if thread is None or not thread.isRunning():
+            return
+        print("Cancelling running scan...")
+        thread.requestInterruption()
+        for signal in (thread.resultReady, thread.resultFound, thread.progressChanged, thread.pageFinished, thread.finished):
+            signal.disconnect()
+        # 保留引用直到线程退出，避免线程对象在运行中被销毁
+        self.retired_threads.append(thread)
+        thread.finished.connect(lambda: self.retired_threads.remove(thread))
+        self.scanner_thread = None
+        self.cancel_button.setEnabled(False)
+        self.progress_label.setText('扫描已取消。')
+
+    def format_result(self, data, barcode_type, page):
+        # 多页图像的结果带有页码
+        return f"第 {page} 页, 数据: {data}, 类型: {barcode_type}" if self.page_total > 1 else f"数据: {data}, 类型: {barcode_type}"
+
+    def append_result(self, data, barcode_type, page):
+        # 扫描过程中实时追加新发现的条码
+        self.live_results.append(self.format_result(data, barcode_type, page))
+        self.results_label.setText('\n'.join(self.live_results))
+
+    def page_finished(self, page, total_pages, page_results):
+        # 多页图像每完成一页更新页进度
+        self.pages_done += 1
+        print(f"Page {page}: {len(page_results)} barcode(s).")
+        self.progress_label.setText(f"已完成 {self.pages_done}/{total_pages} 页")
+
+    def update_progress(self, done, total, elapsed, eta):
+        # 显示切片进度、已用时间和预计剩余时间，多页图像同时显示页进度
+        pages = f"第 {self.pages_done + 1}/{self.page_total} 页, " if self.page_total > 1 else ""
+        self.progress_label.setText(f"{pages}进度: {done}/{total} 切片, 已用 {elapsed:.1f} 秒, 预计剩余 {eta:.1f} 秒")
+
     def display_results(self, results):
         print("Displaying results...")
         # 显示结果
         if results:
-            result_text = '\n'.join([f"数据: {data}, 类型: {barcode_type}" for data, barcode_type in results])
+            result_text = '\n'.join([self.format_result(data, barcode_type, page) for data, barcode_type, page in results])
             self.export_results(results)
             print("Results displayed.")
         else:
@@ -245,9 +324,9 @@ class BarcodeScannerApp(QWidget):
         print("Exporting results...")
         # 导出结果到文本文件
         try:
-            with open('barcode_results.txt', 'a') as file:
-                for data, barcode_type in results:
-                    file.write(f"数据: {data}, 类型: {barcode_type}\n")
+            with stage('export'), open('barcode_results.txt', 'a') as file:
+                for data, barcode_type, page in results:
+                    file.write(self.format_result(data, barcode_type, page) + "\n")
                 file.write("\n")  # 添加一个空行分隔不同的扫描结果
             print("Results exported to barcode_results.txt.")
         except Exception as e:
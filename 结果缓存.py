@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'barcode_extraction')  # 默认缓存目录
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 默认缓存上限 256MB
+# 缓存格式和解码引擎版本：预处理、定位、放大策略或结果格式变化会改变同一输入的输出，修改这些逻辑时加一，旧结果不再命中
+CACHE_VERSION = 2
+
+# ---------------------------- 缓存键 ----------------------------
+def file_digest(path, block_size=1024 * 1024):
+    """按块读取文件内容计算 SHA-256，与文件名和修改时间无关"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def params_digest(params):
+    """扫描参数的规范化哈希：键排序、元组按列表处理，参数顺序不同也得到同一个值"""
+    canonical = json.dumps(params, sort_keys=True, separators=(',', ':'), default=list)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+# ---------------------------- 结果缓存 ----------------------------
+class ResultCache:
+    """以 SQLite 持久化的解码结果缓存，按大小做 LRU 淘汰，并记录命中和未命中次数"""
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param cache_dir: 缓存目录，默认读取环境变量 BARCODE_CACHE_DIR，否则使用 ~/.cache/barcode_extraction
+        :param max_bytes: 缓存内容的总大小上限（字节）
+        """
+        self.cache_dir = cache_dir or os.environ.get('BARCODE_CACHE_DIR') or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.path = os.path.join(self.cache_dir, 'results.sqlite3')
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # 数据库连接不能跨进程传递，工作进程中重新连接
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def connection(self):
+        """按线程懒加载数据库连接：SQLite 连接只能在创建它的线程中使用，界面的每个扫描线程各自连接"""
+        local = self._local
+        if getattr(local, 'connection', None) is None or local.pid != os.getpid():
+            os.makedirs(self.cache_dir, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")  # 允许批量扫描的多个进程同时读写
+            connection.execute("CREATE TABLE IF NOT EXISTS entries ("
+                               "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                               "size INTEGER NOT NULL, last_access REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            connection.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            connection.commit()
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    def make_key(self, namespace, image_path, params):
+        """缓存键 = 版本 + 入口名 + 图像内容哈希 + 参数哈希"""
+        return f"v{CACHE_VERSION}:{namespace}:{file_digest(image_path)}:{params_digest(params)}"
+
+    def _count(self, name):
+        connection = self.connection()
+        connection.execute("INSERT INTO stats (name, value) VALUES (?, 1) "
+                           "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+        connection.commit()
+
+    def get(self, key):
+        """读取缓存，命中时更新访问时间并返回结果，未命中返回 None"""
+        connection = self.connection()
+        row = connection.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count('misses')
+            return None
+        connection.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._count('hits')
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        """写入缓存，超出大小上限时按最久未访问的顺序淘汰"""
+        payload = json.dumps(value, ensure_ascii=False)
+        connection = self.connection()
+        connection.execute("INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                           (key, payload, len(payload.encode('utf-8')), time.time()))
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total > self.max_bytes:
+            for old_key, size in connection.execute(
+                    "SELECT key, size FROM entries ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                connection.execute("DELETE FROM entries WHERE key = ?", (old_key,))
+                total -= size
+        connection.commit()
+
+    def stats(self):
+        """返回命中次数、未命中次数、条目数量和总大小"""
+        connection = self.connection()
+        counters = dict(connection.execute("SELECT name, value FROM stats").fetchall())
+        entries, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {'hits': counters.get('hits', 0), 'misses': counters.get('misses', 0),
+                'entries': entries, 'bytes': size}
+
+    def clear(self):
+        """清空所有缓存条目和计数"""
+        connection = self.connection()
+        connection.execute("DELETE FROM entries")
+        connection.execute("DELETE FROM stats")
+        connection.commit()
@@ -1,85 +1,99 @@
-from PIL import Image, ImageEnhance  # 用于图像处理和增强
-from pyzbar.pyzbar import decode  # 用于解码条形码和二维码
-# ---------------------------- 图像预处理函数 ----------------------------
-def preprocess_image(image, scale_factor):
-    """对图像进行灰度和对比度增强，并按比例放大"""
-    # 转换为灰度
-    grayscale_image = image.convert('L')
-    # 增强对比度
-    enhancer = ImageEnhance.Contrast(grayscale_image)
-    enhanced_image = enhancer.enhance(2.0)  # 增强对比度
-    # 计算新的图像尺寸
-    new_size = (int(enhanced_image.width * scale_factor), int(enhanced_image.height * scale_factor))
-    # 缩放图像到新的尺寸
-    enlarged_image = enhanced_image.resize(new_size, Image.LANCZOS)
-    return enlarged_image
-# ---------------------------- 图像裁剪函数 ----------------------------
-def crop_image(image, left, top, right, bottom):
-    """裁剪出图像中的一个块"""
-    # 定义裁剪区域
-    box = (left, top, right, bottom)
-    # 裁剪并返回图像
-    return image.crop(box)
+from PIL import Image  # 用于图像处理
+from 扫描引擎 import (make_tile_source, scan_tiles, scan_tiles_escalating, localize_tiles,
+                  ResultAggregator, to_original_position)  # 区块预处理、候选定位、并行解码与结果去重
+from 阶段计时 import stage, timed_scan  # 各阶段计时（BARCODE_TIMING=1 开启）
 # ---------------------------- 条码和二维码识别函数 ----------------------------
-def extract_barcodes_and_qrcodes(image_path, horizontal_chunks=8, vertical_steps=5, scale_factors=(1.5, 2.0, 3.0)):
-    """提取条形码和二维码，逐块处理并增强预处理"""
+def print_result(count, barcode_type, barcode_data, position, scale_factor):
+    """输出单个条码的信息"""
+    print(f"Barcode/Qrcode #{count}:")
+    print(f"Type: {barcode_type}")
+    print(f"Data: {barcode_data}")
+    print(f"Position: Left={position['left']}, Top={position['top']}, Width={position['width']}, Height={position['height']}")
+    print(f"Scale: {scale_factor}")
+    print('-' * 30)
+
+@timed_scan('extract_barcodes_and_qrcodes')
+def extract_barcodes_and_qrcodes(image_path, horizontal_chunks=8, vertical_steps=5, scale_factors=(1.5, 2.0, 3.0), roi_margin=None, workers=1, localize=False, escalate=False, cache=None):
+    """
+    提取条形码和二维码，逐块处理并增强预处理
+    :param roi_margin: 为整数时只预处理区块及其保护边距，否则整图构建金字塔
+    :param workers: 并行解码的工作进程数量
+    :param localize: 为True时先定位候选区域，跳过不含条码的区块
+    :param escalate: 为True时按缩放因子从小到大逐级尝试，区块内的候选区域都解出后不再放大；会同时开启 localize
+    :param cache: 结果缓存（ResultCache），同一图像内容和扫描参数再次处理时直接输出上次的结果
+    """
+    localize = localize or escalate  # 自适应缩放依据候选区域判断区块是否已解决
+    results = None
+    if cache is not None:
+        cache_key = cache.make_key('裁剪放大识别', image_path, {
+            'horizontal_chunks': horizontal_chunks, 'vertical_steps': vertical_steps,
+            'scale_factors': [float(s) for s in scale_factors], 'roi_margin': roi_margin,
+            'localize': localize, 'escalate': escalate})
+        with stage('cache'):
+            results = cache.get(cache_key)
+        if results is not None:
+            print(f"Cache hit: {len(results)} code(s)")
+            for count, r in enumerate(results, start=1):
+                print_result(count, r['type'], r['data'], r['position'], r['scale_factor'])
+    if results is None:
+        results = scan_tiles_once(image_path, horizontal_chunks, vertical_steps, scale_factors, roi_margin, workers, localize, escalate)
+        if cache is not None:
+            with stage('cache'):
+                cache.put(cache_key, results)
+    # 输出统计报告
+    count = len(results)
+    print(f"\nTotal barcodes detected: {count}")
+    detected_results = [(r['data'], (r['position']['left'], r['position']['top'])) for r in results]
+    return count, detected_results
+
+def scan_tiles_once(image_path, horizontal_chunks, vertical_steps, scale_factors, roi_margin, workers, localize, escalate):
+    """逐块裁剪、预处理并解码，边扫描边输出新结果，返回去重后的结果列表"""
     # 打开图像文件并获取图像尺寸
-    original_image = Image.open(image_path)
+    with stage('load'):
+        original_image = Image.open(image_path)
+        original_image.load()
+    tile_source = make_tile_source(original_image, roi_margin)  # 每个缩放层级只预处理一次，或只处理区块
     width, height = original_image.size
     count = 0
-    detected_results = []  # 存储检测结果
+    aggregator = ResultAggregator()  # 存储检测结果，网格空间索引去重
     # 计算每块的宽度和高度
     chunk_width = width // horizontal_chunks
     step_height = height // vertical_steps
     print(f"Chunk width: {chunk_width}, Step height: {step_height}")
-    # 逐行逐块处理图像
+    # 逐行逐块划分区块（确保不越界）
+    tiles = []
     for top in range(0, height, step_height):
         for left in range(0, width, chunk_width):
-            # 确保不越界
             right = min(left + chunk_width, width)
             bottom = min(top + step_height, height)
-            # 对每种放大倍率进行处理
-            for scale_factor in scale_factors:
-                # 预处理图像
-                preprocessed_image = preprocess_image(original_image, scale_factor)
-                # 计算裁剪区域的放大尺寸
-                pre_left = int(left * scale_factor)
-                pre_top = int(top * scale_factor)
-                pre_right = int(right * scale_factor)
-                pre_bottom = int(bottom * scale_factor)
-                # 裁剪图像
-                chunk = crop_image(preprocessed_image, pre_left, pre_top, pre_right, pre_bottom)
-                # 解析该片段中的所有条码
-                decoded_objects = decode(chunk)
-                # 处理解码的条码结果
-                for obj in decoded_objects:
-                    barcode_data = obj.data.decode("utf-8")
-                    unique_barcode = (barcode_data, (pre_left + obj.rect.left, pre_top + obj.rect.top))
-                    # 存储唯一检测到的条形码
-                    if unique_barcode not in detected_results:
-                        count += 1
-                        barcode_type = obj.type
-                        rect = obj.rect
-                        position = {
-                            'left': pre_left + rect.left,
-                            'top': pre_top + rect.top,
-                            'width': rect.width,
-                            'height': rect.height
-                        }
-                        detected_results.append(unique_barcode)
-                        # 输出条形码信息
-                        print(f"Barcode/Qrcode #{count}:")
-                        print(f"Type: {barcode_type}")
-                        print(f"Data: {barcode_data}")
-                        print(f"Position: Left={position['left']}, Top={position['top']}, Width={position['width']}, Height={position['height']}")
-                        print('-' * 30)
-    # 输出统计报告
-    print(f"\nTotal barcodes detected: {count}")
-    return count, detected_results
+            tiles.append((left, top, right, bottom))
+    candidates = None
+    if localize:
+        tiles, candidates = localize_tiles(original_image, tiles)
+    # 对每个区块的每种放大倍率裁剪、预处理并解码
+    if escalate:
+        tile_results = scan_tiles_escalating(tile_source, tiles, scale_factors, candidates, workers)
+    else:
+        tile_results = scan_tiles(tile_source, tiles, scale_factors, workers)
+    for box, scale_factor, pre_left, pre_top, decoded_objects in tile_results:
+        # 处理解码的条码结果
+        for obj in decoded_objects:
+            barcode_data = obj.data.decode("utf-8")
+            position = to_original_position(obj.rect, pre_left, pre_top, scale_factor)  # 映射回原图坐标
+            # 按数据和原图坐标下的重叠度去重，跨区块、跨缩放因子的重复结果只保留一次
+            with stage('dedup'):
+                _, is_new = aggregator.add(obj.type, barcode_data, position, scale_factor)
+            if is_new:
+                count += 1
+                # 输出条形码信息
+                print_result(count, obj.type, barcode_data, position, scale_factor)
+    tile_source.release()  # 释放缓存的层级
+    return aggregator.results
 # ---------------------------- 主程序执行 ----------------------------
 # 使用示例，执行条码和二维码提取
-total_count, results = extract_barcodes_and_qrcodes('l.jpg', horizontal_chunks=8, vertical_steps=5, scale_factors=(1.5, 2.0, 3.0))
-# 输出检测结果整理和展示
-print("\nSummary of detected barcodes:")
-for idx, (data, position) in enumerate(results, start=1):
-    print(f"{idx} - Data: {data}, Position: {position}")
+if __name__ == '__main__':
+    total_count, results = extract_barcodes_and_qrcodes('l.jpg', horizontal_chunks=8, vertical_steps=5, scale_factors=(1.5, 2.0, 3.0))
+    # 输出检测结果整理和展示
+    print("\nSummary of detected barcodes:")
+    for idx, (data, position) in enumerate(results, start=1):
+        print(f"{idx} - Data: {data}, Position: {position}")
\ No newline at end of file
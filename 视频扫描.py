@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+视频条码扫描：用 cv2.VideoCapture 逐帧读取录制的视频文件（也可以是摄像头编号），
+后台线程解码帧，帧差只把变化的区域交给 pyzbar，同一条码在各帧的检测结果串成轨迹，
+每条轨迹结束时输出一行 JSON（数据、类型、首帧、末帧）。
+
+示例：
+    python 视频扫描.py conveyor.mp4 --output tracks.jsonl
+    python 视频扫描.py conveyor.mp4 --realtime --stride 2
+"""
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+import cv2
+import numpy as np
+from pyzbar import pyzbar
+from 阶段计时 import stage, count, scan_timings  # 各阶段计时（BARCODE_TIMING=1 开启）
+
+# ---------------------------- 帧读取流水线 ----------------------------
+class FrameReader:
+    """后台线程解码视频帧放入有界队列，处理当前帧时后面的帧已在解码；需要跳过的帧只 grab，不取出像素"""
+
+    def __init__(self, source, queue_size=4, stride=1):
+        """
+        :param source: 视频文件路径或摄像头编号
+        :param queue_size: 预先解码的帧数上限
+        :param stride: 每隔 stride 帧处理一帧，其余帧直接跳过
+        """
+        self.capture = cv2.VideoCapture(source)
+        if not self.capture.isOpened():
+            raise OSError(f"Cannot open video: {source}")
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.stride = max(1, stride)
+        self.skip_until = 0  # 实时模式下处理落后时，此前的帧只 grab
+        self.skipped = 0  # 读取线程跳过的帧数
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        index = 0
+        try:
+            while not self._stop.is_set():
+                if index % self.stride or index < self.skip_until:
+                    if not self.capture.grab():
+                        break
+                    self.skipped += 1
+                else:
+                    ok, frame = self.capture.read()
+                    if not ok:
+                        break
+                    self._put((index, frame))
+                index += 1
+        finally:
+            self._put(None)  # 结束标记
+
+    def _put(self, item):
+        # 队列满时等待消费，关闭时放弃
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def __iter__(self):
+        """按顺序产出 (帧号, BGR帧)"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            yield item
+
+    def close(self):
+        """停止读取线程并释放视频"""
+        self._stop.set()
+        self.thread.join()
+        self.capture.release()
+
+# ---------------------------- 帧差 ----------------------------
+class ChangeDetector:
+    """在缩小的灰度帧上和上一处理帧做差，按网格合并出变化区域；未变化区域中的条码不再重复解码"""
+
+    def __init__(self, threshold=18, cell_size=16, min_changed=0.02, max_side=480, refresh_interval=30, margin=24):
+        """
+        :param threshold: 像素灰度差超过此值视为变化
+        :param cell_size: 缩小帧上网格的边长（像素）
+        :param min_changed: 网格内变化像素的比例超过此值才视为变化，过滤噪声
+        :param max_side: 做差时把帧的长边缩小到的像素数
+        :param refresh_interval: 每隔多少个处理帧解码一次整帧，补上帧差漏掉的条码
+        :param margin: 变化区域四周扩展的像素（原帧坐标），避免切断条码
+        """
+        self.threshold = threshold
+        self.cell_size = cell_size
+        self.min_changed = min_changed
+        self.max_side = max_side
+        self.refresh_interval = refresh_interval
+        self.margin = margin
+        self.reference = None  # 上一处理帧的缩小灰度图
+        self.since_refresh = 0
+
+    def changed_regions(self, gray):
+        """
+        :param gray: 原尺寸灰度帧
+        :return: (变化区域列表 [(left, top, right, bottom)]，是否为整帧刷新)
+        """
+        height, width = gray.shape[:2]
+        ratio = min(1.0, self.max_side / float(max(width, height)))
+        small = cv2.resize(gray, (max(1, int(width * ratio)), max(1, int(height * ratio))), interpolation=cv2.INTER_AREA)
+        reference, self.reference = self.reference, small
+        self.since_refresh += 1
+        if reference is None or self.since_refresh >= self.refresh_interval:
+            self.since_refresh = 0
+            return [(0, 0, width, height)], True
+        mask = (cv2.absdiff(small, reference) > self.threshold).astype(np.uint8)
+        # 每个网格内变化像素的比例，再向四周扩展一格，覆盖正在进入画面的条码
+        grid_width = max(1, -(-small.shape[1] // self.cell_size))
+        grid_height = max(1, -(-small.shape[0] // self.cell_size))
+        fraction = cv2.resize(mask.astype(np.float32), (grid_width, grid_height), interpolation=cv2.INTER_AREA)
+        cells = cv2.dilate((fraction > self.min_changed).astype(np.uint8), None)
+        label_count, _, cell_stats, _ = cv2.connectedComponentsWithStats(cells, connectivity=8)
+        scale_x = small.shape[1] / float(grid_width) / ratio
+        scale_y = small.shape[0] / float(grid_height) / ratio
+        regions = []
+        for x, y, w, h, _ in cell_stats[1:label_count]:
+            regions.append((max(0, int(x * scale_x) - self.margin), max(0, int(y * scale_y) - self.margin),
+                            min(width, int((x + w) * scale_x) + self.margin),
+                            min(height, int((y + h) * scale_y) + self.margin)))
+        return regions, False
+
+def _boxes_intersect(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+# ---------------------------- 轨迹 ----------------------------
+class BarcodeTracker:
+    """按数据和类型把各帧的检测结果串成轨迹，超过 max_gap 帧没有再出现的轨迹结束，每条轨迹只报告一次"""
+
+    def __init__(self, fps, max_gap=15, on_track=None):
+        """
+        :param fps: 视频帧率，用于换算时间
+        :param max_gap: 轨迹允许连续缺失的帧数
+        :param on_track: 每条轨迹结束时调用 on_track(track)
+        """
+        self.fps = fps
+        self.max_gap = max_gap
+        self.on_track = on_track
+        self.active = {}  # (数据, 类型) -> 轨迹
+        self.finished = []
+        self.previous_frame = None  # 上一处理帧的帧号
+
+    def update(self, frame_index, detections, changed_regions):
+        """
+        :param detections: 本帧解码出的 [(数据, 类型, 位置)]，位置为原帧坐标的 (left, top, right, bottom)
+        :param changed_regions: 本帧重新解码过的区域；位于其它区域的轨迹视为静止，仍然在画面中
+        """
+        for data, barcode_type, box in detections:
+            track = self.active.get((data, barcode_type))
+            if track is None:
+                self.active[(data, barcode_type)] = {
+                    'data': data, 'type': barcode_type, 'first_frame': frame_index, 'last_frame': frame_index,
+                    'hits': 1, 'box': box}
+            else:
+                if track['last_frame'] != frame_index:
+                    track['hits'] += 1
+                track['last_frame'] = frame_index
+                track['box'] = box
+        # 上一处理帧仍在画面中、且所在区域没有变化的条码保持不变；已经消失的条码不会因为区域静止而延续
+        for track in self.active.values():
+            if (track['last_frame'] == self.previous_frame
+                    and not any(_boxes_intersect(track['box'], region) for region in changed_regions)):
+                track['last_frame'] = frame_index
+        self.previous_frame = frame_index
+        for key in [key for key, track in self.active.items() if frame_index - track['last_frame'] > self.max_gap]:
+            self._finish(self.active.pop(key))
+
+    def close(self):
+        """视频结束时结束所有轨迹"""
+        for track in sorted(self.active.values(), key=lambda t: t['first_frame']):
+            self._finish(track)
+        self.active.clear()
+        return sorted(self.finished, key=lambda t: t['first_frame'])
+
+    def _finish(self, track):
+        track['first_time'] = round(track['first_frame'] / self.fps, 3)
+        track['last_time'] = round(track['last_frame'] / self.fps, 3)
+        self.finished.append(track)
+        print(f"Track {track['type']} {track['data']}: frames {track['first_frame']}-{track['last_frame']}")
+        if self.on_track is not None:
+            self.on_track(track)
+
+# ---------------------------- 视频扫描 ----------------------------
+def decode_region(gray, region, scale_factor=1.0):
+    """
+    解码帧中的一个区域
+    :return: [(数据, 类型, 原帧坐标的位置)]
+    """
+    left, top, right, bottom = region
+    crop = gray[top:bottom, left:right]
+    if scale_factor != 1.0:
+        with stage('resize'):
+            crop = cv2.resize(crop, (int(crop.shape[1] * scale_factor), int(crop.shape[0] * scale_factor)),
+                              interpolation=cv2.INTER_LINEAR)
+    with stage('decode'):
+        barcodes = pyzbar.decode(crop)
+    detections = []
+    for barcode in barcodes:
+        rect = barcode.rect
+        detections.append((barcode.data.decode('utf-8'), barcode.type,
+                           (left + int(rect.left / scale_factor), top + int(rect.top / scale_factor),
+                            left + int((rect.left + rect.width) / scale_factor),
+                            top + int((rect.top + rect.height) / scale_factor))))
+    return detections
+
+def scan_video(source, stride=1, realtime=False, max_gap=15, diff_threshold=18, refresh_interval=30,
+               scale_factor=1.0, on_track=None, should_stop=None, stats=None):
+    """
+    扫描视频中的条码，每个条码在连续出现期间只报告一条轨迹
+    :param source: 视频文件路径或摄像头编号
+    :param stride: 每隔 stride 帧处理一帧
+    :param realtime: 处理速度跟不上视频帧率时跳过落后的帧，按墙钟时间保持实时
+    :param max_gap: 轨迹允许连续缺失的帧数（按原视频帧号计）
+    :param diff_threshold: 帧差的灰度阈值，0 表示每帧都解码整帧
+    :param refresh_interval: 每隔多少个处理帧解码一次整帧
+    :param scale_factor: 解码前对变化区域的放大倍数
+    :param on_track: 每条轨迹结束时调用 on_track(track)
+    :param should_stop: 无参数的可调用对象，返回True时在下一帧前停止
+    :param stats: 传入字典时写入读取、处理、跳过的帧数、解码区域数和处理帧率
+    :return: 轨迹列表，每项包含 data、type、first_frame、last_frame、first_time、last_time、hits 和最后的位置 box
+    """
+    reader = FrameReader(source, stride=stride)
+    tracker = BarcodeTracker(reader.fps, max(max_gap, stride), on_track)  # 间隔处理时缺失帧数至少为 stride
+    detector = ChangeDetector(threshold=diff_threshold, refresh_interval=refresh_interval if diff_threshold > 0 else 1)
+    processed = dropped = regions_decoded = full_frames = 0
+    start_time = time.perf_counter()
+    try:
+        for frame_index, frame in reader:
+            if should_stop is not None and should_stop():
+                print("Video scan cancelled.")
+                break
+            if realtime:
+                # 视频时间落后于墙钟时间时丢弃这一帧，并让读取线程直接跳到当前时刻
+                current_index = int((time.perf_counter() - start_time) * reader.fps)
+                if frame_index < current_index - 1:
+                    reader.skip_until = current_index
+                    dropped += 1
+                    continue
+            with stage('grayscale'):
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            with stage('diff'):
+                regions, full_frame = detector.changed_regions(gray)
+            full_frames += full_frame
+            detections = []
+            for region in regions:
+                detections.extend(decode_region(gray, region, scale_factor))
+            with stage('track'):
+                tracker.update(frame_index, detections, regions)
+            processed += 1
+            regions_decoded += len(regions)
+            count('frames')
+    finally:
+        reader.close()
+    tracks = tracker.close()
+    elapsed = time.perf_counter() - start_time
+    if stats is not None:
+        stats.update({'fps': reader.fps, 'frames_processed': processed, 'frames_skipped': reader.skipped + dropped,
+                      'regions_decoded': regions_decoded, 'full_frames': full_frames, 'tracks': len(tracks),
+                      'elapsed': round(elapsed, 3), 'processing_fps': round(processed / elapsed, 2) if elapsed else None})
+    print(f"Processed {processed} frame(s), skipped {reader.skipped + dropped}, {len(tracks)} track(s) in {elapsed:.1f}s")
+    return tracks
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="扫描视频文件中的条码，按轨迹输出每个条码的首帧和末帧")
+    parser.add_argument('video', help="视频文件路径，或摄像头编号（如 0）")
+    parser.add_argument('-o', '--output', default='-', help="轨迹 JSON 行输出文件，'-' 表示标准输出")
+    parser.add_argument('--stride', type=int, default=1, help="每隔多少帧处理一帧")
+    parser.add_argument('--realtime', action='store_true', help="处理跟不上视频帧率时跳过落后的帧")
+    parser.add_argument('--max-gap', type=int, default=15, help="轨迹允许连续缺失的帧数")
+    parser.add_argument('--diff-threshold', type=int, default=18, help="帧差的灰度阈值，0 表示每帧都解码整帧")
+    parser.add_argument('--refresh-interval', type=int, default=30, help="每隔多少个处理帧解码一次整帧")
+    parser.add_argument('--scale-factor', type=float, default=1.0, help="解码前对变化区域的放大倍数")
+    args = parser.parse_args(argv)
+
+    source = int(args.video) if args.video.isdigit() else args.video
+    stdout = sys.stdout
+    output = stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    sys.stdout = sys.stderr  # 扫描日志改写到标准错误，避免混入 JSON 输出
+
+    def write_track(track):
+        output.write(json.dumps(track, ensure_ascii=False) + "\n")
+        output.flush()
+
+    stats = {}
+    try:
+        with scan_timings('scan_video', args.video):
+            scan_video(source, args.stride, args.realtime, args.max_gap, args.diff_threshold, args.refresh_interval,
+                       args.scale_factor, on_track=write_track, stats=stats)
+    finally:
+        sys.stdout = stdout
+        if output is not stdout:
+            output.close()
+    print(json.dumps(stats), file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,6 +3,7 @@
 from PIL import Image, ImageEnhance
 from pyzbar.pyzbar import decode
 import os
+from 阶段计时 import stage, timed_scan  # 各阶段计时（BARCODE_TIMING=1 开启）
 
 def preprocess_image(image, scale_factor, contrast_factor=2.0):
     """
@@ -13,14 +14,17 @@ def preprocess_image(image, scale_factor, contrast_factor=2.0):
     :return: 经过预处理的图像对象
     """
     # 使用对比度增强器提升图像对比度
-    enhancer = ImageEnhance.Contrast(image)
-    enhanced_image = enhancer.enhance(contrast_factor)  # 增强对比度
+    with stage('contrast'):
+        enhancer = ImageEnhance.Contrast(image)
+        enhanced_image = enhancer.enhance(contrast_factor)  # 增强对比度
     
     # 放大图像以提高识别率
     new_size = (int(enhanced_image.width * scale_factor), int(enhanced_image.height * scale_factor))
-    enlarged_image = enhanced_image.resize(new_size, Image.LANCZOS)  # 使用LANCZOS算法进行图像缩放
+    with stage('resize'):
+        enlarged_image = enhanced_image.resize(new_size, Image.LANCZOS)  # 使用LANCZOS算法进行图像缩放
     return enlarged_image
 
+@timed_scan('extract_barcodes_and_qrcodes')
 def extract_barcodes_and_qrcodes(image_path, segment_width_percentage=30, overlap_percentage=20, scale_factor=2.0, contrast_factor=2.0, output_file='barcode_qrcode_results.txt'):
     """
     从图像中提取条形码和二维码，确保重叠覆盖前一个片段，避免识别错误，并将结果输出到一个文本文件。
@@ -30,6 +34,7 @@ def extract_barcodes_and_qrcodes(image_path, segment_width_percentage=30, overla
     :param scale_factor: 图像缩放因子（如2.0表示原图像的两倍）
     :param contrast_factor: 对比度增强因子（默认值为2.0，增强到原来的2倍）
     :param output_file: 输出文本文件的路径
+    :return: 去重后的 (数据, 位置) 列表，图像无法打开时返回 None
     """
     # 检查输入图像文件是否存在
     if not os.path.exists(image_path):
@@ -38,7 +43,9 @@ def extract_barcodes_and_qrcodes(image_path, segment_width_percentage=30, overla
     
     try:
         # 打开图像文件
-        original_image = Image.open(image_path)
+        with stage('load'):
+            original_image = Image.open(image_path)
+            original_image.load()
     except Exception as e:
         print(f"Error opening image: {e}")
         return
@@ -60,11 +67,13 @@ def extract_barcodes_and_qrcodes(image_path, segment_width_percentage=30, overla
             right = min(left + segment_width, width)  # 右边界不超过图像宽度
             
             # 裁剪当前段落
-            chunk = original_image.crop((left, 0, right, height))
+            with stage('crop'):
+                chunk = original_image.crop((left, 0, right, height))
             preprocessed_image = preprocess_image(chunk, scale_factor, contrast_factor)  # 预处理图像
             
             # 解码当前图像块中的条形码和二维码
-            decoded_objects = decode(preprocessed_image)  
+            with stage('decode'):
+                decoded_objects = decode(preprocessed_image)
             if decoded_objects:
                 output.write(f"Detected {len(decoded_objects)} objects in the chunk from {left} to {right}.\n")
                 print(f"Detected {len(decoded_objects)} objects in the chunk from {left} to {right}.")  # 打印结果
@@ -73,8 +82,10 @@ def extract_barcodes_and_qrcodes(image_path, segment_width_percentage=30, overla
             for obj in decoded_objects:
                 barcode_data = obj.data.decode("utf-8")  # 获取条形码或二维码数据
                 unique_barcode = (barcode_data, (left + obj.rect.left, obj.rect.top))  # 生成唯一条目
-                if unique_barcode not in detected_results:  # 检查重复
+                with stage('dedup'):
+                    is_new = unique_barcode not in detected_results  # 检查重复
                     detected_results.add(unique_barcode)  # 添加到集合中避免重复
+                if is_new:
                     count += 1
                     barcode_type = obj.type  # 获取条形码或二维码类型
                     rect = obj.rect  # 获取条形码/二维码的框选区域
@@ -85,11 +96,12 @@ def extract_barcodes_and_qrcodes(image_path, segment_width_percentage=30, overla
                         'height': rect.height
                     }
                     # 写入识别结果到文件
-                    output.write(f"Barcode/Qrcode #{count}:\n")
-                    output.write(f"Type: {barcode_type}\n")
-                    output.write(f"Data: {barcode_data}\n")
-                    output.write(f"Position: Left={position['left']}, Top={position['top']}, Width={position['width']}, Height={position['height']}\n")
-                    output.write('-' * 30 + '\n')
+                    with stage('export'):
+                        output.write(f"Barcode/Qrcode #{count}:\n")
+                        output.write(f"Type: {barcode_type}\n")
+                        output.write(f"Data: {barcode_data}\n")
+                        output.write(f"Position: Left={position['left']}, Top={position['top']}, Width={position['width']}, Height={position['height']}\n")
+                        output.write('-' * 30 + '\n')
                     # 打印识别结果到终端
                     print(f"Barcode/Qrcode #{count}:")
                     print(f"Type: {barcode_type}")
@@ -103,6 +115,8 @@ def extract_barcodes_and_qrcodes(image_path, segment_width_percentage=30, overla
         output.write(f"Total number of barcodes/QRCodes detected: {count}\n")
         # 打印总计到终端
         print(f"Total number of barcodes/QRCodes detected: {count}")
+    return sorted(detected_results)
 
 # 调用函数并设置参数
-extract_barcodes_and_qrcodes('selected_part_1.png', segment_width_percentage=8, overlap_percentage=60, scale_factor=2.0, contrast_factor=2.0, output_file='barcode_qrcode_results.txt')
+if __name__ == '__main__':
+    extract_barcodes_and_qrcodes('selected_part_1.png', segment_width_percentage=8, overlap_percentage=60, scale_factor=2.0, contrast_factor=2.0, output_file='barcode_qrcode_results.txt')
@@ -3,38 +3,36 @@ import json
 import os
 from PyQt5.QtWidgets import (QApplication, QLabel, QPushButton, QFileDialog, 
                              QSpinBox, QVBoxLayout, QWidget, QFormLayout, QDoubleSpinBox, 
-                             QTabWidget, QHBoxLayout, QMainWindow)
+                             QTabWidget, QHBoxLayout, QMainWindow, QCheckBox, QProgressBar)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from PIL import Image, ImageEnhance
-from pyzbar.pyzbar import decode
-from PyQt5.QtGui import QPixmap, QFont
+from PyQt5.QtGui import QFont
 from datetime import datetime  # 用于记录当前时间
+from 扫描引擎 import scan_image, scan_pages, ScanCancelled  # 分块多尺度扫描，多页按页扫描
+from 流式读取 import page_count  # 多页 TIFF 的页数
+from 结果缓存 import ResultCache  # 持久化结果缓存
+from 参数调优 import load_profile  # 自动调优保存的参数
+from 阶段计时 import stage, scan_timings  # 各阶段计时（BARCODE_TIMING=1 开启）
+from 图像缓存 import shared_cache, load_preview  # 预览按显示尺寸解码，整幅图像只解码一次
 
 # 定义扫描条形码线程
 class BarcodeScannerThread(QThread):
     result_signal = pyqtSignal(list)  # 定义信号，用于发出结果
+    hit_signal = pyqtSignal(dict)  # 每发现一个新结果就发出
+    progress_signal = pyqtSignal(int, int, float, float)  # 已完成区块数、总数、已用秒数、预计剩余秒数
 
-    def __init__(self, image_path, horizontal_chunks, vertical_steps, scale_factors):
+    def __init__(self, image_path, horizontal_chunks, vertical_steps, scale_factors, roi_margin=None, workers=1, localize=False, escalate=False, cache=None, memory_budget=None, image_cache=None):
         super().__init__()
         self.image_path = image_path  # 图像路径
         self.horizontal_chunks = horizontal_chunks  # 水平切块数量
         self.vertical_steps = vertical_steps  # 垂直扫描步骤
         self.scale_factors = scale_factors  # 图像缩放因子
-
-    def preprocess_image(self, image, scale_factor):
-        # 图像预处理：将图像转换为灰度图，增强对比度，并按缩放因子调整大小
-        grayscale_image = image.convert('L')  # 转为灰度图
-        enhancer = ImageEnhance.Contrast(grayscale_image)  # 增强对比度
-        enhanced_image = enhancer.enhance(2.0)  # 增强对比度
-        new_size = (int(enhanced_image.width * scale_factor), 
-                    int(enhanced_image.height * scale_factor))  # 调整大小
-        enlarged_image = enhanced_image.resize(new_size, Image.LANCZOS)  # 按新的尺寸缩放图像
-        print(f"Processed image with scale factor {scale_factor}")  # 输出处理信息
-        return enlarged_image
-
-    def crop_image(self, image, left, top, right, bottom):
-        # 根据给定的坐标裁剪图像
-        return image.crop((left, top, right, bottom))
+        self.roi_margin = roi_margin  # 区块级预处理的保护边距，None表示整图预处理
+        self.workers = workers  # 并行解码的工作进程数量
+        self.localize = localize  # 是否先定位候选区域以跳过空白区块
+        self.escalate = escalate  # 是否按缩放因子从小到大逐级尝试
+        self.cache = cache  # 结果缓存，None表示不使用缓存
+        self.memory_budget = memory_budget  # 内存预算（字节），None表示整幅读取图像
+        self.image_cache = image_cache  # 与预览共用的已解码图像缓存
 
     def run(self):
         # 运行线程，执行条形码扫描
@@ -44,57 +42,34 @@ class BarcodeScannerThread(QThread):
             return
 
         try:
-            original_image = Image.open(self.image_path)  # 打开图像文件
-            width, height = original_image.size
-            detected_results = []  # 存储扫描到的结果
-            chunk_width = width // self.horizontal_chunks  # 水平切块的宽度
-            step_height = height // self.vertical_steps  # 垂直扫描步长
-            print(f"Processing image of size {width}x{height}")  # 输出图像的尺寸
-
-            # 按步长扫描图像
-            for top in range(0, height, step_height):  
-                for i in range(self.horizontal_chunks):  # 切分水平区域
-                    left = i * chunk_width
-                    right = left + chunk_width if (i < self.horizontal_chunks - 1) else width
-                    bottom = top + step_height if (top + step_height < height) else height
-
-                    print(f"Scanning region: left={left}, top={top}, right={right}, bottom={bottom}")  # 输出每个扫描区域
-
-                    # 根据缩放因子处理图像
-                    for scale_factor in self.scale_factors:
-                        preprocessed_image = self.preprocess_image(original_image, scale_factor)
-                        pre_left = int(left * scale_factor)
-                        pre_top = int(top * scale_factor)
-                        pre_right = int(right * scale_factor)
-                        pre_bottom = int(bottom * scale_factor)
-
-                        # 裁剪图像
-                        chunk = self.crop_image(preprocessed_image, pre_left, pre_top, pre_right, pre_bottom)
-                        # 扫描条形码
-                        decoded_objects = decode(chunk)
-
-                        # 处理解码结果
-                        for obj in decoded_objects:
-                            barcode_data = obj.data.decode("utf-8")  # 解码条形码数据
-                            barcode_type = obj.type  # 获取条形码类型
-                            rect = obj.rect  # 获取条形码的位置
-                            position = {
-                                'left': pre_left + rect.left,
-                                'top': pre_top + rect.top,
-                                'width': rect.width,
-                                'height': rect.height
-                            }
-                            detected_results.append({
-                                'type': barcode_type,
-                                'data': barcode_data,
-                                'position': position
-                            })
-                            print(f"Detected {barcode_type} with data: {barcode_data}")  # 输出检测到的信息
-                            print(f"Barcode position: {position}")  # 输出条形码位置
-
+            # 多页图像按页扫描，工作进程按页分配，每页完成后结果立即推送
+            if page_count(self.image_path) > 1:
+                detected_results = []
+                for _, page_results in scan_pages(self.image_path, self.workers, on_result=self.hit_signal.emit,
+                                                  on_progress=self.progress_signal.emit,
+                                                  should_stop=self.isInterruptionRequested,
+                                                  horizontal_chunks=self.horizontal_chunks,
+                                                  vertical_steps=self.vertical_steps, scale_factors=self.scale_factors,
+                                                  roi_margin=self.roi_margin, localize=self.localize,
+                                                  escalate=self.escalate, cache=self.cache,
+                                                  memory_budget=self.memory_budget):
+                    detected_results.extend(page_results)
+                self.result_signal.emit(detected_results)
+                return
+            # 执行与界面无关的分块扫描，开启计时时各阶段归入这一次扫描的报告
+            with scan_timings('BarcodeScannerThread.run', self.image_path):
+                detected_results = scan_image(self.image_path, self.horizontal_chunks, self.vertical_steps,
+                                              self.scale_factors, self.roi_margin, self.workers, self.localize,
+                                              self.escalate, on_result=self.hit_signal.emit,
+                                              on_progress=self.progress_signal.emit,
+                                              should_stop=self.isInterruptionRequested, cache=self.cache,
+                                              memory_budget=self.memory_budget, image_cache=self.image_cache)
             # 返回扫描结果
             self.result_signal.emit(detected_results)
 
+        except ScanCancelled:
+            print("Scanner thread stopped at a cancellation checkpoint.")  # 已停止并释放缓存
+
         except Exception as e:
             print(f"Error processing image: {e}")  # 输出异常信息
             self.result_signal.emit([])  # 返回空结果以示失败
@@ -152,6 +127,46 @@ class BarcodeScannerUI(QMainWindow):
         self.scale_factor_box_2.setValue(4.0)
         form_layout.addRow("Scale Factor 2:", self.scale_factor_box_2)
 
+        # 区块级预处理开关
+        self.roi_checkbox = QCheckBox("Preprocess tiles only")
+        form_layout.addRow("Tile-local Mode:", self.roi_checkbox)
+
+        # 区块保护边距输入框
+        self.roi_margin_spinbox = QSpinBox()
+        self.roi_margin_spinbox.setRange(0, 500)
+        self.roi_margin_spinbox.setValue(32)
+        form_layout.addRow("Tile Margin (px):", self.roi_margin_spinbox)
+
+        # 并行解码进程数输入框
+        self.workers_spinbox = QSpinBox()
+        self.workers_spinbox.setRange(1, os.cpu_count() or 1)
+        self.workers_spinbox.setValue(1)
+        form_layout.addRow("Workers:", self.workers_spinbox)
+
+        # 内存预算输入框，0 表示整幅读取
+        self.memory_budget_spinbox = QSpinBox()
+        self.memory_budget_spinbox.setRange(0, 65536)
+        self.memory_budget_spinbox.setSingleStep(256)
+        self.memory_budget_spinbox.setValue(0)
+        self.memory_budget_spinbox.setSpecialValueText("Off")
+        form_layout.addRow("Memory Budget (MB):", self.memory_budget_spinbox)
+
+        # 候选区域定位开关
+        self.localize_checkbox = QCheckBox("Skip tiles without barcode candidates")
+        form_layout.addRow("Localization:", self.localize_checkbox)
+
+        # 自适应缩放开关
+        self.escalate_checkbox = QCheckBox("Try larger scale only for unresolved tiles")
+        self.escalate_checkbox.setToolTip("A tile is resolved once every barcode candidate in it has decoded; "
+                                          "turns on localization")
+        self.escalate_checkbox.toggled.connect(self.escalate_toggled)
+        form_layout.addRow("Scale Escalation:", self.escalate_checkbox)
+
+        # 结果缓存开关
+        self.cache_checkbox = QCheckBox("Reuse results for unchanged images")
+        self.cache_checkbox.setChecked(True)
+        form_layout.addRow("Result Cache:", self.cache_checkbox)
+
         layout.addLayout(form_layout)
 
         # 按钮区布局
@@ -166,6 +181,12 @@ class BarcodeScannerUI(QMainWindow):
         self.scan_button.clicked.connect(self.scan_codes)  # 连接扫描条形码的功能
         button_layout.addWidget(self.scan_button)
 
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setFont(QFont("Arial", 12))
+        self.cancel_button.clicked.connect(self.cancel_scan)  # 取消正在进行的扫描
+        self.cancel_button.setEnabled(False)
+        button_layout.addWidget(self.cancel_button)
+
         self.export_button = QPushButton("Export Results")  # 新增导出按钮
         self.export_button.setFont(QFont("Arial", 12))
         self.export_button.clicked.connect(self.export_results)  # 导出结果的回调
@@ -173,6 +194,14 @@ class BarcodeScannerUI(QMainWindow):
 
         layout.addLayout(button_layout)
 
+        # 扫描进度条和状态
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setValue(0)
+        layout.addWidget(self.progress_bar)
+        self.status_label = QLabel("")
+        self.status_label.setFont(QFont("Arial", 10))
+        layout.addWidget(self.status_label)
+
         # 主标签页
         self.tabs.addTab(main_tab, "Main")
 
@@ -183,7 +212,16 @@ class BarcodeScannerUI(QMainWindow):
             "Parameter Explanations:\n"
             "1. Horizontal Chunks: Number of horizontal sections to divide the image.\n"
             "2. Vertical Steps: Number of vertical sections to scan through the image.\n"
-            "3. Scale Factor: Factors by which the image is scaled to improve detection."
+            "3. Scale Factor: Factors by which the image is scaled to improve detection.\n"
+            "4. Tile-local Mode: Enhance and upscale only each tile plus a margin, so memory follows tile size.\n"
+            "5. Tile Margin: Extra pixels kept around each tile so codes on tile borders are not cut.\n"
+            "6. Workers: Number of processes that decode tiles in parallel (1 = decode in the scan thread).\n"
+            "7. Localization: Find likely barcode regions on a downsampled image first and only decode tiles that overlap them.\n"
+            "8. Scale Escalation: Decode at the smaller scale factor first; a tile moves to the larger one only if it is unresolved.\n"
+            "9. Result Cache: Return stored results at once when the same image content is scanned again with the same parameters.\n"
+            "10. Tuned Profile: Settings saved by 参数调优.py (--target scanner) are loaded at startup.\n"
+            "11. Memory Budget: Stream very large images band by band and split tiles that would not fit (Off = read the whole image).\n"
+            "12. Multi-page Images: Each page of a multi-page TIFF is scanned in turn (spread across Workers) and every result is tagged with its page."
         )
         explanation_label.setFont(QFont("Arial", 12))
         explanation_label.setAlignment(Qt.AlignLeft | Qt.AlignTop)
@@ -200,6 +238,12 @@ class BarcodeScannerUI(QMainWindow):
 
         self.image_path = None  # 用于存储图像路径
         self.results = None  # 用于存储扫描结果
+        self.page_total = 1  # 当前图像的页数
+        self.live_results = []  # 扫描过程中实时收到的结果
+        self.scanner_thread = None  # 当前的扫描线程
+        self.retired_threads = []  # 已被取消、等待退出的扫描线程
+        self.result_cache = ResultCache()  # 按图像内容和扫描参数缓存的结果
+        self.apply_profile()  # 载入自动调优保存的参数
 
         self.setStyleSheet("""
             QMainWindow {
@@ -227,19 +271,45 @@ class BarcodeScannerUI(QMainWindow):
             }
         """)
 
+    def apply_profile(self):
+        """把参数调优保存的 scanner 配置填入各输入框，没有配置时保持默认值"""
+        profile = load_profile('scanner')
+        if profile is None:
+            return
+        self.horizontal_chunks_spinbox.setValue(profile['horizontal_chunks'])
+        self.vertical_steps_spinbox.setValue(profile['vertical_steps'])
+        self.scale_factor_box_1.setValue(profile['scale_factor_1'])
+        self.scale_factor_box_2.setValue(profile['scale_factor_2'])
+        self.localize_checkbox.setChecked(profile['localize'])
+        self.escalate_checkbox.setChecked(profile['escalate'])
+        self.status_label.setText("Loaded tuned profile.")
+        print(f"Loaded tuned profile: {profile}")
+
+    def escalate_toggled(self, checked):
+        # 自适应缩放依据候选区域判断区块是否已解决，开启时定位也必须开启
+        if checked:
+            self.localize_checkbox.setChecked(True)
+        self.localize_checkbox.setEnabled(not checked)
+
     def load_image(self):
         # 加载图像文件
         options = QFileDialog.Options()
         options |= QFileDialog.ReadOnly
         file_path, _ = QFileDialog.getOpenFileName(
-            self, "Load Image", "", "Images (*.png *.jpg *.jpeg *.bmp);;All Files (*)", options=options)
+            self, "Load Image", "", "Images (*.png *.jpg *.jpeg *.bmp *.tif *.tiff);;All Files (*)", options=options)
         
         if file_path:
             try:
                 self.image_path = file_path  # 更新图像路径
-                self.image_label.setPixmap(QPixmap(file_path).scaled(600, 400, Qt.KeepAspectRatio))
+                pixmap = load_preview(file_path, 600, 400)  # 按预览尺寸解码，不构建整幅 QPixmap
+                if pixmap is None:
+                    raise OSError("cannot decode image")
+                self.image_label.setPixmap(pixmap)
                 self.image_label.setText("")  # 清空提示文本
-                print(f"Loaded image: {file_path}")  # 输出加载的信息
+                self.page_total = page_count(file_path)  # 多页图像按页扫描
+                if self.page_total == 1 and self.memory_budget_spinbox.value() == 0:
+                    shared_cache.prefetch(file_path)  # 后台解码整幅图像，扫描时直接复用
+                print(f"Loaded image: {file_path} ({self.page_total} page(s))")  # 输出加载的信息
             except Exception as e:
                 print(f"Error loading image: {e}")  # 输出加载失败的异常信息
                 self.image_label.setText(f"Failed to load image: {e}")
@@ -254,13 +324,70 @@ class BarcodeScannerUI(QMainWindow):
         horizontal_chunks = self.horizontal_chunks_spinbox.value()  # 获取用户输入的切块数量
         vertical_steps = self.vertical_steps_spinbox.value()  # 获取用户输入的垂直步骤
         scale_factors = [self.scale_factor_box_1.value(), self.scale_factor_box_2.value()]  # 获取缩放因子
+        roi_margin = self.roi_margin_spinbox.value() if self.roi_checkbox.isChecked() else None  # 区块级预处理边距
+        workers = self.workers_spinbox.value()  # 获取并行解码进程数
+        localize = self.localize_checkbox.isChecked()  # 是否跳过不含候选区域的区块
+        escalate = self.escalate_checkbox.isChecked()  # 是否自适应缩放
+        cache = self.result_cache if self.cache_checkbox.isChecked() else None  # 是否使用结果缓存
+        memory_budget = self.memory_budget_spinbox.value() * 1024 * 1024 or None  # 内存预算，0 表示不限制
+
+        print(f"Scanning with horizontal_chunks={horizontal_chunks}, vertical_steps={vertical_steps}, scale_factors={scale_factors}, roi_margin={roi_margin}, workers={workers}, localize={localize}, escalate={escalate}, memory_budget={memory_budget}")  # 输出扫描参数信息
 
-        print(f"Scanning with horizontal_chunks={horizontal_chunks}, vertical_steps={vertical_steps}, scale_factors={scale_factors}")  # 输出扫描参数信息
+        # 新的扫描抢占正在运行的扫描
+        self.cancel_scan()
+
+        # 清空上一次的结果，准备实时追加
+        self.live_results = []
+        self.output_label.setText("Scanning...")
+        self.progress_bar.setValue(0)
 
         # 创建并启动扫描线程
-        self.scanner_thread = BarcodeScannerThread(self.image_path, horizontal_chunks, vertical_steps, scale_factors)
+        self.scanner_thread = BarcodeScannerThread(self.image_path, horizontal_chunks, vertical_steps, scale_factors, roi_margin, workers, localize, escalate, cache, memory_budget,
+                                                   shared_cache)
         self.scanner_thread.result_signal.connect(self.display_results)  # 连接显示结果的信号
+        self.scanner_thread.hit_signal.connect(self.append_result)  # 实时追加新结果
+        self.scanner_thread.progress_signal.connect(self.update_progress)  # 更新扫描进度
+        self.scanner_thread.finished.connect(self.scan_finished)  # 线程结束后恢复按钮状态
         self.scanner_thread.start()  # 启动线程进行扫描
+        self.cancel_button.setEnabled(True)
+
+    def cancel_scan(self):
+        # 请求当前扫描在下一个检查点停止，并断开其信号，避免过期结果刷新界面
+        thread = self.scanner_thread
+        if thread is None or not thread.isRunning():
+            return
+        thread.requestInterruption()
+        for signal in (thread.result_signal, thread.hit_signal, thread.progress_signal, thread.finished):
+            signal.disconnect()
+        # 保留引用直到线程真正退出，之后释放线程及其缓存的图像
+        self.retired_threads.append(thread)
+        thread.finished.connect(lambda: self.retired_threads.remove(thread))
+        self.scanner_thread = None
+        self.cancel_button.setEnabled(False)
+        self.status_label.setText("Scan cancelled.")
+        print("Scan cancelled by user or preempted by a new scan.")
+
+    def scan_finished(self):
+        # 扫描线程结束
+        self.cancel_button.setEnabled(False)
+        self.scanner_thread = None
+
+    def format_result(self, r):
+        # 构造单个结果的显示文本，多页图像的结果带有页码
+        page = f"Page: {r['page']}, " if 'page' in r else ""
+        return f"{page}Type: {r['type']}, Data: {r['data']}, Position: {r['position']}, Scale: {r['scale_factor']}"
+
+    def append_result(self, result):
+        # 扫描过程中每发现一个新结果就追加显示
+        self.live_results.append(result)
+        self.output_label.setText("\n".join(self.format_result(r) for r in self.live_results))
+
+    def update_progress(self, done, total, elapsed, eta):
+        # 更新进度条和状态文本
+        self.progress_bar.setMaximum(max(1, total))
+        self.progress_bar.setValue(done)
+        unit = "pages" if self.page_total > 1 else "tiles"  # 多页图像按页报告进度
+        self.status_label.setText(f"Scanned {done}/{total} {unit}, elapsed {elapsed:.1f}s, ETA {eta:.1f}s")
 
     def display_results(self, results):
         # 显示扫描结果
@@ -271,7 +398,7 @@ class BarcodeScannerUI(QMainWindow):
             self.results = results  # 存储结果
             result_text = ""  # 初始化结果文本
             for r in results:  # 遍历结果
-                result_text += f"Type: {r['type']}, Data: {r['data']}, Position: {r['position']}\n"  # 构造结果文本
+                result_text += self.format_result(r) + "\n"  # 构造结果文本
                 print(f"Detected result: Type: {r['type']}, Data: {r['data']}, Position: {r['position']}")  # 输出检测到的详细结果
             self.output_label.setText(result_text)  # 更新输出标签文本
 
@@ -290,7 +417,7 @@ class BarcodeScannerUI(QMainWindow):
             # 如果用户选择了路径则执行
             if json_file_path:
                 try:
-                    with open(json_file_path, 'a') as json_file:  # 用'a'模式打开以附加写入
+                    with stage('export'), open(json_file_path, 'a') as json_file:  # 用'a'模式打开以附加写入
                         json.dump(self.results, json_file, indent=4)  # 写入JSON数据
                         json_file.write("\n")  # 添加换行符
                     print(f"Results exported to {json_file_path}")  # 输出导出成功的信息
@@ -305,10 +432,11 @@ class BarcodeScannerUI(QMainWindow):
             # 如果用户选择了路径则执行
             if txt_file_path:
                 try:
-                    with open(txt_file_path, 'a') as txt_file:  # 用'a'模式打开以附加写入
+                    with stage('export'), open(txt_file_path, 'a') as txt_file:  # 用'a'模式打开以附加写入
                         for result in self.results:  # 遍历所有结果
                             write_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # 获取当前时间
-                            txt_file.write(f"[{write_time}] Type: {result['type']}, Data: {result['data']}, Position: {result['position']}\n")  # 添加时间戳和结果
+                            page = f"Page: {result['page']}, " if 'page' in result else ""
+                            txt_file.write(f"[{write_time}] {page}Type: {result['type']}, Data: {result['data']}, Position: {result['position']}\n")  # 添加时间戳和结果
                     print(f"Results exported to {txt_file_path}")  # 输出导出成功的信息
                 except Exception as e:
                     print(f"Error exporting results to TXT: {e}")  # 输出异常信息
@@ -0,0 +1,214 @@
+"""
+扫描各阶段的计时与计数：读取、灰度化/对比度、缩放、裁剪、pyzbar 解码、去重和导出。
+
+默认关闭，关闭时 stage()/count() 只做一次布尔判断。启用方式：
+    BARCODE_TIMING=1            每次扫描结束后把 JSON 分解打印到标准错误
+    BARCODE_TIMING=timings.jsonl 每次扫描结束后追加一行 JSON 到该文件
+    BARCODE_TIMING_PROM=metrics.prom 同时把累计值写成 Prometheus 文本格式（可供 node_exporter textfile 收集）
+或在代码中调用 enable()。多进程并行解码时，工作进程内的解码耗时不计入。
+"""
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+_enabled = os.environ.get('BARCODE_TIMING', '') not in ('', '0')
+_NULL = contextlib.nullcontext()  # 关闭时复用的空上下文
+_local = threading.local()  # 每个线程当前的扫描和最近一次的报告
+_lock = threading.Lock()
+_totals = {'stages': {}, 'counters': {}, 'scans': {}}  # 进程内的累计值
+
+def enable(flag=True):
+    """在代码中开启或关闭计时"""
+    global _enabled
+    _enabled = flag
+
+def is_enabled():
+    return _enabled
+
+# ---------------------------- 单次扫描 ----------------------------
+class ScanTimings:
+    """一次扫描中各阶段的累计耗时、调用次数和计数器"""
+
+    def __init__(self, label, image_path=None):
+        self.label = label
+        self.image_path = image_path
+        self.stages = {}  # 阶段 -> [秒数, 调用次数]
+        self.counters = {}
+        self.start_time = time.perf_counter()
+
+    def add(self, name, seconds):
+        entry = self.stages.get(name)
+        if entry is None:
+            self.stages[name] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def report(self):
+        """生成 JSON 可序列化的分解：各阶段耗时、次数、占总耗时的比例，以及未计入任何阶段的耗时"""
+        total = time.perf_counter() - self.start_time
+        staged = sum(seconds for seconds, _ in self.stages.values())
+        return {
+            'scan': self.label,
+            'image': self.image_path,
+            'total_seconds': round(total, 6),
+            'stages': {name: {'seconds': round(seconds, 6), 'calls': calls,
+                              'share': round(seconds / total, 4) if total else 0.0}
+                       for name, (seconds, calls) in sorted(self.stages.items(), key=lambda item: -item[1][0])},
+            'unaccounted_seconds': round(max(0.0, total - staged), 6),
+            'counters': dict(self.counters),
+        }
+
+class _Stage:
+    """计时上下文：退出时把耗时记到当前扫描和进程累计值"""
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        current = getattr(_local, 'current', None)
+        if current is not None:
+            current.add(self.name, seconds)
+        with _lock:
+            entry = _totals['stages'].setdefault(self.name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+        return False
+
+def stage(name):
+    """
+    为一个阶段计时：with stage('resize'): ...
+    :param name: 阶段名称，如 load、grayscale、contrast、resize、crop、decode、dedup、export
+    """
+    if not _enabled:
+        return _NULL
+    return _Stage(name)
+
+def count(name, n=1):
+    """累加计数器，例如切片数量、解码调用次数"""
+    if not _enabled:
+        return
+    current = getattr(_local, 'current', None)
+    if current is not None:
+        current.counters[name] = current.counters.get(name, 0) + n
+    with _lock:
+        _totals['counters'][name] = _totals['counters'].get(name, 0) + n
+
+@contextlib.contextmanager
+def _scan(label, image_path, emit):
+    if getattr(_local, 'current', None) is not None:
+        # 嵌套调用（如界面线程调用 scan_image）并入外层扫描
+        yield _local.current
+        return
+    timings = ScanTimings(label, image_path)
+    _local.current = timings
+    try:
+        yield timings
+    finally:
+        _local.current = None
+        report = timings.report()
+        _local.last = report
+        record(report)
+        if emit:
+            emit_report(report)
+
+def scan_timings(label, image_path=None, emit=True):
+    """
+    把一次扫描的各阶段归到同一份报告：with scan_timings('process_image', path): ...
+    :param emit: 结束时是否按环境变量输出报告；为 False 时只能通过 last_report() 取得
+    """
+    if not _enabled:
+        return _NULL
+    return _scan(label, image_path, emit)
+
+def timed_scan(label):
+    """装饰第一个参数为图像路径的扫描函数，关闭时直接调用原函数"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(image_path, *args, **kwargs):
+            if not _enabled:
+                return function(image_path, *args, **kwargs)
+            with scan_timings(label, image_path):
+                return function(image_path, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def last_report():
+    """当前线程最近一次结束的扫描报告，没有时返回 None"""
+    return getattr(_local, 'last', None)
+
+# ---------------------------- 输出 ----------------------------
+def record(report):
+    """把本进程一次扫描的总耗时计入累计值（阶段和计数器在发生时已经计入）"""
+    with _lock:
+        scans = _totals['scans'].setdefault(report['scan'], [0.0, 0])
+        scans[0] += report['total_seconds']
+        scans[1] += 1
+
+def merge(report):
+    """合并其它进程（如批量扫描的工作进程）返回的报告：扫描、阶段耗时和计数器都计入累计值"""
+    record(report)
+    with _lock:
+        for name, entry in report['stages'].items():
+            total = _totals['stages'].setdefault(name, [0.0, 0])
+            total[0] += entry['seconds']
+            total[1] += entry['calls']
+        for name, value in report['counters'].items():
+            _totals['counters'][name] = _totals['counters'].get(name, 0) + value
+
+def emit_report(report):
+    """按 BARCODE_TIMING 输出 JSON 报告，并按 BARCODE_TIMING_PROM 刷新 Prometheus 文本文件"""
+    target = os.environ.get('BARCODE_TIMING', '1')
+    text = json.dumps(report, ensure_ascii=False)
+    if target in ('', '0', '1'):
+        print(f"Timing: {text}", file=sys.stderr)
+    else:
+        with open(target, 'a', encoding='utf-8') as f:
+            f.write(text + "\n")
+    prometheus_path = os.environ.get('BARCODE_TIMING_PROM')
+    if prometheus_path:
+        write_prometheus(prometheus_path)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prometheus_text():
+    """累计值的 Prometheus 文本格式"""
+    with _lock:
+        stages = {name: list(entry) for name, entry in _totals['stages'].items()}
+        counters = dict(_totals['counters'])
+        scans = {name: list(entry) for name, entry in _totals['scans'].items()}
+    lines = [
+        "# HELP barcode_stage_seconds_total Time spent in each scan stage.",
+        "# TYPE barcode_stage_seconds_total counter",
+    ]
+    lines += [f'barcode_stage_seconds_total{{stage="{_escape(name)}"}} {seconds:.6f}' for name, (seconds, _) in sorted(stages.items())]
+    lines += ["# HELP barcode_stage_calls_total Number of times each scan stage ran.",
+              "# TYPE barcode_stage_calls_total counter"]
+    lines += [f'barcode_stage_calls_total{{stage="{_escape(name)}"}} {calls}' for name, (_, calls) in sorted(stages.items())]
+    lines += ["# HELP barcode_scan_seconds_total Wall time of finished scans.",
+              "# TYPE barcode_scan_seconds_total counter"]
+    lines += [f'barcode_scan_seconds_total{{scan="{_escape(name)}"}} {seconds:.6f}' for name, (seconds, _) in sorted(scans.items())]
+    lines += ["# HELP barcode_scans_total Number of finished scans.",
+              "# TYPE barcode_scans_total counter"]
+    lines += [f'barcode_scans_total{{scan="{_escape(name)}"}} {calls}' for name, (_, calls) in sorted(scans.items())]
+    lines += ["# HELP barcode_events_total Scan counters such as slices and decode calls.",
+              "# TYPE barcode_events_total counter"]
+    lines += [f'barcode_events_total{{name="{_escape(name)}"}} {value}' for name, value in sorted(counters.items())]
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path):
+    """原子地写出 Prometheus 文本文件，避免收集器读到写了一半的内容"""
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        f.write(prometheus_text())
+    os.replace(temporary_path, path)